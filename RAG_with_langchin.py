@@ -1,32 +1,59 @@
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_pinecone import PineconeVectorStore
 from langchain.chains import RetrievalQA
 from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
-from pinecone import Pinecone
+from vector_store import (
+    get_vector_store, get_langchain_vector_store, INDEX_NAME, NAMESPACE, EMBEDDING_MODEL, EMBEDDING_DIMENSION
+)
+from embedding_cache import CachedEmbeddings
+from query_cache import QueryEmbeddingCache
+from answer_cache import SemanticAnswerCache, documents_key
+from metadata_index import MetadataIndex
+from reranker import get_reranker
+from context_builder import ContextBuilder
+from langchain_core.documents import Document
+from langchain_core.output_parsers import StrOutputParser
+from async_engine import AsyncQueryEngine
+from streaming import TokenStream
 import os
 from dotenv import load_dotenv
 
 class RAGSystem:
-    def __init__(self):
+    def __init__(self, llm=None, use_answer_cache=True, rerank=False):
+        # llm verilirse (ör. testlerde sahte bir chat modeli) ChatOpenAI yerine kullanılır
         load_dotenv()
 
-        self.embeddings = HuggingFaceEmbeddings(model_name = "sentence-transformers/all-mpnet-base-v2")
+        # Sadece sorgu embedding'leri cache'lenir, doküman cache'i burada gerekmez
+        self.query_cache = QueryEmbeddingCache()
+        self.embeddings = CachedEmbeddings(
+            HuggingFaceEmbeddings(model_name = EMBEDDING_MODEL),
+            cache=False,
+            query_cache=self.query_cache
+        )
 
-        self.pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-        self.index_name = "ecommerce-2"
-        self.vector_store = PineconeVectorStore(
+        # VECTOR_BACKEND=local ise Pinecone yerine yerel index okunur
+        self.index_name = INDEX_NAME
+        self.index = get_vector_store(self.index_name, dimension=EMBEDDING_DIMENSION)
+        self.vector_store = get_langchain_vector_store(
             index_name= self.index_name,
             embedding=self.embeddings,
-            namespace="ecommerce-22"
+            namespace=NAMESPACE,
+            store=self.index
         )
 
 
-        self.llm = ChatOpenAI(
+        self.llm = llm or ChatOpenAI(
             model_name="gpt-4",
             temperature=0.2,
             api_key=os.getenv("OPENAI_API_KEY")
         )
+        self.answer_cache = SemanticAnswerCache() if use_answer_cache else None
+        # Ingestion/sync'in yazdığı değişiklik akışı; değişen dokümanların cevapları cache'ten silinir
+        self.change_feed = MetadataIndex() if use_answer_cache else None
+        # rerank=True: retriever'ın 100 adayı cross-encoder ile sıralanıp kırpılır
+        self.reranker = get_reranker() if rerank else None
+        self.context_builder = ContextBuilder()
+        self.engine = None
 
         self.prompt_template = """
         Please analyze the e-commerce data in the backtick and provide a comprehensive answer. If multiple users have purchased the specified item, list ALL of them.
@@ -46,6 +73,8 @@ class RAGSystem:
         answer: """
 
         self.prompt = PromptTemplate(template=self.prompt_template, input_variables=["context", "question"])
+        # Token streaming için aynı prompt doğrudan LLM'e bağlanır (stuff chain tam cevabı bekler)
+        self.stream_chain = self.prompt | self.llm | StrOutputParser()
 
         self.qa_chain = self._create_qa_chain()
 
@@ -66,8 +95,7 @@ class RAGSystem:
     def debug_index(self):
         """Index durumunu kontrol eder"""
         try:
-            index = self.pc.Index(self.index_name)
-            stats = index.describe_index_stats()
+            stats = self.index.describe_index_stats()
             print("\nIndex İstatistikleri:")
             print(f"Sum of vector: {stats.total_vector_count}")
             print(f"Namespaces: {stats.namespaces}")
@@ -78,9 +106,123 @@ class RAGSystem:
             print(f"Index istatistikleri alınırken hata: {str(e)}")
             return None
         
-    def query(self, question):
+    def cache_stats(self):
+        stats = self.query_cache.stats()
+        print(f"Query cache: {stats}")
+        return stats
+
+    @staticmethod
+    def _document_id(doc):
+        return f"{doc.metadata.get('user_id')}_{doc.metadata.get('order_date')}"
+
+    def _lookup_answer(self, question, source_documents):
+        # Retrieval ayrı yapıldığı için aynı doküman kümesine yakın bir soru
+        # daha önce cevaplandıysa LLM çağrısı atlanır
+        self.answer_cache.follow(self.change_feed)
+        query_vector = self.embeddings.embed_query(question)
+        doc_key = documents_key(
+            (self._document_id(doc), {"content": doc.page_content, **doc.metadata})
+            for doc in source_documents
+        )
+        return self.answer_cache.lookup(query_vector, doc_key), query_vector, doc_key
+
+    def _context(self, source_documents):
+        # 100 doküman olduğu gibi "stuff" edilmez; token bütçeli tek bir context metni kurulur
+        context, _ = self.context_builder.build(doc.metadata for doc in source_documents)
+        return context
+
+    def _chain_input(self, question, source_documents):
+        return {"input_documents": [Document(page_content=self._context(source_documents))], "question": question}
+
+    def _answer(self, question, source_documents):
+        if self.answer_cache is not None:
+            cached_answer, query_vector, doc_key = self._lookup_answer(question, source_documents)
+            if cached_answer is not None:
+                return cached_answer
+
+        answer = self.qa_chain.combine_documents_chain.invoke(
+            self._chain_input(question, source_documents)
+        )["output_text"]
+
+        if self.answer_cache is not None:
+            self.answer_cache.store(
+                query_vector, doc_key, answer,
+                ids=[self._document_id(doc) for doc in source_documents]
+            )
+        return answer
+
+    def _stream_answer(self, question, source_documents):
+        # Token'lar LLM'den geldikçe verilir; cevap akış bitince cache'e yazılır
+        if self.answer_cache is not None:
+            cached_answer, query_vector, doc_key = self._lookup_answer(question, source_documents)
+            if cached_answer is not None:
+                return TokenStream.of(cached_answer)
+
+        on_complete = None
+        if self.answer_cache is not None:
+            on_complete = lambda answer: self.answer_cache.store(
+                query_vector, doc_key, answer,
+                ids=[self._document_id(doc) for doc in source_documents]
+            )
+        stream = TokenStream(None, on_complete=on_complete)
+        stream.tokens = self.stream_chain.stream(
+            {"context": self._context(source_documents), "question": question}
+        )
+        return stream
+
+    async def _aanswer(self, question, source_documents):
+        if self.answer_cache is not None:
+            cached_answer, query_vector, doc_key = self._lookup_answer(question, source_documents)
+            if cached_answer is not None:
+                return cached_answer
+
+        result = await self.qa_chain.combine_documents_chain.ainvoke(
+            self._chain_input(question, source_documents)
+        )
+        answer = result["output_text"]
+
+        if self.answer_cache is not None:
+            self.answer_cache.store(
+                query_vector, doc_key, answer,
+                ids=[self._document_id(doc) for doc in source_documents]
+            )
+        return answer
+
+    def _retrieve_by_vector(self, question, query_vector):
+        source_documents = self.vector_store.similarity_search_by_vector(query_vector, k=100)
+        if self.reranker is not None:
+            source_documents = self.reranker.rerank(question, source_documents, text=lambda doc: doc.page_content)
+        return source_documents
+
+    async def aquery(self, question):
+        # Eşzamanlı sorular için: embedding micro-batch, arama thread pool'da, LLM async
+        if self.engine is None:
+            self.engine = AsyncQueryEngine(self.embeddings.embed_queries, self._retrieve_by_vector, self._aanswer)
+        try:
+            result = await self.engine.query(question)
+            return {
+                "answer": result["answer"],
+                "source_documents": result["documents"],
+                "timings_ms": result["timings_ms"]
+            }
+        except Exception as e:
+            print(f"Sorgu sırasında hata: {str(e)}")
+            return {
+                "answer": "Sorgu işlenirken bir hata oluştu.",
+                "error": str(e)
+            }
+
+    def query(self, question, stream=False):
+        # stream=True ise "answer" bir TokenStream'dir: token'lar iterasyonla alınır, ttft_ms ölçülür
         try:
-            result = self.qa_chain.invoke({"query": question})
+            source_documents = self.qa_chain.retriever.invoke(question)
+            if self.reranker is not None:
+                source_documents = self.reranker.rerank(question, source_documents, text=lambda doc: doc.page_content)
+            answer = self._stream_answer if stream else self._answer
+            result = {
+                "result": answer(question, source_documents),
+                "source_documents": source_documents
+            }
             
             print("\nKullanılan Kaynaklar:")
             for i, doc in enumerate(result["source_documents"], 1):
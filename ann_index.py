@@ -0,0 +1,476 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from vector_store import VectorStore, AttrDict
+
+
+DEFAULT_NLIST = 1024
+# 16 alt uzayda PQ hatası recall'ı ~0.2-0.35'te tutuyordu (nprobe artsa da); 32 alt uzay +
+# exact yeniden sıralama (refine) kümelenmiş veride recall@10 ~1.0 verir
+DEFAULT_SUBQUANTIZERS = 32
+DEFAULT_NPROBE = 16
+DEFAULT_REFINE = True
+DEFAULT_REFINE_FACTOR = 10
+CODEBOOK_SIZE = 256
+TRAIN_ITERATIONS = 20
+# k-means için liste başına en az bu kadar örnek gerekir; daha azında index exact çalışır
+MIN_POINTS_PER_LIST = 39
+MAX_POINTS_PER_LIST = 256
+ASSIGN_BATCH_SIZE = 65536
+# Silinmiş (tombstone) satırlar bu orana ulaşınca index sıkıştırılır
+COMPACT_RATIO = 0.2
+# flush() değişmiş namespace'leri en fazla bu aralıkla (saniye) diske yazar
+DEFAULT_SAVE_INTERVAL = 60
+
+
+def normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def assign(data, centroids):
+    # En yakın centroid (L2); bellek sabit kalsın diye parça parça hesaplanır
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    labels = np.empty(len(data), dtype=np.int32)
+    for start in range(0, len(data), ASSIGN_BATCH_SIZE):
+        batch = data[start:start + ASSIGN_BATCH_SIZE]
+        labels[start:start + len(batch)] = np.argmin(centroid_norms - 2 * batch @ centroids.T, axis=1)
+    return labels
+
+
+def kmeans(data, k, iterations=TRAIN_ITERATIONS, rng=None):
+    rng = rng or np.random.default_rng(0)
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign(data, centroids)
+        counts = np.bincount(labels, minlength=k)
+        order = np.argsort(labels, kind="stable")
+        nonempty = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts[nonempty])[:-1]))
+        centroids[nonempty] = np.add.reduceat(data[order], starts, axis=0) / counts[nonempty, None]
+        # Boş kalan kümeler rastgele bir noktadan yeniden başlatılır
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+    return centroids
+
+
+class IVFPQIndex:
+    """Sipariş vektörleri için process içi IVF-PQ approximate nearest neighbour index'i.
+
+    Vektörler `nlist` kaba kümeye (inverted list) atanır, kümeye göre residual'ları
+    `m` alt uzayda 256'lık codebook'larla 1 byte/alt uzay olarak kodlanır. Sorguda
+    yalnızca en yakın `nprobe` liste taranır ve skorlar lookup table ile hesaplanır.
+    Eğitim için yeterli vektör birikene kadar index exact arama yapar.
+    """
+
+    def __init__(self, dimension, nlist=None, m=None, nprobe=None, keep_vectors=None,
+                 refine_factor=None, seed=0):
+        self.logger = logging.getLogger("IVFPQIndex")
+        self.dimension = dimension
+        self.nlist = nlist or int(os.getenv("ANN_NLIST", DEFAULT_NLIST))
+        self.m = m or int(os.getenv("ANN_SUBQUANTIZERS", DEFAULT_SUBQUANTIZERS))
+        self.nprobe = nprobe or int(os.getenv("ANN_NPROBE", DEFAULT_NPROBE))
+        if dimension % self.m:
+            raise ValueError(f"dimension {dimension} is not divisible by m={self.m}")
+        self.dsub = dimension // self.m
+        # keep_vectors=True (varsayılan, ANN_REFINE): ham vektörler de tutulur, PQ skoruyla seçilen
+        # top_k * refine_factor aday exact skorla yeniden sıralanır
+        if keep_vectors is None:
+            keep_vectors = os.getenv("ANN_REFINE", str(DEFAULT_REFINE)).lower() in ("1", "true", "yes")
+        self.keep_vectors = keep_vectors
+        self.refine_factor = refine_factor or int(os.getenv("ANN_REFINE_FACTOR", DEFAULT_REFINE_FACTOR))
+        self.rng = np.random.default_rng(seed)
+
+        self.centroids = None
+        self.codebooks = None
+        self.count = 0
+        self.vectors = np.empty((0, dimension), dtype=np.float32)
+        self.codes = np.empty((0, self.m), dtype=np.uint8)
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.alive = np.empty(0, dtype=bool)
+        self.ids = []
+        self.metadata = []
+        self.positions = {}
+        self.deleted = 0
+        self.lists = []
+        self.list_arrays = []
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _reserve(self, needed):
+        capacity = len(self.alive)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+
+        def grow(array, shape):
+            grown = np.zeros(shape, dtype=array.dtype)
+            grown[:self.count] = array[:self.count]
+            return grown
+
+        self.alive = grow(self.alive, capacity)
+        self.assignments = grow(self.assignments, capacity)
+        self.codes = grow(self.codes, (capacity, self.m))
+        if self.keep_vectors or not self.is_trained:
+            self.vectors = grow(self.vectors, (capacity, self.dimension))
+
+    def train(self, vectors):
+        vectors = normalize(vectors)
+        nlist = min(self.nlist, max(1, len(vectors) // MIN_POINTS_PER_LIST))
+        sample_size = min(len(vectors), nlist * MAX_POINTS_PER_LIST)
+        sample = vectors[self.rng.choice(len(vectors), sample_size, replace=False)]
+
+        self.logger.info(f"Training IVF-PQ (nlist={nlist}, m={self.m}) on {sample_size} vectors")
+        self.centroids = kmeans(sample, nlist, rng=self.rng)
+        self.nlist = nlist
+
+        residuals = sample - self.centroids[assign(sample, self.centroids)]
+        codebook_size = min(CODEBOOK_SIZE, sample_size)
+        self.codebooks = np.zeros((self.m, CODEBOOK_SIZE, self.dsub), dtype=np.float32)
+        for j in range(self.m):
+            subspace = np.ascontiguousarray(residuals[:, j * self.dsub:(j + 1) * self.dsub])
+            self.codebooks[j, :codebook_size] = kmeans(subspace, codebook_size, rng=self.rng)
+
+        # Eğitimden önce eklenmiş vektörler kodlanıp listelere yerleştirilir
+        self.lists = [[] for _ in range(self.nlist)]
+        self.list_arrays = [None] * self.nlist
+        if self.count:
+            positions = np.arange(self.count)
+            self._encode(positions, self.vectors[:self.count])
+            self._add_to_lists(positions[self.alive[:self.count]])
+        if not self.keep_vectors:
+            self.vectors = np.empty((0, self.dimension), dtype=np.float32)
+
+    def _encode(self, positions, vectors):
+        labels = assign(vectors, self.centroids)
+        residuals = vectors - self.centroids[labels]
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = assign(
+                np.ascontiguousarray(residuals[:, j * self.dsub:(j + 1) * self.dsub]), self.codebooks[j]
+            )
+        self.assignments[positions] = labels
+        self.codes[positions] = codes
+
+    def _add_to_lists(self, positions):
+        for position in positions:
+            list_no = self.assignments[position]
+            self.lists[list_no].append(int(position))
+            self.list_arrays[list_no] = None
+
+    def _list_array(self, list_no):
+        if self.list_arrays[list_no] is None:
+            self.list_arrays[list_no] = np.asarray(self.lists[list_no], dtype=np.int64)
+        return self.list_arrays[list_no]
+
+    def build(self, ids, vectors, metadata=None):
+        # Sıfırdan eğitip ekler (create_embeddings çıktısı doğrudan verilebilir)
+        vectors = normalize(vectors)
+        self.train(vectors)
+        self.add(ids, vectors, metadata)
+        return self
+
+    def add(self, ids, vectors, metadata=None):
+        vectors = normalize(vectors)
+        metadata = metadata if metadata is not None else [None] * len(ids)
+        # Aynı batch içinde tekrar eden id'lerde son gelen geçerlidir
+        last = list({doc_id: i for i, doc_id in enumerate(ids)}.values())
+        if len(last) != len(ids):
+            ids = [ids[i] for i in last]
+            vectors = vectors[last]
+            metadata = [metadata[i] for i in last]
+        # Var olan id'ler güncellenir: eski satır silinip yenisi eklenir
+        self.delete([doc_id for doc_id in ids if doc_id in self.positions], compact=False)
+
+        start = self.count
+        positions = np.arange(start, start + len(ids))
+        self._reserve(start + len(ids))
+        self.count += len(ids)
+        self.alive[positions] = True
+        for position, doc_id, meta in zip(positions, ids, metadata):
+            self.positions[doc_id] = int(position)
+            self.ids.append(doc_id)
+            self.metadata.append(meta)
+
+        if self.keep_vectors or not self.is_trained:
+            self.vectors[positions] = vectors
+        if self.is_trained:
+            self._encode(positions, vectors)
+            self._add_to_lists(positions)
+        elif len(self) >= self.nlist * MIN_POINTS_PER_LIST:
+            self.train(self.vectors[:self.count][self.alive[:self.count]])
+        return len(ids)
+
+    def delete(self, ids, compact=True):
+        for doc_id in ids:
+            position = self.positions.pop(doc_id, None)
+            if position is None:
+                continue
+            self.alive[position] = False
+            self.metadata[position] = None
+            self.deleted += 1
+        if compact and self.deleted > COMPACT_RATIO * max(self.count, 1):
+            self.compact()
+
+    def compact(self):
+        # Tombstone'ları atıp dizileri ve inverted list'leri yeniden kurar
+        keep = np.flatnonzero(self.alive[:self.count])
+        self.ids = [self.ids[i] for i in keep]
+        self.metadata = [self.metadata[i] for i in keep]
+        self.positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self.codes = self.codes[keep]
+        self.assignments = self.assignments[keep]
+        if self.keep_vectors or not self.is_trained:
+            self.vectors = self.vectors[keep]
+        self.alive = np.ones(len(keep), dtype=bool)
+        self.count = len(keep)
+        self.deleted = 0
+        if self.is_trained:
+            self.lists = [[] for _ in range(self.nlist)]
+            self.list_arrays = [None] * self.nlist
+            self._add_to_lists(np.arange(self.count))
+
+    def _exact(self, query, positions):
+        return positions, self.vectors[positions] @ query
+
+    def search(self, vector, top_k, nprobe=None, candidates=None):
+        # (position, score) listesi döner; candidates verilirse yalnızca o pozisyonlar aranır
+        if not len(self):
+            return []
+        query = normalize(vector)
+
+        if not self.is_trained:
+            positions = np.flatnonzero(self.alive[:self.count])
+            if candidates is not None:
+                positions = np.intersect1d(positions, candidates)
+            positions, scores = self._exact(query, positions)
+        else:
+            coarse = self.centroids @ query
+            # Residual kodlamada skor = q·c + Σ_j q_j·codebook_j[code_j]; tablo sorgu başına bir kez hesaplanır
+            table = np.einsum("md,mkd->mk", query.reshape(self.m, self.dsub), self.codebooks)
+            subspaces = np.arange(self.m)
+            if candidates is not None:
+                # Aday kümesi verildiyse liste taranmaz, adayların hepsi skorlanır
+                positions = np.asarray(candidates, dtype=np.int64)
+                positions = positions[self.alive[positions]]
+                scores = coarse[self.assignments[positions]] + table[subspaces, self.codes[positions]].sum(axis=1)
+            else:
+                nprobe = min(nprobe or self.nprobe, self.nlist)
+                probe = np.argpartition(-coarse, nprobe - 1)[:nprobe]
+                positions, scores = [], []
+                for list_no in probe:
+                    members = self._list_array(list_no)
+                    members = members[self.alive[members]]
+                    if not len(members):
+                        continue
+                    positions.append(members)
+                    scores.append(coarse[list_no] + table[subspaces, self.codes[members]].sum(axis=1))
+                if not positions:
+                    return []
+                positions = np.concatenate(positions)
+                scores = np.concatenate(scores)
+            if not len(positions):
+                return []
+            if self.keep_vectors:
+                shortlist = min(len(scores), top_k * self.refine_factor)
+                shortlist = np.argpartition(-scores, shortlist - 1)[:shortlist]
+                positions, scores = self._exact(query, positions[shortlist])
+
+        if not len(scores):
+            return []
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(positions[i]), float(scores[i])) for i in top]
+
+    def query(self, vector, top_k, include_metadata=True, nprobe=None, ids=None):
+        candidates = None
+        if ids is not None:
+            candidates = [self.positions[doc_id] for doc_id in ids if doc_id in self.positions]
+        return [
+            {
+                "id": self.ids[position],
+                "score": score,
+                "metadata": self.metadata[position] if include_metadata else None,
+            }
+            for position, score in self.search(vector, top_k, nprobe, candidates)
+        ]
+
+    def save(self, path):
+        if self.deleted:
+            self.compact()
+        os.makedirs(path, exist_ok=True)
+        arrays = {
+            "codes": self.codes[:self.count],
+            "assignments": self.assignments[:self.count],
+        }
+        if self.is_trained:
+            arrays["centroids"] = self.centroids
+            arrays["codebooks"] = self.codebooks
+        if self.keep_vectors or not self.is_trained:
+            arrays["vectors"] = self.vectors[:self.count]
+        tmp_path = os.path.join(path, "index.tmp.npz")
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, os.path.join(path, "index.npz"))
+
+        config = {
+            "dimension": self.dimension, "nlist": self.nlist, "m": self.m, "nprobe": self.nprobe,
+            "keep_vectors": self.keep_vectors, "refine_factor": self.refine_factor,
+        }
+        tmp_path = os.path.join(path, "meta.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "ids": self.ids, "metadata": self.metadata}, f, default=str)
+        os.replace(tmp_path, os.path.join(path, "meta.json"))
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        index = cls(**meta["config"])
+        with np.load(os.path.join(path, "index.npz")) as arrays:
+            index.count = len(meta["ids"])
+            index.ids = meta["ids"]
+            index.metadata = meta["metadata"]
+            index.positions = {doc_id: i for i, doc_id in enumerate(index.ids)}
+            index.alive = np.ones(index.count, dtype=bool)
+            index.codes = arrays["codes"]
+            index.assignments = arrays["assignments"]
+            if "vectors" in arrays:
+                index.vectors = arrays["vectors"]
+            if "centroids" in arrays:
+                index.centroids = arrays["centroids"]
+                index.codebooks = arrays["codebooks"]
+                index.lists = [[] for _ in range(index.nlist)]
+                index.list_arrays = [None] * index.nlist
+                index._add_to_lists(np.arange(index.count))
+        return index
+
+
+class ANNVectorStore(VectorStore):
+    """IVFPQIndex'i VectorStore arayüzüyle sunar (VECTOR_BACKEND=ann).
+
+    Her namespace ayrı bir index'tir; böylece ingestion ve `without_langchain.search`
+    Pinecone yerine bunu kullanabilir. `flush` dönünce değişiklikler diskte olur
+    (ardından change_log/fingerprint commit edilebilir) ama yalnızca değişmiş
+    namespace'leri yazar. Kaydetmek index'in tamamını yeniden yazdığı için
+    dayanıklılık gerekmeyen yerler `maybe_flush` ile en fazla `save_interval`
+    saniyede bir kaydeder; process çıkışı bekleyenleri yazar. Sorgular, başka bir
+    process'in kaydettiği (meta.json'u değişmiş) namespace'leri yeniden yükler.
+    """
+
+    def __init__(self, index_name, dimension, root=None, save_interval=None):
+        self.logger = logging.getLogger("ANNVectorStore")
+        self.root = os.path.join(root or os.getenv("LOCAL_INDEX_DIR", "local_index"), f"{index_name}-ann")
+        self.dimension = dimension
+        self.save_interval = save_interval if save_interval is not None else float(
+            os.getenv("ANN_SAVE_INTERVAL", DEFAULT_SAVE_INTERVAL)
+        )
+        self.indexes = {}
+        # namespace -> yüklendiği/kaydedildiği andaki meta.json durumu
+        self.disk_states = {}
+        self.dirty = set()
+        self.last_save = time.monotonic()
+        self.lock = threading.RLock()
+        atexit.register(self.flush)
+        if os.path.isdir(self.root):
+            for name in os.listdir(self.root):
+                path = os.path.join(self.root, name)
+                if os.path.exists(os.path.join(path, "meta.json")):
+                    self.indexes[name] = IVFPQIndex.load(path)
+                    self.disk_states[name] = self._disk_state(name)
+
+    def _disk_state(self, name):
+        try:
+            stat = os.stat(os.path.join(self.root, name, "meta.json"))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _current(self, namespace):
+        # Okuma tarafı: kaydedilmemiş değişikliği olmayan namespace diskte değiştiyse yeniden
+        # yüklenir; diskte de bellekte de olmayan namespace için None (dosya/index oluşturulmaz)
+        name = namespace or "__default__"
+        if name not in self.dirty:
+            state = self._disk_state(name)
+            if state is not None and state != self.disk_states.get(name):
+                try:
+                    self.indexes[name] = IVFPQIndex.load(os.path.join(self.root, name))
+                    self.disk_states[name] = state
+                except (OSError, ValueError, KeyError) as e:
+                    # Writer tam kaydederken okunduysa eski index'le devam edilir, sonra tekrar denenir
+                    self.logger.warning(f"Could not reload ANN namespace {name}: {e}")
+        return self.indexes.get(name)
+
+    def _index(self, namespace):
+        name = namespace or "__default__"
+        if name not in self.indexes:
+            self.indexes[name] = IVFPQIndex(self.dimension)
+        return self.indexes[name]
+
+    def upsert(self, vectors, namespace=""):
+        ids, values, metadata = [], [], []
+        for item in vectors:
+            if isinstance(item, dict):
+                item = (item["id"], item["values"], item.get("metadata", {}))
+            ids.append(item[0])
+            values.append(item[1])
+            metadata.append(item[2])
+        with self.lock:
+            count = self._index(namespace).add(ids, values, metadata)
+            self.dirty.add(namespace or "__default__")
+        return {"upserted_count": count}
+
+    def delete(self, ids, namespace=""):
+        with self.lock:
+            self._index(namespace).delete(ids)
+            self.dirty.add(namespace or "__default__")
+        return {}
+
+    def query(self, vector, top_k, include_metadata=True, namespace="", filter=None, ids=None):
+        if filter:
+            self.logger.warning("Metadata filters are not supported by the ANN backend, use ids instead")
+        with self.lock:
+            index = self._current(namespace)
+            matches = index.query(vector, top_k, include_metadata, ids=ids) if index is not None else []
+        return AttrDict(matches=matches, namespace=namespace)
+
+    def describe_index_stats(self):
+        with self.lock:
+            namespaces = {
+                name: {"vector_count": len(index), "trained": index.is_trained}
+                for name, index in self.indexes.items()
+            }
+        return AttrDict(
+            dimension=self.dimension,
+            namespaces=namespaces,
+            total_vector_count=sum(ns["vector_count"] for ns in namespaces.values()),
+        )
+
+    def maybe_flush(self):
+        with self.lock:
+            if time.monotonic() - self.last_save >= self.save_interval:
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            for name in sorted(self.dirty):
+                self.indexes[name].save(os.path.join(self.root, name))
+                self.disk_states[name] = self._disk_state(name)
+            self.logger.info(f"Saved {len(self.dirty)} ANN namespaces to {self.root}")
+            self.dirty.clear()
+            self.last_save = time.monotonic()
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+
+DEFAULT_THRESHOLD = 0.95
+DEFAULT_MAX_SIZE = 512
+DEFAULT_TTL = 3600
+
+
+def documents_key(documents):
+    # Getirilen doküman kümesinin (id + içerik) parmak izi; vektörler/metadata
+    # değişirse anahtar da değişir ve eski cevap kullanılmaz
+    items = sorted(
+        f"{doc_id}\0{json.dumps(metadata, sort_keys=True, default=str)}"
+        for doc_id, metadata in documents
+    )
+    return hashlib.sha256("\n".join(items).encode("utf-8")).hexdigest()
+
+
+class SemanticAnswerCache:
+    """LLM cevaplarını sorgu embedding benzerliği + getirilen doküman kümesine göre cache'ler.
+
+    Yeni soru, aynı doküman kümesiyle cevaplanmış bir sorunun embedding'ine
+    cosine benzerliği `threshold` veya üstündeyse eski cevap döner. Ingestion ve
+    sync başka process'lerde çalıştığı için değişen dokümanlar `follow` ile
+    MetadataIndex'in değişiklik akışından okunur ve ilgili cevaplar silinir.
+    """
+
+    def __init__(self, threshold=None, max_size=None, ttl=None):
+        self.logger = logging.getLogger("SemanticAnswerCache")
+        self.threshold = threshold if threshold is not None else float(
+            os.getenv("ANSWER_CACHE_THRESHOLD", DEFAULT_THRESHOLD)
+        )
+        self.max_size = max_size if max_size is not None else int(os.getenv("ANSWER_CACHE_SIZE", DEFAULT_MAX_SIZE))
+        self.ttl = ttl if ttl is not None else float(os.getenv("ANSWER_CACHE_TTL", DEFAULT_TTL))
+        self.lock = threading.Lock()
+        # doc_key -> [{"vector", "answer", "ids", "expires_at"}]
+        self.entries = {}
+        self.size = 0
+        self.change_seq = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, query_vector, doc_key):
+        vector = self._normalize(query_vector)
+        now = time.monotonic()
+        with self.lock:
+            entries = self.entries.get(doc_key, [])
+            candidates = [e for e in entries if e["expires_at"] > now]
+            if len(candidates) != len(entries):
+                # Süresi dolanlar atılır; size da aynı sayıda azalır, aksi halde eviction canlı girdileri siler
+                self.size -= len(entries) - len(candidates)
+                if candidates:
+                    self.entries[doc_key] = candidates
+                else:
+                    del self.entries[doc_key]
+            if candidates:
+                scores = np.stack([e["vector"] for e in candidates]) @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.hits += 1
+                    self.logger.info(f"Answer cache hit (similarity {scores[best]:.3f})")
+                    return candidates[best]["answer"]
+            self.misses += 1
+            return None
+
+    def store(self, query_vector, doc_key, answer, ids=()):
+        entry = {
+            "vector": self._normalize(query_vector),
+            "answer": answer,
+            "ids": frozenset(ids),
+            "expires_at": time.monotonic() + self.ttl,
+        }
+        with self.lock:
+            self.entries.setdefault(doc_key, []).append(entry)
+            self.size += 1
+            if self.size > self.max_size:
+                self._evict_oldest()
+
+    def _evict_oldest(self):
+        oldest_key, oldest_index, oldest_expiry = None, None, None
+        for key, entries in self.entries.items():
+            for i, entry in enumerate(entries):
+                if oldest_expiry is None or entry["expires_at"] < oldest_expiry:
+                    oldest_key, oldest_index, oldest_expiry = key, i, entry["expires_at"]
+        if oldest_key is not None:
+            del self.entries[oldest_key][oldest_index]
+            if not self.entries[oldest_key]:
+                del self.entries[oldest_key]
+            self.size -= 1
+
+    def invalidate(self, ids=None):
+        # ids verilmezse tüm cache, verilirse bu dokümanları içeren cevaplar silinir
+        with self.lock:
+            if ids is None:
+                self.entries.clear()
+                self.size = 0
+                return
+            ids = set(ids)
+            for key in list(self.entries):
+                kept = [e for e in self.entries[key] if not (e["ids"] & ids)]
+                self.size -= len(self.entries[key]) - len(kept)
+                if kept:
+                    self.entries[key] = kept
+                else:
+                    del self.entries[key]
+
+    def follow(self, feed):
+        # feed: MetadataIndex; son okunan konumdan bu yana değişen dokümanların cevapları silinir.
+        # Akış o kadar geride kaldıysa (budanmışsa) tüm cache temizlenir
+        seq, ids = feed.changes_since(self.change_seq)
+        if ids is None:
+            self.invalidate()
+        elif ids:
+            self.invalidate(ids)
+            self.logger.info(f"Invalidated answers for {len(ids)} changed documents")
+        self.change_seq = seq
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+
+DEFAULT_MAX_CONCURRENCY = 32
+DEFAULT_EMBED_MAX_BATCH = 32
+DEFAULT_EMBED_MAX_WAIT_MS = 5
+DEFAULT_EMBED_TIMEOUT = 5
+DEFAULT_SEARCH_TIMEOUT = 10
+DEFAULT_LLM_TIMEOUT = 60
+
+
+class StageTimeout(Exception):
+
+    def __init__(self, stage, timeout):
+        super().__init__(f"{stage} stage timed out after {timeout}s")
+        self.stage = stage
+        self.timeout = timeout
+
+
+class EmbeddingBatcher:
+    """Eşzamanlı gelen sorgu embedding isteklerini micro-batch'lere toplar.
+
+    İlk istek geldikten sonra en fazla `max_wait_ms` beklenir ya da batch
+    `max_batch_size`'a ulaşır; batch `encode_many` ile thread pool'da tek
+    seferde encode edilir ve her isteğin future'ı kendi vektörüyle tamamlanır.
+    """
+
+    def __init__(self, encode_many, executor, max_batch_size=None, max_wait_ms=None):
+        self.logger = logging.getLogger("EmbeddingBatcher")
+        self.encode_many = encode_many
+        self.executor = executor
+        self.max_batch_size = max_batch_size or int(os.getenv("EMBED_MAX_BATCH", DEFAULT_EMBED_MAX_BATCH))
+        self.max_wait = (max_wait_ms or float(os.getenv("EMBED_MAX_WAIT_MS", DEFAULT_EMBED_MAX_WAIT_MS))) / 1000
+        self.loop = None
+        self.queue = None
+        self.worker = None
+        self.batches = 0
+        self.requests = 0
+
+    def _ensure_worker(self):
+        # Kuyruk ve worker task çalışan event loop'a bağlıdır; loop değişirse yeniden kurulur
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop or self.worker is None or self.worker.done():
+            self.loop = loop
+            self.queue = asyncio.Queue()
+            self.worker = loop.create_task(self._run())
+
+    async def embed(self, text):
+        self._ensure_worker()
+        future = self.loop.create_future()
+        await self.queue.put((text, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            deadline = self.loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - self.loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Zaman aşımıyla iptal edilmiş istekler encode edilmez
+            batch = [(text, future) for text, future in batch if not future.done()]
+            if not batch:
+                continue
+            try:
+                vectors = await self.loop.run_in_executor(
+                    self.executor, self.encode_many, [text for text, _ in batch]
+                )
+                for (_, future), vector in zip(batch, vectors):
+                    if not future.done():
+                        future.set_result(vector)
+            except Exception as e:
+                self.logger.error(f"Embedding batch failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            self.batches += 1
+            self.requests += len(batch)
+
+    async def close(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+        }
+
+
+class AsyncQueryEngine:
+    """Çok sayıda eşzamanlı soruyu embed -> search -> answer aşamalarıyla cevaplar.
+
+    encode_many: metin listesi -> vektör listesi (senkron, thread pool'da çalışır)
+    search: (soru, vektör, **options) -> dokümanlar; senkron ya da async olabilir.
+        options, query()/stream() çağrısına verilen istek başına arama seçenekleridir (ör. top_k)
+    answer: (soru, dokümanlar) -> cevap; async olmalı (ör. openai acreate). Cevap
+        bir async token iterator'ı da olabilir; query() birleştirir, stream() token
+        token iletir
+
+    Aşamalar bağımsızdır, böylece testlerde yerel stub backend'ler verilebilir.
+    Her aşama kendi timeout'u ile çalışır, aşılırsa StageTimeout fırlatılır.
+    """
+
+    def __init__(self, encode_many, search, answer, max_concurrency=None, executor=None,
+                 embed_timeout=None, search_timeout=None, llm_timeout=None, **batcher_options):
+        self.logger = logging.getLogger("AsyncQueryEngine")
+        self.max_concurrency = max_concurrency or int(os.getenv("ASYNC_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+        self.owns_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=min(self.max_concurrency, 16))
+        self.batcher = EmbeddingBatcher(encode_many, self.executor, **batcher_options)
+        self.search = search
+        self.answer = answer
+        self.timeouts = {
+            "embed": embed_timeout or float(os.getenv("ASYNC_EMBED_TIMEOUT", DEFAULT_EMBED_TIMEOUT)),
+            "search": search_timeout or float(os.getenv("ASYNC_SEARCH_TIMEOUT", DEFAULT_SEARCH_TIMEOUT)),
+            "llm": llm_timeout or float(os.getenv("ASYNC_LLM_TIMEOUT", DEFAULT_LLM_TIMEOUT)),
+        }
+        self.semaphore = None
+        self.semaphore_loop = None
+
+    def _slots(self):
+        loop = asyncio.get_running_loop()
+        if self.semaphore_loop is not loop:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.semaphore_loop = loop
+        return self.semaphore
+
+    async def _stage(self, name, awaitable, timings):
+        started = time.perf_counter()
+        try:
+            return await asyncio.wait_for(awaitable, self.timeouts[name])
+        except asyncio.TimeoutError:
+            self.logger.warning(f"{name} stage timed out after {self.timeouts[name]}s")
+            raise StageTimeout(name, self.timeouts[name])
+        finally:
+            timings[name] = (time.perf_counter() - started) * 1000
+
+    async def _search(self, question, vector, options):
+        if asyncio.iscoroutinefunction(self.search):
+            return await self.search(question, vector, **options)
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, partial(self.search, question, vector, **options)
+        )
+
+    async def _retrieve(self, question, timings, options):
+        vector = await self._stage("embed", self.batcher.embed(question), timings)
+        return await self._stage("search", self._search(question, vector, options), timings)
+
+    async def _answer_text(self, question, documents):
+        answer = await self.answer(question, documents)
+        if hasattr(answer, "__aiter__"):
+            return "".join([token async for token in answer])
+        return answer
+
+    async def query(self, question, **options):
+        timings = {}
+        async with self._slots():
+            started = time.perf_counter()
+            documents = await self._retrieve(question, timings, options)
+            answer = await self._stage("llm", self._answer_text(question, documents), timings)
+            timings["total"] = (time.perf_counter() - started) * 1000
+        self.logger.info(f"Answered query in {timings['total']:.0f}ms: {timings}")
+        return {"answer": answer, "documents": documents, "timings_ms": timings}
+
+    async def stream(self, question, **options):
+        # Aşama sonuçlarını hazır oldukça olay olarak verir (HTTP streaming için)
+        timings = {}
+        async with self._slots():
+            started = time.perf_counter()
+            documents = await self._retrieve(question, timings, options)
+            yield {"event": "documents", "documents": documents, "timings_ms": dict(timings)}
+            llm_started = time.perf_counter()
+            # LLM timeout'u akışın tamamına uygulanır: her token kalan süre içinde gelmelidir
+            answer = await self._stage("llm", self.answer(question, documents), timings)
+            if hasattr(answer, "__aiter__"):
+                parts = []
+                tokens = answer.__aiter__()
+                deadline = llm_started + self.timeouts["llm"]
+                while True:
+                    try:
+                        token = await asyncio.wait_for(tokens.__anext__(), max(deadline - time.perf_counter(), 0))
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        timings["llm"] = (time.perf_counter() - llm_started) * 1000
+                        self.logger.warning(f"llm stage timed out after {self.timeouts['llm']}s while streaming")
+                        raise StageTimeout("llm", self.timeouts["llm"])
+                    if not parts:
+                        timings["ttft"] = (time.perf_counter() - llm_started) * 1000
+                    parts.append(token)
+                    yield {"event": "token", "token": token}
+                timings["llm"] = (time.perf_counter() - llm_started) * 1000
+                answer = "".join(parts)
+            timings["total"] = (time.perf_counter() - started) * 1000
+            yield {"event": "answer", "answer": answer, "timings_ms": timings}
+
+    async def query_many(self, questions):
+        # Zaman aşımına uğrayan ya da hata veren sorular istisna nesnesi olarak döner
+        return await asyncio.gather(*(self.query(question) for question in questions), return_exceptions=True)
+
+    async def close(self):
+        await self.batcher.close()
+        if self.owns_executor:
+            self.executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def stats(self):
+        return {"embedding": self.batcher.stats(), "timeouts": dict(self.timeouts)}
@@ -1,11 +1,22 @@
 from pinecone import Pinecone, ServerlessSpec
 from dotenv import load_dotenv
-from connect_db import create_connection
-from collections import defaultdict
+from connect_db import get_pool, db_config
+from embedding_cache import CachedEmbeddings
+from order_documents import group_orders, document_id, order_text, order_metadata, metadata_document_id
+from metadata_index import MetadataIndex
+from bm25_index import BM25Index
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_pinecone import PineconeVectorStore
+from vector_store import (
+    get_vector_store, get_langchain_vector_store, uses_pinecone,
+    INDEX_NAME, NAMESPACE, EMBEDDING_MODEL as MODEL_NAME, EMBEDDING_DIMENSION as DIMENSION
+)
 import logging
 from langchain_core.documents import Document
+import argparse
+import multiprocessing
+import psycopg2
+import select
+import sqlite3
 import time
 import threading
 import os
@@ -15,188 +26,688 @@ load_dotenv()
 logger = logging.getLogger()
 
 
-logging.basicConfig(level=logging.INFO, filename="upsert_pinecone.log", filemode="w", 
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-
-
-def fetch_changed_records():
-    connection = create_connection()
-    cursor = connection.cursor()
-    query = """
-        SELECT 
-            c.operation,
-            u.user_id,
-            u.user_name AS user_name,
-            o.order_id,
-            o.product_id,
-            o.order_date,
-            p.product_name AS product_name,
-            p.category AS product_category
-        FROM orders as o 
-        JOIN change_log c ON c.record_id = o.order_id
-        JOIN users u ON o.user_id = u.user_id
-        JOIN products p ON o.product_id = p.product_id
-        WHERE c.processed = FALSE
-        ORDER BY c.change_time ASC;
-    """
-    cursor.execute(query)
-    columns = [desc[0] for desc in cursor.description]
-    data = [dict(zip(columns, row)) for row in cursor.fetchall()]
-    connection.close()
-    return data
+LOG_FILE = "upsert_pinecone.log"
+DEFAULT_SYNC_MODE = "notify"
+DEFAULT_POLL_INTERVAL = 10
+DEFAULT_SYNC_BATCH_SIZE = 1000
+DEFAULT_MIN_BATCH_SIZE = 100
+DEFAULT_MAX_BATCH_SIZE = 5000
+DEFAULT_SYNC_WORKERS = 1
+DEFAULT_SYNC_EXECUTOR = "thread"
+DEFAULT_MONITOR_INTERVAL = 5
+DELETE_BATCH_SIZE = 1000
+# Tek başına (bisect ile ayrılmış) bu kadar kez hata veren değişiklik dead-letter'a alınır
+DEFAULT_SYNC_MAX_ATTEMPTS = 5
+# Kayda değil ortama bağlı hatalar (kilitli SQLite index'i, kopan Postgres bağlantısı):
+# bisect edilmez ve deneme hakkı harcatmaz, batch geri alınıp sonra tekrar denenir
+SYSTEMIC_ERRORS = (sqlite3.OperationalError, psycopg2.OperationalError)
+# Hatalı değişiklik SYNC_RETRY_BACKOFF * 2^(deneme - 1) saniye sonra tekrar claim edilir
+DEFAULT_SYNC_RETRY_BACKOFF = 10
+# pg_advisory_xact_lock(ADVISORY_LOCK_CLASS, user_id): kullanıcı kilitlerini diğer advisory kilitlerden ayırır
+ADVISORY_LOCK_CLASS = 7311
+NOTIFY_CHANNEL = os.getenv("SYNC_NOTIFY_CHANNEL", "change_log_insert")
+
+# change_log her değişiklik için etkilenen dokümanın anahtarını (user_id, order_date)
+# da tutar; silinen siparişin satırı artık olmadığı için anahtar başka yerden bulunamaz.
+# UPDATE anahtarı değiştiriyorsa hem eski hem yeni anahtar kaydedilir.
+CHANGE_LOG_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS change_log (
+        record_id INTEGER NOT NULL,
+        operation VARCHAR(10) NOT NULL,
+        change_time TIMESTAMP NOT NULL DEFAULT NOW(),
+        processed BOOLEAN NOT NULL DEFAULT FALSE
+    );
+    ALTER TABLE change_log
+        ADD COLUMN IF NOT EXISTS seq BIGSERIAL,
+        ADD COLUMN IF NOT EXISTS user_id INTEGER,
+        ADD COLUMN IF NOT EXISTS order_date TIMESTAMP,
+        ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS last_error TEXT,
+        ADD COLUMN IF NOT EXISTS dead BOOLEAN NOT NULL DEFAULT FALSE,
+        ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP;
+    DROP INDEX IF EXISTS change_log_pending;
+    CREATE INDEX IF NOT EXISTS change_log_live ON change_log (seq) WHERE processed = FALSE AND dead = FALSE;
+
+    CREATE OR REPLACE FUNCTION log_order_change() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            INSERT INTO change_log (record_id, operation, user_id, order_date)
+            VALUES (OLD.order_id, TG_OP, OLD.user_id, OLD.order_date);
+        END IF;
+        IF TG_OP = 'INSERT' OR (NEW.user_id, NEW.order_date) IS DISTINCT FROM (OLD.user_id, OLD.order_date) THEN
+            INSERT INTO change_log (record_id, operation, user_id, order_date)
+            VALUES (NEW.order_id, TG_OP, NEW.user_id, NEW.order_date);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS orders_change_log ON orders;
+    CREATE TRIGGER orders_change_log
+        AFTER INSERT OR UPDATE OR DELETE ON orders
+        FOR EACH ROW EXECUTE FUNCTION log_order_change();
+"""
+
+# change_log'a yazan her statement tek bir bildirim üretir (satır başına değil);
+# payload boştur, worker bildirimi yalnızca uyanma sinyali olarak kullanır
+NOTIFY_TRIGGER_SQL = f"""
+    CREATE OR REPLACE FUNCTION notify_change_log() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{NOTIFY_CHANNEL}', '');
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS change_log_notify ON change_log;
+    CREATE TRIGGER change_log_notify
+        AFTER INSERT ON change_log
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_change_log();
+"""
+
+
+# En eski işlenmemiş değişiklikler seq sırasıyla kilitlenerek alınır; başka bir worker'ın
+# kilitlediği satırlar atlanır, böylece paralel worker'lar aynı değişikliği iki kez almaz.
+# Anahtarı boş olan eski change_log satırları hâlâ var olan siparişten tamamlanır
+CLAIM_CHANGES_QUERY = """
+    SELECT
+        c.seq,
+        c.record_id,
+        c.operation,
+        COALESCE(c.user_id, o.user_id) AS user_id,
+        COALESCE(c.order_date, o.order_date) AS order_date
+    FROM change_log c
+    LEFT JOIN orders o ON o.order_id = c.record_id
+    WHERE c.processed = FALSE AND c.dead = FALSE
+      AND (c.next_attempt_at IS NULL OR c.next_attempt_at <= NOW())
+      AND (hashint4(COALESCE(c.user_id, o.user_id, 0))::bigint & 2147483647) %% %s = %s
+    ORDER BY c.seq
+    LIMIT %s
+    FOR UPDATE OF c SKIP LOCKED;
+"""
+
+BACKLOG_QUERY = "SELECT count(*) FROM change_log WHERE processed = FALSE AND dead = FALSE;"
+
+# Tek başına hata veren değişikliğin denemesi sayılır ve bir sonraki denemesi üstel olarak
+# ertelenir; SYNC_MAX_ATTEMPTS'a ulaşınca dead olur ve artık claim edilmez
+# (inceleyip dead = FALSE, attempts = 0 ile yeniden kuyruğa alınabilir)
+RECORD_FAILURE_QUERY = """
+    UPDATE change_log
+    SET attempts = attempts + 1,
+        last_error = %s,
+        dead = attempts + 1 >= %s,
+        next_attempt_at = NOW() + make_interval(secs => %s * power(2, attempts))
+    WHERE seq = %s
+    RETURNING dead;
+"""
+
+# Kilitler sıralı alınır; iki worker aynı kullanıcılar için birbirini beklerken kilitlenmez
+LOCK_USERS_QUERY = """
+    SELECT pg_advisory_xact_lock(%s, user_id)
+    FROM (SELECT DISTINCT unnest(%s::integer[]) AS user_id ORDER BY user_id) AS users;
+"""
+
+# Etkilenen (user_id, order_date) dokümanlarının tüm güncel satırları; ORDERS_QUERY düzeninde
+AFFECTED_ORDERS_QUERY = """
+    SELECT
+        u.user_id,
+        u.user_name AS user_name,
+        o.order_id,
+        o.product_id,
+        o.order_date,
+        p.product_name AS product_name,
+        p.category AS product_category
+    FROM orders o
+    JOIN unnest(%s::integer[], %s::timestamp[]) AS k(user_id, order_date)
+        ON o.user_id = k.user_id AND o.order_date = k.order_date
+    JOIN users u ON o.user_id = u.user_id
+    JOIN products p ON o.product_id = p.product_id
+    ORDER BY o.user_id, o.order_date;
+"""
+
 
+def affected_keys(changes):
+    # Aynı dokümana ait birden çok değişiklik tek bir yeniden kurulumla karşılanır
+    return sorted({
+        (change['user_id'], change['order_date'])
+        for change in changes if change['user_id'] is not None and change['order_date'] is not None
+    })
 
-def prepare(data):
+
+def prepare(rows):
     documents = []
-    grouped_orders = defaultdict(list)
-    
-    for row in data:
-        user_id = row['user_id']
-        user_name = row['user_name']
-        order_date = row['order_date']
-        product_name = row['product_name']
-        product_category = row['product_category']
-        order_id = row['order_id']
-        
-        key = (user_id, order_date)
-        
-        if key not in grouped_orders:
-            grouped_orders[key] = {
-                'user_name': user_name,
-                'order_id': order_id, 
-                'products': []  
-            }
-        
-        grouped_orders[key]['products'].append({
-            'product_name': product_name,
-            'category': product_category
-        })
-    
-    # Gruplanmış veriler üzerinde işlem yapıyoruz
-    for (user_id, order_date), details in grouped_orders.items():
-        user_name = details['user_name']
-        products = details['products']
-        order_id = details['order_id']
-        
-        products_text = " and ".join([
-                    f"{p['product_name']} ({p['category']})"
-                    for p in products if isinstance(p, dict)
-                ])
 
-        text = f"User {user_name} ordered {products_text} on {order_date}"
-        
-        #embedding = model.encode(text)
-        
-        metadata = {
-            "user_id": user_id,
-            "user_name": user_name,
-            "order_date": str(order_date),  # Date'i string formatına çeviriyoruz
-            "products": [p['product_name'] for p in products],
-            "categories": [p['category'] for p in products]
-        }
-        
+    # Satırlar (user_id, order_date) sırasıyla geldiği için gruplar akış halinde üretilir
+    for group in group_orders(rows):
         doc = Document(
-                    page_content = text,
-                    metadata=metadata
+                    page_content = order_text(group),
+                    metadata=order_metadata(group)
                 )
         
         documents.append(doc)
-        logger.info(f"Successfully created {len(documents)} documents")
-        # unique_id = f"{user_id}_{order_date}"
-
-        # embeddings.append((unique_id, embedding.tolist(), metadata))
 
+    logger.info(f"Successfully created {len(documents)} documents")
     return documents
 
-def upsert_to_pinecone(documents):
-    try:
-        pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-        
-        index_name= "ecommerce-2"
-        # batch_size = 100
 
-        embeddings = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/all-mpnet-base-v2"
-            ) 
-        
-        index= pc.Index(index_name)
+def install_triggers():
+    # orders -> change_log trigger'ı (anahtarlı) ve change_log NOTIFY trigger'ı
+    with get_pool().connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(CHANGE_LOG_SCHEMA_SQL)
+            cursor.execute(NOTIFY_TRIGGER_SQL)
+        connection.commit()
+    logger.info(f"Installed change_log triggers (NOTIFY channel '{NOTIFY_CHANNEL}')")
+
+
+def backlog_depth():
+    # İşlenmemiş, dead olmayan change_log satırı sayısı (change_log_live kısmi index'i üzerinden)
+    with get_pool().connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(BACKLOG_QUERY)
+            depth = cursor.fetchone()[0]
+        connection.rollback()
+    return depth
+
+
+def listen_connection():
+    # LISTEN oturuma bağlıdır; havuzdan değil, worker'a ait ayrı bir bağlantı açılır
+    connection = psycopg2.connect(**db_config())
+    connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    with connection.cursor() as cursor:
+        cursor.execute(f"LISTEN {NOTIFY_CHANNEL};")
+    return connection
+
+
+def wait_for_changes(connection, timeout):
+    # Bildirim gelene ya da timeout dolana kadar bekler; bildirim geldiyse True
+    if select.select([connection], [], [], timeout) == ([], [], []):
+        return False
+    connection.poll()
+    notified = bool(connection.notifies)
+    connection.notifies.clear()
+    return notified
+
+
+class SyncService:
+    """change_log'daki değişiklikleri vektör, metadata ve keyword index'lerine uygular.
+
+    Embedding modeli, vector store istemcisi ve DB havuzu servis ömrü boyunca bir
+    kez kurulur ve `warm_up` ile ilk turdan önce ısıtılır; böylece her tur yalnızca
+    fetch + encode + upsert maliyetini öder. Tur ve aşama süreleri `stats` ile okunur.
 
-        vector_store = PineconeVectorStore.from_documents(
-                documents=documents,
-                embedding=embeddings,
-                index_name=index_name,
-                namespace="ecommerce-22"
+    Değişiklikler seq sırasıyla `FOR UPDATE SKIP LOCKED` ile alındığından aynı
+    change_log üzerinde birden çok servis paralel çalışabilir. `partitions` > 1 ise
+    servis yalnızca user_id hash'i `partition`'a düşen değişiklikleri alır.
+    Batch boyutu kuyruğa göre ayarlanır: dolu batch'ten sonra iki katına çıkar,
+    yarısı boş batch'ten sonra yarıya iner (`min_batch_size`..`max_batch_size`).
+    """
+
+    STAGES = ("fetch", "prepare", "upsert", "index", "delete", "mark")
+
+    def __init__(self, batch_size=None, poll_interval=None, partition=0, partitions=1,
+                 min_batch_size=None, max_batch_size=None, source=None, counter=None):
+        # source: aynı process'teki başka bir SyncService; model, index'ler ve havuz paylaşılır.
+        # counter: worker'lar arası paylaşılan işlenen değişiklik sayacı (multiprocessing.Value)
+        self.logger = logging.getLogger(f"SyncService-{partition}" if partitions > 1 else "SyncService")
+        self.partition = partition
+        self.partitions = partitions
+        self.min_batch_size = min_batch_size or int(os.getenv("SYNC_MIN_BATCH_SIZE", DEFAULT_MIN_BATCH_SIZE))
+        self.max_batch_size = max_batch_size or int(os.getenv("SYNC_MAX_BATCH_SIZE", DEFAULT_MAX_BATCH_SIZE))
+        self.batch_size = batch_size or int(os.getenv("SYNC_BATCH_SIZE", DEFAULT_SYNC_BATCH_SIZE))
+        self.batch_size = min(max(self.batch_size, self.min_batch_size), self.max_batch_size)
+        self.poll_interval = poll_interval or float(os.getenv("SYNC_POLL_INTERVAL", DEFAULT_POLL_INTERVAL))
+        self.max_attempts = int(os.getenv("SYNC_MAX_ATTEMPTS", DEFAULT_SYNC_MAX_ATTEMPTS))
+        self.retry_backoff = float(os.getenv("SYNC_RETRY_BACKOFF", DEFAULT_SYNC_RETRY_BACKOFF))
+        self.counter = counter
+
+        started = time.perf_counter()
+        if source is not None:
+            self.embeddings = source.embeddings
+            self.index = source.index
+            self.vector_store = source.vector_store
+            self.metadata_index = source.metadata_index
+            self.keyword_index = source.keyword_index
+        else:
+            self.embeddings = CachedEmbeddings(HuggingFaceEmbeddings(model_name=MODEL_NAME))
+            # VECTOR_BACKEND=local ise Pinecone yerine yerel index'e yazılır
+            self.index = get_vector_store(INDEX_NAME, DIMENSION)
+            self.vector_store = get_langchain_vector_store(
+                index_name=INDEX_NAME,
+                embedding=self.embeddings,
+                namespace=NAMESPACE,
+                store=self.index
             )
-        
-        logger.info(f"Successfully completed Pinecone upload for {len(documents)} documents")
-
-        # for i in range(0, len(embeddings), batch_size):
-        #     batch = embeddings[i:i + batch_size]
-        #     index.upsert(vectors=batch, namespace="e-commerce")
-        #     print(f"Batch {i//batch_size + 1} added successfully")
-            
-        return vector_store
-    except Exception as e:
-        print(f"Error in upsert_to_pinecone: {e}")
-        logger.error(f"Error uploading to Pinecone: {e}")
-        raise
-
-def mark_as_processed(processed_records):
-    connection = create_connection()
-    cursor = connection.cursor()
-    
-    try:
-        order_ids = [record['order_id'] for record in processed_records]
+            self.metadata_index = MetadataIndex()
+            self.keyword_index = BM25Index()
+        self.pool = get_pool()
+        self.startup = {"load_ms": (time.perf_counter() - started) * 1000}
+
+        self.cycles = 0
+        self.records = 0
+        self.documents = 0
+        self.failures = 0
+        self.dead_letters = 0
+        self.totals = {stage: 0.0 for stage in self.STAGES + ("total",)}
+        self.last_cycle = None
+        self.checkpoint = None
+        self.lock = threading.Lock()
+
+    def warm_up(self):
+        # İlk encode (lazy init), ilk DB bağlantısı ve index bağlantısı turdan önce ödenir
+        started = time.perf_counter()
+        self.embeddings.embed_query("warm up")
+        with self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+        self.index.describe_index_stats()
+        self.startup["warmup_ms"] = (time.perf_counter() - started) * 1000
+        self.logger.info(f"Sync service ready: {self.startup}")
+
+    def claim_changes(self, cursor):
+        # Satır kilitleri çağıranın transaction'ı commit/rollback olana kadar tutulur
+        cursor.execute(CLAIM_CHANGES_QUERY, (self.partitions, self.partition, self.batch_size))
+        columns = [desc[0] for desc in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def adapt_batch_size(self, claimed):
+        # Dolu batch: kuyrukta daha fazlası var, encode/upsert daha büyük batch'lerle verimli.
+        # Az dolu batch: kuyruk boşaldı, küçük batch'ler transaction'ı ve gecikmeyi kısa tutar
+        if claimed >= self.batch_size:
+            self.batch_size = min(self.batch_size * 2, self.max_batch_size)
+        elif claimed < self.batch_size // 2:
+            self.batch_size = max(self.batch_size // 2, self.min_batch_size)
+
+    def lock_users(self, cursor, keys):
+        # Aynı kullanıcının dokümanlarını aynı anda tek worker yeniden kurar; aksi halde
+        # eski satırları okuyan worker yeni sürümün üstüne yazabilir
+        cursor.execute(LOCK_USERS_QUERY, (ADVISORY_LOCK_CLASS, sorted({user_id for user_id, _ in keys})))
+
+    def fetch_affected_orders(self, cursor, keys):
+        cursor.execute(AFFECTED_ORDERS_QUERY, (
+            [user_id for user_id, _ in keys], [order_date for _, order_date in keys]
+        ))
+        return cursor.fetchall()
+
+    def upsert(self, documents):
+        try:
+            # Deterministik id'ler: metadata index'i aynı dokümanlara işaret eder
+            ids = [metadata_document_id(doc.metadata) for doc in documents]
+            self.vector_store.add_documents(documents, ids=ids)
+            self.logger.info(f"Successfully completed Pinecone upload for {len(documents)} documents")
+            return ids
+        except Exception as e:
+            print(f"Error in upsert: {e}")
+            self.logger.error(f"Error uploading to Pinecone: {e}")
+            raise
+
+    def update_indexes(self, ids, documents):
+        self.metadata_index.add(ids, [doc.metadata for doc in documents])
+        self.keyword_index.add(ids, [doc.page_content for doc in documents])
+
+    def delete(self, ids):
+        # Hiç satırı kalmayan dokümanlar vektör, metadata ve keyword index'lerinden silinir
+        for i in range(0, len(ids), DELETE_BATCH_SIZE):
+            self.index.delete(ids=ids[i:i + DELETE_BATCH_SIZE], namespace=NAMESPACE)
+        self.metadata_index.remove(ids)
+        self.keyword_index.remove(ids)
+        self.logger.info(f"Deleted {len(ids)} documents with no remaining orders")
+
+    def mark_as_processed(self, cursor, changes):
+        # Yalnızca bu batch'te alınan seq'ler işaretlenir; tur sırasında gelen yeni
+        # değişiklikler (aynı record_id'li olsalar bile) bir sonraki batch'e kalır
         cursor.execute("""
             UPDATE change_log 
             SET processed = TRUE 
-            WHERE record_id = ANY(%s)
-        """, (order_ids,))
-        connection.commit()
-    except Exception as e:
-        print(f"Error marking records as processed: {e}")
-        logger.error(f"Error marking records as processed: {e}")
-    finally:
-        connection.close()
-
-def sync_with_pinecone():
-    while True:
+            WHERE seq = ANY(%s)
+        """, ([change['seq'] for change in changes],))
+
+    def record_failure(self, cursor, change, error):
+        # Denemeyi sayar; değişiklik dead-letter'a alındıysa True döner
+        cursor.execute(RECORD_FAILURE_QUERY, (str(error)[:1000], self.max_attempts, self.retry_backoff, change['seq']))
+        return cursor.fetchone()[0]
+
+    def apply_changes(self, cursor, changes, timings):
+        # INSERT/UPDATE/DELETE ayrımı yerine etkilenen her doküman güncel satırlardan
+        # yeniden kurulur: satırı kalan doküman upsert edilir, kalmayan silinir.
+        # (upsert edilen doküman, silinen doküman, anahtar) sayılarını döner
+        def lap(stage, since):
+            timings[stage] = timings.get(stage, 0.0) + (time.perf_counter() - since) * 1000
+            return time.perf_counter()
+
+        now = time.perf_counter()
+        keys = affected_keys(changes)
+        rows = []
+        if keys:
+            self.lock_users(cursor, keys)
+            rows = self.fetch_affected_orders(cursor, keys)
+        now = lap("fetch", now)
+
+        documents = prepare(rows)
+        now = lap("prepare", now)
+        ids = []
+        if documents:
+            # encode + upsert: model zaten yüklü olduğundan turun asıl maliyeti burasıdır
+            ids = self.upsert(documents)
+        now = lap("upsert", now)
+        if documents:
+            self.update_indexes(ids, documents)
+        now = lap("index", now)
+        remaining = set(ids)
+        vanished = [
+            document_id({'user_id': user_id, 'order_date': order_date})
+            for user_id, order_date in keys
+        ]
+        vanished = [doc_id for doc_id in vanished if doc_id not in remaining]
+        if vanished:
+            self.delete(vanished)
+        # Yerel backend'de batch commit edilmeden önce kalıcı yapılır (Pinecone'da no-op)
+        self.index.flush()
+        now = lap("delete", now)
+
+        self.mark_as_processed(cursor, changes)
+        lap("mark", now)
+        return len(documents), len(vanished), len(keys)
+
+    def apply_isolating(self, cursor, changes, timings, failures, budget):
+        # Değişiklikleri bir savepoint içinde uygular; hata olursa batch ikiye bölünüp
+        # (bisect) hatalı değişiklik tek başına kalana kadar tekrar denenir, böylece tek bir
+        # bozuk kayıt (poison pill) tüm batch'i sonsuza kadar geri aldırmaz. Tek başına
+        # kalan hatalar failures'a (change, hata, dead) eklenir. budget başarısız deneme
+        # hakkıdır; tükenirse ya da hata SYSTEMIC_ERRORS'tansa hata sistemik sayılır ve
+        # yukarı iletilir.
+        # (başarılı değişiklik, doküman, silinen, anahtar) sayılarını döner
+        cursor.execute("SAVEPOINT sync_changes")
         try:
-            changed_records = fetch_changed_records()
-            
-            if changed_records:
-                # Tüm kayıtlar için embeddingler oluştur
-                documents = prepare(changed_records)
-
-                vector_store = upsert_to_pinecone(documents)
-                
-                mark_as_processed(changed_records)
-                logger.info(f"Processed {len(changed_records)} records")  
-                # if upsert_to_pinecone(embeddings):
-                #     # Başarılı işlemi işaretle
-                #     mark_as_processed(changed_records)
-                #     print(f"Processed {len(changed_records)} records")
-            
-                # Pinecone'a gönder
-            # Bir sonraki kontrolden önce bekle
-            time.sleep(10)
-            
+            result = self.apply_changes(cursor, changes, timings)
+            cursor.execute("RELEASE SAVEPOINT sync_changes")
+            return (len(changes),) + result
+        except SYSTEMIC_ERRORS:
+            raise
         except Exception as e:
-            print(f"Error in sync loop: {e}")
-            logger.error(f"Error in sync loop: {e}")
-            time.sleep(10)  
+            cursor.execute("ROLLBACK TO SAVEPOINT sync_changes")
+            cursor.execute("RELEASE SAVEPOINT sync_changes")
+            budget[0] -= 1
+            if budget[0] < 0:
+                raise
+            if len(changes) == 1:
+                failures.append((changes[0], e, self.record_failure(cursor, changes[0], e)))
+                return 0, 0, 0, 0
+            self.logger.warning(f"Batch of {len(changes)} changes failed, bisecting: {e}")
+        middle = len(changes) // 2
+        left = self.apply_isolating(cursor, changes[:middle], timings, failures, budget)
+        right = self.apply_isolating(cursor, changes[middle:], timings, failures, budget)
+        return tuple(a + b for a, b in zip(left, right))
+
+    def sync_batch(self):
+        # Bir batch değişikliği işler; başarıyla işlenen change kaydı sayısını döner.
+        # Claim, kilitler ve işaretleme tek transaction'dır: tur yarıda kalırsa (çökme)
+        # değişiklikler işlenmemiş kalır ve tekrar alınır; deterministik id'ler
+        # sayesinde tekrar yazmak aynı sonucu verir. Hatalı değişiklikler bisect ile
+        # ayrılıp SYNC_MAX_ATTEMPTS denemeden sonra dead-letter'a alınır. Deneme yalnızca
+        # aynı batch'te başka bir değişiklik işlenebildiyse sayılır: batch'in hiçbir parçası
+        # işlenemiyorsa (tek değişiklikli batch dahil) ya da bisect birkaç hatalı kayıtla
+        # açıklanamıyorsa (ör. Pinecone erişilemez) hata sistemiktir; deneme sayılmadan
+        # batch geri alınır ve hata yukarı iletilir (döngü SYNC_POLL_INTERVAL bekler)
+        timings = {}
+        started = time.perf_counter()
+        failures = []
+
+        with self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                changes = self.claim_changes(cursor)
+                self.adapt_batch_size(len(changes))
+                if not changes:
+                    connection.rollback()
+                    return 0
+                timings["fetch"] = (time.perf_counter() - started) * 1000
+                # Tek bir poison pill'i ayırmak ~log2(n) + 1 başarısız deneme sürer; ikisine yetecek hak
+                budget = [2 * (len(changes).bit_length() + 1)]
+                processed, documents, deleted, keys = self.apply_isolating(
+                    cursor, changes, timings, failures, budget
+                )
+                if not processed:
+                    # Hiçbir parça işlenemedi; kaydedilen denemeler de putconn'daki rollback ile geri alınır
+                    raise failures[-1][1]
+            connection.commit()
+        timings["total"] = (time.perf_counter() - started) * 1000
+        checkpoint = max(change['seq'] for change in changes)
+        self._record(processed, documents, timings, checkpoint, failures)
+
+        operations = {}
+        for change in changes:
+            operations[change['operation']] = operations.get(change['operation'], 0) + 1
+        self.logger.info(
+            f"Processed {processed}/{len(changes)} changes up to seq {checkpoint} {operations}: "
+            f"{documents} documents upserted, {deleted} deleted, "
+            f"{processed - keys} duplicate/unresolved in {timings['total']:.0f}ms: "
+            + ", ".join(f"{stage}={ms:.0f}ms" for stage, ms in timings.items() if stage != "total")
+        )
+        return processed
+
+    def _record(self, records, documents, timings, checkpoint, failures=()):
+        for change, error, dead in failures:
+            if dead:
+                self.logger.error(f"Change seq {change['seq']} moved to dead letter after {self.max_attempts} attempts: {error}")
+            else:
+                self.logger.warning(f"Change seq {change['seq']} failed, will retry: {error}")
+        with self.lock:
+            self.failures += len(failures)
+            self.dead_letters += sum(1 for _, _, dead in failures if dead)
+            self.checkpoint = max(self.checkpoint or 0, checkpoint)
+            self.cycles += 1
+            self.records += records
+            self.documents += documents
+            for stage, ms in timings.items():
+                self.totals[stage] += ms
+            self.last_cycle = timings
+        if self.counter is not None:
+            with self.counter.get_lock():
+                self.counter.value += records
+
+    def drain(self):
+        # Birikmiş değişiklikler batch'ler halinde, kuyruk boşalana kadar işlenir. Hatalı
+        # değişiklikler ertelendiği için hemen tekrar claim edilmez; hiçbir şey işlenemeyen
+        # batch ise sync_batch'ten hata olarak çıkar ve döngü beklemeye geçer
+        total = 0
+        while True:
+            processed = self.sync_batch()
+            total += processed
+            if not processed:
+                return total
+
+    def poll_loop(self):
+        while True:
+            try:
+                self.drain()
+                # Bir sonraki kontrolden önce bekle
+                time.sleep(self.poll_interval)
+            except Exception as e:
+                print(f"Error in sync loop: {e}")
+                self.logger.error(f"Error in sync loop: {e}")
+                time.sleep(self.poll_interval)
+
+    def listen_loop(self):
+        # Bildirimle hemen uyanır; bildirim kaçsa bile poll_interval'da bir kontrol edilir.
+        # LISTEN bağlantısı koparsa yeniden kurulana kadar polling ile devam edilir
+        connection = None
+        while True:
+            try:
+                if connection is None or connection.closed:
+                    connection = listen_connection()
+                    self.logger.info(f"Listening on '{NOTIFY_CHANNEL}'")
+                # LISTEN kurulduktan sonra drain edilir; arada gelen değişiklik kaçmaz
+                self.drain()
+                if wait_for_changes(connection, self.poll_interval):
+                    self.logger.info("Woken up by change_log notification")
 
-def start_sync_service():
-    thread = threading.Thread(target=sync_with_pinecone, daemon=True)
+            except psycopg2.OperationalError as e:
+                self.logger.warning(f"LISTEN connection lost, falling back to polling: {e}")
+                if connection is not None:
+                    connection.close()
+                connection = None
+                time.sleep(self.poll_interval)
+            except Exception as e:
+                print(f"Error in sync loop: {e}")
+                self.logger.error(f"Error in sync loop: {e}")
+                time.sleep(self.poll_interval)
+
+    def run(self, mode=None):
+        # mode: "notify" (LISTEN/NOTIFY, polling yedekli) ya da "poll" (sadece polling)
+        mode = mode or os.getenv("SYNC_MODE", DEFAULT_SYNC_MODE)
+        self.warm_up()
+        if mode == "notify":
+            self.listen_loop()
+        else:
+            self.poll_loop()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "partition": f"{self.partition}/{self.partitions}",
+                "batch_size": self.batch_size,
+                "startup_ms": dict(self.startup),
+                "cycles": self.cycles,
+                "records": self.records,
+                "documents": self.documents,
+                "failures": self.failures,
+                "dead_letters": self.dead_letters,
+                "checkpoint_seq": self.checkpoint,
+                "avg_cycle_ms": {
+                    stage: total / self.cycles for stage, total in self.totals.items()
+                } if self.cycles else {},
+                "last_cycle_ms": self.last_cycle,
+            }
+
+
+def start_sync_service(mode=None, poll_interval=None, service=None):
+    service = service or SyncService(poll_interval=poll_interval)
+    thread = threading.Thread(target=service.run, args=(mode,), daemon=True)
     thread.start()
-    return thread
+    return service, thread
+
+
+def configure_logging():
+    # Ana process ve spawn edilen worker'lar aynı dosyaya ekler (filemode="a"); modül
+    # seviyesinde "w" ile kurulursa her worker import'u log dosyasını sıfırlardı
+    logging.basicConfig(level=logging.INFO, filename=LOG_FILE, filemode="a",
+                        format='%(asctime)s - %(process)d - %(name)s - %(levelname)s - %(message)s')
+
+
+def run_sync_worker(partition, partitions, mode, poll_interval, counter):
+    # Process worker'ı: model ve bağlantılar çocuk process'te kurulur
+    configure_logging()
+    SyncService(poll_interval=poll_interval, partition=partition, partitions=partitions, counter=counter).run(mode)
+
+
+class SyncWorkerPool:
+    """change_log'u user_id hash'ine göre bölüşen sync worker havuzu.
+
+    Her worker kendi bölümünü alır; aynı kullanıcının değişiklikleri hep aynı
+    worker'a düşer. Thread modunda worker'lar tek bir model ve index setini
+    paylaşır; process modunda her process kendi modelini yükler (çok çekirdekte
+    encode paralelleşir, yalnızca Pinecone backend'i ile). Havuz kuyruk derinliğini
+    (backlog) ve işlenen değişiklik sayısını/hızını izler.
+    """
+
+    def __init__(self, workers=None, executor=None, mode=None, poll_interval=None, monitor_interval=None):
+        self.logger = logging.getLogger("SyncWorkerPool")
+        self.workers = workers or int(os.getenv("SYNC_WORKERS", DEFAULT_SYNC_WORKERS))
+        self.executor = executor or os.getenv("SYNC_EXECUTOR", DEFAULT_SYNC_EXECUTOR)
+        if self.executor == "process" and not uses_pinecone():
+            # Yerel index dosyaları tek process'ten yazılmak üzere tasarlandı
+            raise ValueError("Process sync workers require VECTOR_BACKEND=pinecone, use thread workers instead")
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.monitor_interval = monitor_interval or float(os.getenv("SYNC_MONITOR_INTERVAL", DEFAULT_MONITOR_INTERVAL))
+        self.context = multiprocessing.get_context("spawn")
+        self.processed = self.context.Value("q", 0)
+        self.services = []
+        self.handles = []
+        self.backlog = None
+        self.rate = 0.0
+        self.started_at = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        if self.executor == "process":
+            for partition in range(self.workers):
+                process = self.context.Process(
+                    target=run_sync_worker,
+                    args=(partition, self.workers, self.mode, self.poll_interval, self.processed),
+                    name=f"sync-worker-{partition}",
+                    daemon=True
+                )
+                process.start()
+                self.handles.append(process)
+        else:
+            for partition in range(self.workers):
+                service = SyncService(
+                    poll_interval=self.poll_interval, partition=partition, partitions=self.workers,
+                    source=self.services[0] if self.services else None, counter=self.processed
+                )
+                self.services.append(service)
+                thread = threading.Thread(
+                    target=service.run, args=(self.mode,), name=f"sync-worker-{partition}", daemon=True
+                )
+                thread.start()
+                self.handles.append(thread)
+        threading.Thread(target=self._monitor, name="sync-monitor", daemon=True).start()
+        self.logger.info(f"Started {self.workers} {self.executor} sync workers")
+        return self
+
+    def _monitor(self):
+        last_count, last_time = self.processed.value, time.monotonic()
+        while True:
+            time.sleep(self.monitor_interval)
+            try:
+                self.backlog = backlog_depth()
+            except Exception as e:
+                self.logger.warning(f"Could not read change_log backlog: {e}")
+            count, now = self.processed.value, time.monotonic()
+            self.rate = (count - last_count) / (now - last_time)
+            last_count, last_time = count, now
+            self.logger.info(f"Sync backlog={self.backlog} processed={count} rate={self.rate:.1f}/s")
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return {
+            "workers": self.workers,
+            "executor": self.executor,
+            "alive": sum(1 for handle in self.handles if handle.is_alive()),
+            "backlog": self.backlog,
+            "processed": self.processed.value,
+            "rate_per_s": round(self.rate, 1),
+            "avg_rate_per_s": round(self.processed.value / elapsed, 1) if elapsed else 0.0,
+            "services": [service.stats() for service in self.services],
+        }
+
+    def stop(self):
+        # Thread'ler daemon'dır, process'ler sonlandırılır; yarım batch'ler rollback olur ve tekrar alınır
+        for handle in self.handles:
+            if isinstance(handle, multiprocessing.process.BaseProcess):
+                handle.terminate()
+                handle.join()
+        self.logger.info(f"Sync pool stopped: {self.stats()}")
+
 
 if __name__ == "__main__":
-    sync_thread = start_sync_service()
+    parser = argparse.ArgumentParser(description="change_log -> vector index sync service")
+    parser.add_argument("--mode", choices=["notify", "poll"], default=os.getenv("SYNC_MODE", DEFAULT_SYNC_MODE))
+    parser.add_argument("--poll-interval", type=float, default=None, help="saniye (notify modunda yedek kontrol aralığı)")
+    parser.add_argument("--install-trigger", action="store_true", help="orders -> change_log ve NOTIFY trigger'larını kur")
+    parser.add_argument("--workers", type=int, default=None, help="paralel sync worker sayısı (user_id hash'ine göre bölünür)")
+    parser.add_argument("--executor", choices=["thread", "process"], default=None)
+    args = parser.parse_args()
+
+    configure_logging()
+    if args.install_trigger:
+        install_triggers()
+    pool = SyncWorkerPool(args.workers, args.executor, args.mode, args.poll_interval).start()
     
     try:
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
-        print("Shutting down sync service...")
\ No newline at end of file
+        print("Shutting down sync service...")
+        pool.stop()
+        print(f"Sync stats: {pool.stats()}")
\ No newline at end of file
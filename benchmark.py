@@ -0,0 +1,224 @@
+import argparse
+import os
+import tempfile
+import time
+from random import Random
+from datetime import datetime, timedelta
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from ann_index import IVFPQIndex, normalize
+from vector_store import LocalVectorStore
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from faker_library import DataGenerator
+from order_documents import group_orders, document_id, order_text, order_metadata
+from embedding_cache import encode_texts
+
+
+SAMPLE_PRODUCTS = [
+    ("Shampoo (Yellow)", "Personal Care"),
+    ("Perfume (Red)", "Personal Care"),
+    ("Smartphone (Black)", "Electronics"),
+    ("Laptop (White)", "Electronics"),
+    ("Wool Coat (Brown)", "Clothing"),
+    ("Mom Jeans (Blue)", "Clothing"),
+    ("Necklace (Pink)", "Jewelry"),
+    ("Orchid (Purple)", "Flower Type"),
+    ("Table Clock (Green)", "Home Goods"),
+]
+
+
+def sample_order_texts(num_docs, seed=42):
+    # DB olmadan, ingestion ile aynı formatta sipariş metinleri üretir
+    rng = Random(seed)
+    start = datetime(2024, 12, 1)
+    texts = []
+    for i in range(num_docs):
+        products = [rng.choice(SAMPLE_PRODUCTS) for _ in range(rng.randint(1, 5))]
+        products_text = " and ".join(f"{name} ({category})" for name, category in products)
+        order_date = start + timedelta(seconds=rng.randint(0, 86400))
+        texts.append(f"User User{i % 1000} ordered {products_text} on {order_date}")
+    return texts
+
+
+def bench_embeddings(model_name, num_docs, batch_sizes):
+    model = SentenceTransformer(model_name)
+    texts = sample_order_texts(num_docs)
+
+    # Warm-up, ilk çağrıdaki lazy init süresini ölçüme katmamak için
+    encode_texts(model, texts[:8], batch_size=8)
+
+    print(f"model={model_name} docs={num_docs}")
+    print(f"{'batch_size':>10} {'seconds':>10} {'docs/sec':>10}")
+    results = []
+    for batch_size in batch_sizes:
+        started = time.perf_counter()
+        encode_texts(model, texts, batch_size=batch_size)
+        elapsed = time.perf_counter() - started
+        results.append((batch_size, elapsed, num_docs / elapsed))
+        print(f"{batch_size:>10} {elapsed:>10.2f} {num_docs / elapsed:>10.1f}")
+    return results
+
+
+def generated_documents(num_users, num_products, num_orders, seed=42):
+    # faker_library.DataGenerator ile DB'siz üretilen siparişlerden ingestion dokümanları
+    generator = DataGenerator(seed=seed, base_date=datetime(2024, 12, 1), connect=False)
+    rows = generator.generate_order_rows(num_users, num_products, num_orders)
+    groups = list(group_orders(rows))
+    return (
+        [document_id(group) for group in groups],
+        [order_text(group) for group in groups],
+        [order_metadata(group) for group in groups],
+    )
+
+
+def bench_ann(model_name, num_users, num_products, num_orders, num_queries, top_k, nprobes,
+              nlist, m, keep_vectors):
+    ids, texts, metadata_list = generated_documents(num_users, num_products, num_orders)
+    model = SentenceTransformer(model_name)
+    embeddings = normalize(encode_texts(model, texts))
+
+    rng = Random(7)
+    questions = []
+    for _ in range(num_queries):
+        product = rng.choice(rng.choice(metadata_list)["products"])
+        questions.append(f"Who bought {product}?")
+    queries = normalize(encode_texts(model, questions))
+
+    # Referans (ground truth): VECTOR_BACKEND=local'in exact araması; hız kazancı bunun
+    # recall kaybıyla birlikte raporlanır
+    local = LocalVectorStore("benchmark", embeddings.shape[1], root=tempfile.mkdtemp())
+    local.upsert(list(zip(ids, embeddings.tolist(), metadata_list)))
+    started = time.perf_counter()
+    truth = [
+        {match["id"] for match in local.query(query, top_k, include_metadata=False).matches}
+        for query in queries
+    ]
+    exact_ms = (time.perf_counter() - started) * 1000 / num_queries
+
+    started = time.perf_counter()
+    index = IVFPQIndex(embeddings.shape[1], nlist=nlist, m=m, keep_vectors=keep_vectors).build(
+        ids, embeddings, metadata_list
+    )
+    build_seconds = time.perf_counter() - started
+
+    print(f"model={model_name} docs={len(ids)} queries={num_queries} top_k={top_k} "
+          f"nlist={index.nlist} m={index.m} refine={index.keep_vectors}x{index.refine_factor} "
+          f"build={build_seconds:.1f}s")
+    print(f"{'nprobe':>8} {'recall':>8} {'ms/query':>10} {'speedup':>8}")
+    print(f"{'local':>8} {1.0:>8.3f} {exact_ms:>10.2f} {1.0:>8.1f}")
+    results = []
+    for nprobe in nprobes:
+        hits = 0
+        started = time.perf_counter()
+        found = [index.search(query, top_k, nprobe=nprobe) for query in queries]
+        latency_ms = (time.perf_counter() - started) * 1000 / num_queries
+        for expected, matches in zip(truth, found):
+            hits += len(expected & {index.ids[position] for position, _ in matches})
+        recall = hits / (top_k * num_queries)
+        results.append((nprobe, recall, latency_ms))
+        print(f"{nprobe:>8} {recall:>8.3f} {latency_ms:>10.2f} {exact_ms / latency_ms:>8.1f}")
+    return results
+
+
+def bench_hybrid(model_name, num_users, num_products, num_orders, num_queries, top_k, candidates):
+    ids, texts, metadata_list = generated_documents(num_users, num_products, num_orders)
+    model = SentenceTransformer(model_name)
+    embeddings = normalize(encode_texts(model, texts))
+
+    keyword_index = BM25Index(os.path.join(tempfile.mkdtemp(), "bm25.sqlite"))
+    started = time.perf_counter()
+    keyword_index.add(ids, texts)
+    index_seconds = time.perf_counter() - started
+
+    # Soru "Who bought <ürün>?", ilgili dokümanlar o ürünü içeren siparişlerdir
+    rng = Random(7)
+    products = [rng.choice(rng.choice(metadata_list)["products"]) for _ in range(num_queries)]
+    relevant = [
+        {doc_id for doc_id, metadata in zip(ids, metadata_list) if product in metadata["products"]}
+        for product in products
+    ]
+    questions = [f"Who bought {product}?" for product in products]
+    queries = normalize(encode_texts(model, questions))
+
+    def dense(query_vector, k):
+        scores = embeddings @ query_vector
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [ids[i] for i in top[np.argsort(-scores[top])]]
+
+    def sparse(question, k):
+        return [doc_id for doc_id, _ in keyword_index.search(question, k)]
+
+    def hybrid(question, query_vector, k):
+        fused = reciprocal_rank_fusion([dense(query_vector, candidates), sparse(question, candidates)])
+        return [doc_id for doc_id, _ in fused[:k]]
+
+    methods = {
+        "dense": lambda question, vector: dense(vector, top_k),
+        "bm25": lambda question, vector: sparse(question, top_k),
+        "hybrid": lambda question, vector: hybrid(question, vector, top_k),
+    }
+    print(f"model={model_name} docs={len(ids)} queries={num_queries} top_k={top_k} "
+          f"candidates={candidates} bm25_index={index_seconds:.1f}s")
+    print(f"{'method':>8} {'hit@k':>8} {'prec@k':>8} {'ms/query':>10}")
+    results = []
+    for name, method in methods.items():
+        hits = precision = 0.0
+        started = time.perf_counter()
+        found = [method(question, vector) for question, vector in zip(questions, queries)]
+        latency_ms = (time.perf_counter() - started) * 1000 / num_queries
+        for expected, ranking in zip(relevant, found):
+            matched = len(expected & set(ranking))
+            hits += matched > 0
+            precision += matched / top_k
+        results.append((name, hits / num_queries, precision / num_queries, latency_ms))
+        print(f"{name:>8} {hits / num_queries:>8.3f} {precision / num_queries:>8.3f} {latency_ms:>10.2f}")
+    keyword_index.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion/retrieval benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    embeddings_parser = subparsers.add_parser("embeddings", help="docs/sec vs encode batch size")
+    embeddings_parser.add_argument("--model", default="all-MiniLM-L12-v2")
+    embeddings_parser.add_argument("--docs", type=int, default=2000)
+    embeddings_parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 64, 128, 256])
+
+    ann_parser = subparsers.add_parser("ann", help="IVF-PQ recall/latency vs exact search")
+    ann_parser.add_argument("--model", default="all-MiniLM-L12-v2")
+    ann_parser.add_argument("--users", type=int, default=5000)
+    ann_parser.add_argument("--products", type=int, default=500)
+    ann_parser.add_argument("--orders", type=int, default=50000)
+    ann_parser.add_argument("--queries", type=int, default=200)
+    ann_parser.add_argument("--top-k", type=int, default=10)
+    ann_parser.add_argument("--nprobes", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    ann_parser.add_argument("--nlist", type=int, default=None)
+    ann_parser.add_argument("--m", type=int, default=None, help="PQ alt uzay sayısı")
+    ann_parser.add_argument("--refine", action=argparse.BooleanOptionalAction, default=None,
+                            help="ham vektörlerle yeniden sırala (varsayılan ANN_REFINE)")
+
+    hybrid_parser = subparsers.add_parser("hybrid", help="dense vs BM25 vs RRF hybrid hit rate/latency")
+    hybrid_parser.add_argument("--model", default="all-mpnet-base-v2")
+    hybrid_parser.add_argument("--users", type=int, default=1000)
+    hybrid_parser.add_argument("--products", type=int, default=500)
+    hybrid_parser.add_argument("--orders", type=int, default=10000)
+    hybrid_parser.add_argument("--queries", type=int, default=200)
+    hybrid_parser.add_argument("--top-k", type=int, default=10)
+    hybrid_parser.add_argument("--candidates", type=int, default=100, help="her sıralamadan füzyona giren aday")
+
+    args = parser.parse_args()
+    if args.command == "embeddings":
+        bench_embeddings(args.model, args.docs, args.batch_sizes)
+    elif args.command == "ann":
+        bench_ann(args.model, args.users, args.products, args.orders, args.queries, args.top_k,
+                  args.nprobes, args.nlist, args.m, args.refine)
+    elif args.command == "hybrid":
+        bench_hybrid(args.model, args.users, args.products, args.orders, args.queries, args.top_k,
+                     args.candidates)
+
+
+if __name__ == "__main__":
+    main()
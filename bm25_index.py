@@ -0,0 +1,116 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+
+DEFAULT_BM25_PATH = "bm25_index.sqlite"
+DEFAULT_RRF_K = 60
+# Yazma kilidi için bekleme süresi (sn); sync süreçleri index dosyasını paylaşır
+DEFAULT_BUSY_TIMEOUT = 30
+TOKEN_PATTERN = re.compile(r"[\w-]+")
+# Soru kalıplarında geçen, eşleşmeye katkısı olmayan kelimeler
+STOPWORDS = {
+    "a", "an", "and", "any", "are", "bought", "buy", "by", "can", "did", "do", "for", "give",
+    "has", "have", "me", "name", "of", "on", "or", "ordered", "purchased", "the", "tha", "to",
+    "user", "users", "what", "which", "who", "with", "you",
+}
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def reciprocal_rank_fusion(rankings, k=DEFAULT_RRF_K):
+    # rankings: her biri en iyiden kötüye id listesi; skor = Σ 1 / (k + rank)
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """Doküman metinleri üzerinde SQLite FTS5 tabanlı BM25 anahtar kelime index'i.
+
+    Ingestion sırasında doküman id'si + metinle güncellenir; `search` soru
+    kelimelerinden biriyle eşleşen dokümanları BM25 skoruna göre döndürür.
+    """
+
+    def __init__(self, path=None):
+        self.logger = logging.getLogger("BM25Index")
+        self.path = path or os.getenv("BM25_INDEX_PATH", DEFAULT_BM25_PATH)
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(
+            self.path,
+            timeout=float(os.getenv("SQLITE_BUSY_TIMEOUT", DEFAULT_BUSY_TIMEOUT)),
+            check_same_thread=False,
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # FTS5 rowid'leri ile doküman id'leri ayrı tabloda eşlenir, böylece güncelleme/silme rowid ile yapılır
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS bm25_ids (
+                rowid INTEGER PRIMARY KEY,
+                doc_id TEXT UNIQUE NOT NULL
+            )
+        """)
+        # tokenchars '-': "2024-12-01" gibi tarihler tek terim olarak kalır
+        self.connection.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS bm25_docs USING fts5(text, tokenize="unicode61 tokenchars '-'")
+        """)
+        self.connection.commit()
+
+    def _rowids(self, ids):
+        rowids = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rowids.update((doc_id, rowid) for rowid, doc_id in self.connection.execute(
+                f"SELECT rowid, doc_id FROM bm25_ids WHERE doc_id IN ({placeholders})", chunk
+            ))
+        return rowids
+
+    def add(self, ids, texts):
+        ids = list(ids)
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO bm25_ids (doc_id) VALUES (?)", [(doc_id,) for doc_id in ids]
+            )
+            rowids = self._rowids(ids)
+            self.connection.executemany(
+                "DELETE FROM bm25_docs WHERE rowid = ?", [(rowids[doc_id],) for doc_id in ids]
+            )
+            self.connection.executemany(
+                "INSERT INTO bm25_docs (rowid, text) VALUES (?, ?)",
+                [(rowids[doc_id], text) for doc_id, text in zip(ids, texts)]
+            )
+            self.connection.commit()
+
+    def remove(self, ids):
+        with self.lock:
+            rowids = list(self._rowids(list(ids)).values())
+            self.connection.executemany("DELETE FROM bm25_docs WHERE rowid = ?", [(r,) for r in rowids])
+            self.connection.executemany("DELETE FROM bm25_ids WHERE rowid = ?", [(r,) for r in rowids])
+            self.connection.commit()
+
+    def search(self, query, top_k=100):
+        # (doc_id, skor) listesi, skor büyük olan daha iyi
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        match = " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        with self.lock:
+            rows = self.connection.execute("""
+                SELECT i.doc_id, bm25(bm25_docs) AS score
+                FROM bm25_docs JOIN bm25_ids i ON i.rowid = bm25_docs.rowid
+                WHERE bm25_docs MATCH ?
+                ORDER BY score
+                LIMIT ?
+            """, (match, top_k)).fetchall()
+        # FTS5 bm25() negatif döner (küçük = iyi)
+        return [(doc_id, -score) for doc_id, score in rows]
+
+    def close(self):
+        self.connection.close()
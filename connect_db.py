@@ -1,22 +1,140 @@
 import psycopg2
+from psycopg2 import pool, extensions
+from contextlib import contextmanager
+import logging
+import os
 import sys
+import threading
+import time
+
+
+def db_config():
+    # Bağlantı bilgileri ortam değişkenlerinden okunur, yoksa eski varsayılanlar kullanılır
+    return {
+        "host": os.getenv("PGHOST", "localhost"),
+        "database": os.getenv("PGDATABASE", "e-commerce"),
+        "user": os.getenv("PGUSER", "postgres"),
+        "password": os.getenv("PGPASSWORD", "1234567891"),
+        "port": int(os.getenv("PGPORT", 5432)),
+    }
+
 
 def create_connection():
     try:
-        connection =  psycopg2.connect(
-            host="localhost",
-            database="e-commerce",
-            user="postgres",
-            password="1234567891",
-            port= 5432
-        )
+        connection =  psycopg2.connect(**db_config())
         print("connection succes")
         return connection
 
     except Exception as e:
         print(f"Connection error: {e}")
-        
-   
+
+
+class ConnectionPool:
+    """Thread-safe PostgreSQL bağlantı havuzu.
+
+    Havuz doluysa `getconn` bir bağlantı geri verilene kadar bekler. Belirli bir
+    süre boşta kalan bağlantılar verilmeden önce `SELECT 1` ile kontrol edilir,
+    kopmuş olanlar kapatılıp yenisi açılır.
+    """
+
+    def __init__(self, min_size=None, max_size=None, health_check_interval=None, timeout=None):
+        self.logger = logging.getLogger("ConnectionPool")
+        self.min_size = min_size or int(os.getenv("DB_POOL_MIN_SIZE", 1))
+        self.max_size = max_size or int(os.getenv("DB_POOL_MAX_SIZE", 10))
+        self.health_check_interval = health_check_interval if health_check_interval is not None else float(
+            os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", 30)
+        )
+        self.timeout = timeout or float(os.getenv("DB_POOL_TIMEOUT", 30))
+
+        self.pool = pool.ThreadedConnectionPool(self.min_size, self.max_size, **db_config())
+        self.slots = threading.BoundedSemaphore(self.max_size)
+        self.last_used = {}
+        self.pid = os.getpid()
+        self.logger.info(f"Connection pool created (min={self.min_size}, max={self.max_size})")
+
+    def _is_healthy(self, connection):
+        if connection.closed:
+            return False
+        if time.monotonic() - self.last_used.get(id(connection), 0) < self.health_check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except Exception as e:
+            self.logger.warning(f"Discarding broken connection: {e}")
+            return False
+
+    def getconn(self):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise pool.PoolError(f"No free connection in pool after {self.timeout}s")
+        try:
+            connection = self.pool.getconn()
+            if not self._is_healthy(connection):
+                self.pool.putconn(connection, close=True)
+                connection = self.pool.getconn()
+            return connection
+        except Exception:
+            self.slots.release()
+            raise
+
+    def putconn(self, connection, close=False):
+        try:
+            if not connection.closed and not close:
+                # Yarım kalan transaction bir sonraki kullanıcıya taşınmasın
+                try:
+                    if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                        connection.rollback()
+                except Exception as e:
+                    # Rollback edilemeyen bağlantı yine de havuza bildirilip kapatılır,
+                    # aksi halde ThreadedConnectionPool'da "kullanımda" kalır
+                    self.logger.warning(f"Discarding connection that failed to roll back: {e}")
+                    close = True
+            if not connection.closed and not close:
+                self.last_used[id(connection)] = time.monotonic()
+            else:
+                self.last_used.pop(id(connection), None)
+            self.pool.putconn(connection, close=close or connection.closed)
+        finally:
+            self.slots.release()
+
+    @contextmanager
+    def connection(self):
+        connection = self.getconn()
+        broken = False
+        try:
+            yield connection
+        except psycopg2.OperationalError:
+            broken = True
+            raise
+        finally:
+            self.putconn(connection, close=broken)
+
+    def closeall(self):
+        self.pool.closeall()
+        self.logger.info("Connection pool closed")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    # Process başına tek havuz; fork sonrası çocuk process kendi havuzunu açar
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ConnectionPool()
+        return _pool
+
+
+@contextmanager
+def pooled_connection():
+    with get_pool().connection() as connection:
+        yield connection
+
+
 if __name__ == "__main__":
     connect = create_connection()
-    print(connect)
\ No newline at end of file
+    print(connect)
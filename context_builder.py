@@ -0,0 +1,111 @@
+import logging
+import os
+import re
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+DEFAULT_MAX_TOKENS = 3000
+DEFAULT_TOKENIZER_MODEL = "gpt-4"
+HEADER = "Orders grouped by user (order date | products [category]):"
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+class TokenCounter:
+    """tiktoken varsa modelin gerçek tokenizer'ı, yoksa kelime/noktalama sayımına dayalı tahmin."""
+
+    def __init__(self, model=None):
+        self.model = model or os.getenv("CONTEXT_TOKENIZER_MODEL", DEFAULT_TOKENIZER_MODEL)
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count(self, text):
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        return len(WORD_PATTERN.findall(text))
+
+
+def order_line(metadata):
+    # Aynı ürün bir siparişte tekrar ediyorsa "x2" ile tek seferde yazılır
+    counts = {}
+    for product, category in zip(metadata.get('products', []), metadata.get('categories', [])):
+        counts[(product, category)] = counts.get((product, category), 0) + 1
+    products = "; ".join(
+        f"{product} [{category}]" + (f" x{count}" if count > 1 else "")
+        for (product, category), count in counts.items()
+    )
+    return f"  {metadata.get('order_date')} | {products}"
+
+
+def user_line(metadata):
+    return f"{metadata.get('user_name')} #{metadata.get('user_id')}"
+
+
+class ContextBuilder:
+    """Getirilen sipariş dokümanlarından token bütçeli, tablo biçimli prompt context'i kurar.
+
+    Dokümanlar alaka sırasıyla eklenir; aynı sipariş bir kez yazılır, kullanıcı
+    bilgisi her satırda tekrarlanmak yerine kullanıcı başına bir başlık olur.
+    Bütçe `max_tokens`'a ulaşınca kalan dokümanlar atlanır ve sayıları belirtilir.
+    """
+
+    def __init__(self, max_tokens=None, counter=None):
+        self.logger = logging.getLogger("ContextBuilder")
+        self.max_tokens = max_tokens or int(os.getenv("CONTEXT_MAX_TOKENS", DEFAULT_MAX_TOKENS))
+        self.counter = counter or TokenCounter()
+
+    def build(self, records):
+        # records: order_metadata sözlükleri (alaka sırasıyla); (context, istatistik) döner
+        records = list(records)
+        users = {}
+        seen = set()
+        duplicates = 0
+        tokens = self.counter.count(HEADER)
+        included = 0
+        # Atlanan doküman notu için yer ayrılır, böylece context bütçeyi aşmaz
+        limit = self.max_tokens - self.counter.count(f"({len(records)} more matching orders omitted)") - 1
+
+        for position, metadata in enumerate(records):
+            key = (metadata.get('user_id'), str(metadata.get('order_date')), tuple(metadata.get('products', [])))
+            if key in seen:
+                duplicates += 1
+                continue
+            line = order_line(metadata)
+            user_key = (metadata.get('user_id'), metadata.get('user_name'))
+            # +1: satır sonu
+            cost = self.counter.count(line) + 1
+            if user_key not in users:
+                cost += self.counter.count(user_line(metadata)) + 1
+            if tokens + cost > limit:
+                break
+            seen.add(key)
+            users.setdefault(user_key, [user_line(metadata)]).append(line)
+            tokens += cost
+            included += 1
+        else:
+            position = len(records)
+
+        omitted = len(records) - position
+        lines = [HEADER]
+        for user_lines in users.values():
+            lines.extend(user_lines)
+        if omitted:
+            lines.append(f"({omitted} more matching orders omitted)")
+        context = "\n".join(lines)
+
+        stats = {
+            "documents": len(records),
+            "included": included,
+            "duplicates": duplicates,
+            "omitted": omitted,
+            "tokens": self.counter.count(context),
+        }
+        self.logger.info(f"Built context: {stats}")
+        return context, stats
@@ -1,12 +1,21 @@
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_pinecone import PineconeVectorStore
 from pinecone import Pinecone, ServerlessSpec
 import logging
 import os
 from dotenv import load_dotenv
-from connect_db import create_connection
-from collections import defaultdict
+from connect_db import get_pool
+from embedding_cache import CachedEmbeddings
+from vector_store import (
+    get_langchain_vector_store, uses_pinecone, INDEX_NAME, NAMESPACE, EMBEDDING_MODEL, EMBEDDING_DIMENSION
+)
+from order_documents import (
+    ORDERS_QUERY, DEFAULT_ITERSIZE, DEFAULT_CHUNK_SIZE, stream_rows, iter_row_chunks,
+    group_orders, order_text, order_metadata, metadata_document_id
+)
+from metadata_index import MetadataIndex
+from bm25_index import BM25Index
 from langchain_core.documents import Document
+import argparse
 
 
 
@@ -18,19 +27,25 @@ logging.basicConfig(level=logging.INFO, filename="extract_data.log", filemode="w
 
 class PineconeDataLoader:
 
-    def __init__(self):
+    def __init__(self, use_cache=True):
         self.logger = logging.getLogger("PineconeDataLoader")
         load_dotenv()   
         try: 
             self.embeddings = HuggingFaceEmbeddings(
-                model_name="sentence-transformers/all-mpnet-base-v2"
+                model_name=EMBEDDING_MODEL
             )
+            if use_cache:
+                self.embeddings = CachedEmbeddings(self.embeddings)
 
-            self.connection = create_connection()
+            self.pool = get_pool()
+            self.connection = self.pool.getconn()
             self.cursor = self.connection.cursor()
             self.logger.info("Database connection succesfully")
 
-            self.pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+            self.pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY")) if uses_pinecone() else None
+            self.vector_store = None
+            self.metadata_index = MetadataIndex()
+            self.keyword_index = BM25Index()
         except Exception as e:
             self.logger.error(f"Failed to connect to database: {e}")
             raise
@@ -41,27 +56,8 @@ class PineconeDataLoader:
 
         self.logger.info("starting data fetch from PostgreSQL")
         
-        query = """
-            -- her sipariş kullanıcı ve ürün bilgileir ile birleşir
-    SELECT
-        u.user_id,
-        u.user_name AS user_name,
-        o.order_id,
-        o.product_id,
-        o.order_date,
-        p.product_name AS product_name,
-        p.category AS product_category
-    FROM
-        orders o
-    JOIN
-        users u ON o.user_id = u.user_id
-    JOIN
-        products p ON o.product_id = p.product_id
-    ORDER BY 
-        o.order_date DESC;
-            """
         try:
-            self.cursor.execute(query)
+            self.cursor.execute(ORDERS_QUERY)
             data = self.cursor.fetchall()
             self.logger.info(f"Successfully retrieved {len(data)} records from database")
             return data
@@ -69,60 +65,42 @@ class PineconeDataLoader:
             self.logger.error(f"Error retrieving data from database: {e}")
             raise
         finally:
-            self.connection.close()
+            self.release_connection()
+
+    def release_connection(self):
+        # Bağlantı havuza bir kez geri verilir, tekrar çağrılması zararsızdır
+        if self.connection is not None:
+            self.cursor.close()
+            self.pool.putconn(self.connection)
+            self.connection = None
+
+    def stream_data_from_postgres(self, itersize=DEFAULT_ITERSIZE):
+        # fetchall yerine satırları server-side cursor ile parça parça üretir
+        self.logger.info(f"starting streaming data fetch from PostgreSQL (itersize={itersize})")
+        row_count = 0
+        try:
+            for row in stream_rows(self.connection, ORDERS_QUERY, itersize):
+                row_count += 1
+                yield row
+            self.logger.info(f"Successfully streamed {row_count} records from database")
+        except Exception as e:
+            self.logger.error(f"Error streaming data from database: {e}")
+            raise
+        finally:
+            self.release_connection()
 
     def prepare_documents(self, data):
         documents = []
-        grouped_orders = defaultdict(list)
 
         try:
-            for row in data:
-                user_id, user_name, _, _, order_date, product_name, product_category = row
-                key = (user_id, order_date)
-
-                if key not in grouped_orders:
-                    grouped_orders[key] = {
-                        'user_name': user_name,  # Kullanıcı adı 
-                        'products': []          
-                    }
-
-                grouped_orders[key]['products'].append({
-                    'product_name': product_name,
-                    'category': product_category
-                })
-            self.logger.info(f"Grouped {len(grouped_orders)} unique user-date combinations")
-
-            for (user_id, order_date), details in grouped_orders.items():
-                products = details["products"]
-                user_name = details['user_name']
-                
-                
-                # Ürün bilgilerini birleştir, sadece dict olanları al
-                products_text = " and ".join([
-                    f"{p['product_name']} ({p['category']})"
-                    for p in products if isinstance(p, dict)
-                ])
-
-                text = f"User {user_name} ordered {products_text} on {order_date}"
-
-                
-                # Metadata hazırla
-                metadata = {
-                    "user_id": user_id,
-                    "user_name": user_name,
-                    "order_date": str(order_date),
-                    "products": [p['product_name'] for p in products if isinstance(p, dict)],
-                    "categories": [p['category'] for p in products if isinstance(p, dict)]
-                }
-
+            for group in group_orders(data):
                 doc = Document(
-                    page_content = text,
-                    metadata=metadata
+                    page_content = order_text(group),
+                    metadata=order_metadata(group)
                 )
                 documents.append(doc)
-                # print(documents)
             
-            self.logger.info(f"Successfully created {len(documents)} embeddings")
+            self.logger.info(f"Successfully created {len(documents)} documents")
             return documents
         
         except Exception as e:
@@ -130,12 +108,15 @@ class PineconeDataLoader:
             raise
 
     def create_pinecone_index(self):
+        if self.pc is None:
+            self.logger.info("Using local vector index, skipping Pinecone index creation")
+            return
         try:
-            index_name= "ecommerce-22"
+            index_name= INDEX_NAME
             if index_name not in self.pc.list_indexes().names():
                 self.pc.create_index(
                     name=index_name,
-                    dimension=768,  # Burada embedding boyutuna uygun 384 kullanılıyor
+                    dimension=EMBEDDING_DIMENSION,
                     spec=ServerlessSpec(
                         cloud="aws",
                         region="us-east-1"
@@ -153,14 +134,21 @@ class PineconeDataLoader:
     def upload_to_pinecone(self, documents):
         self.logger.info("Starting Pinecone upload process")
         try:
-            index_name= "ecommerce-2"
-
-            vector_store = PineconeVectorStore.from_documents(
-                documents=documents,
-                embedding=self.embeddings,
-                index_name=index_name,
-                namespace="ecommerce-22"
-            )
+            index_name= INDEX_NAME
+
+            # Akış modunda aynı vector store chunk'lar arasında tekrar kullanılır
+            if self.vector_store is None:
+                self.vector_store = get_langchain_vector_store(
+                    index_name=index_name,
+                    embedding=self.embeddings,
+                    namespace=NAMESPACE,
+                    dimension=EMBEDDING_DIMENSION
+                )
+            ids = [metadata_document_id(doc.metadata) for doc in documents]
+            self.vector_store.add_documents(documents, ids=ids)
+            self.metadata_index.add(ids, [doc.metadata for doc in documents])
+            self.keyword_index.add(ids, [doc.page_content for doc in documents])
+            vector_store = self.vector_store
 
             # vector_store = PineconeVectorStore(index=index, embedding=self.embeddings)
             # uuids = [str(uuid4()) for _ in range(len(documents))]
@@ -175,21 +163,48 @@ class PineconeDataLoader:
             self.logger.error(f"Error uploading to Pinecone: {e}")
             raise
 
+    def flush(self):
+        # Yerel backend'de vektörler chunk başına değil, yükleme sonunda bir kez kalıcı yapılır
+        if self.vector_store is not None and not uses_pinecone():
+            self.vector_store.flush()
+
+
+
+def run_streaming(loader, itersize=DEFAULT_ITERSIZE, chunk_size=DEFAULT_CHUNK_SIZE):
+    # fetch -> grouping -> embedding -> upsert aşamaları chunk chunk ilerler
+    rows = loader.stream_data_from_postgres(itersize)
+    total = 0
+    for chunk in iter_row_chunks(rows, chunk_size):
+        documents = loader.prepare_documents(chunk)
+        loader.upload_to_pinecone(documents)
+        total += len(documents)
+        loader.logger.info(f"Streamed {total} documents to Pinecone so far")
+    return total
 
 
-def main():
+def main(stream=False, itersize=DEFAULT_ITERSIZE, chunk_size=DEFAULT_CHUNK_SIZE, use_cache=True):
     try:
-        loader = PineconeDataLoader()
-        data = loader.fetch_data_from_postgres()
+        loader = PineconeDataLoader(use_cache=use_cache)
         loader.create_pinecone_index()
-        documents = loader.prepare_documents(data)
-        loader.upload_to_pinecone(documents)
-        loader.cursor.close()
-        loader.connection.close()
+        if stream:
+            run_streaming(loader, itersize, chunk_size)
+        else:
+            data = loader.fetch_data_from_postgres()
+            documents = loader.prepare_documents(data)
+            loader.upload_to_pinecone(documents)
+        loader.flush()
+        loader.release_connection()
     except Exception as e:
         logging.error(f"Pipeline failed: {e}")
         raise
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="PostgreSQL -> Pinecone ingestion (LangChain)")
+    parser.add_argument("--stream", action="store_true", help="server-side cursor ile akış modunda çalış")
+    parser.add_argument("--itersize", type=int, default=DEFAULT_ITERSIZE)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--no-cache", action="store_true", help="embedding cache'ini kullanma")
+    args = parser.parse_args()
+
+    main(stream=args.stream, itersize=args.itersize, chunk_size=args.chunk_size, use_cache=not args.no_cache)
\ No newline at end of file
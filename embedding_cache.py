@@ -0,0 +1,212 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from vector_store import EMBEDDING_MODEL
+
+
+DEFAULT_CACHE_PATH = "embedding_cache.sqlite"
+DEFAULT_MAX_MB = 1024
+DEFAULT_ENCODE_BATCH_SIZE = 64
+# Kilitli cache dosyasında yazma için beklenecek süre (sn)
+DEFAULT_BUSY_TIMEOUT = 30
+
+
+def cache_key(model_name, text):
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+def encode_texts(model, texts, batch_size=DEFAULT_ENCODE_BATCH_SIZE, cache=None, model_name=EMBEDDING_MODEL):
+    # model: SentenceTransformer; ingestion (postgre_to_pinecone) ve benchmark ortak kullanır
+    if cache is not None and texts:
+        # Sadece cache'te olmayan (yeni ya da değişmiş) metinler modele gider
+        return cache.encode(model_name, texts, lambda missing: encode_texts(model, missing, batch_size))
+
+    # Metinleri micro-batch'ler halinde encode edip tek bir float32 matrise yazar
+    dimension = model.get_sentence_embedding_dimension()
+    embeddings = np.empty((len(texts), dimension), dtype=np.float32)
+
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        embeddings[start:start + len(batch)] = model.encode(
+            batch,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+    return embeddings
+
+
+class EmbeddingCache:
+    """Doküman embedding'leri için SQLite tabanlı kalıcı cache.
+
+    Anahtar model adı + metnin SHA-256'sıdır; toplam boyut `max_bytes`'ı aşınca
+    en uzun süredir kullanılmayan kayıtlar silinir.
+    """
+
+    def __init__(self, path=None, max_bytes=None):
+        self.logger = logging.getLogger("EmbeddingCache")
+        self.path = path or os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.max_bytes = max_bytes or int(os.getenv("EMBEDDING_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self.connection = sqlite3.connect(
+            self.path,
+            timeout=float(os.getenv("SQLITE_BUSY_TIMEOUT", DEFAULT_BUSY_TIMEOUT)),
+            check_same_thread=False,
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self.connection.commit()
+        self.total_bytes = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    def get_many(self, model_name, texts):
+        # Her metin için vektör ya da None döner
+        keys = [cache_key(model_name, text) for text in texts]
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self.connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self.connection.commit()
+
+            vectors = [
+                np.frombuffer(found[key], dtype=np.float32) if key in found else None
+                for key in keys
+            ]
+            hits = len([v for v in vectors if v is not None])
+            self.hits += hits
+            self.misses += len(vectors) - hits
+        return vectors
+
+    def _existing_sizes(self, keys):
+        # REPLACE edilecek kayıtların eski boyutu; toplamdan düşülmezse iki kez sayılır
+        existing = 0
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            existing += self.connection.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN ({placeholders})", chunk
+            ).fetchone()[0]
+        return existing
+
+    def put_many(self, model_name, texts, vectors):
+        now = time.time()
+        # Aynı metin batch'te birden çok kez geçebilir; her anahtar bir kez yazılır
+        rows = {}
+        for text, vector in zip(texts, vectors):
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            key = cache_key(model_name, text)
+            rows[key] = (key, blob, len(blob), now)
+        with self.lock:
+            replaced = self._existing_sizes(list(rows))
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)",
+                list(rows.values())
+            )
+            self.connection.commit()
+            self.total_bytes += sum(row[2] for row in rows.values()) - replaced
+            over_limit = self.total_bytes > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def evict(self):
+        # Sınırın %90'ına inene kadar en uzun süredir kullanılmayan kayıtları sil
+        with self.lock:
+            self.total_bytes = self.connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+            ).fetchone()[0]
+            target = int(self.max_bytes * 0.9)
+            to_remove = []
+            removed = 0
+            cursor = self.connection.execute("SELECT key, size FROM embeddings ORDER BY last_used ASC")
+            while self.total_bytes - removed > target:
+                row = cursor.fetchone()
+                if row is None:
+                    break
+                to_remove.append((row[0],))
+                removed += row[1]
+            cursor.close()
+            self.connection.executemany("DELETE FROM embeddings WHERE key = ?", to_remove)
+            self.connection.commit()
+            self.total_bytes -= removed
+        self.logger.info(f"Evicted {len(to_remove)} embeddings ({removed} bytes) from cache")
+
+    def encode(self, model_name, texts, encode_fn):
+        # Cache'te olmayan metinleri encode_fn ile toplu encode eder, float32 matris döner
+        cached = self.get_many(model_name, texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+
+        if missing:
+            new_vectors = np.asarray(encode_fn([texts[i] for i in missing]), dtype=np.float32)
+            self.put_many(model_name, [texts[i] for i in missing], new_vectors)
+            for i, vector in zip(missing, new_vectors):
+                cached[i] = vector
+
+        self.logger.info(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses")
+        if not cached:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.vstack(cached)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """HuggingFaceEmbeddings gibi bir LangChain embedding'ini cache'lerle sarar.
+
+    `cache=False` doküman cache'ini kapatır; `query_cache` verilirse (bkz.
+    query_cache.QueryEmbeddingCache) sorgu embedding'leri de cache'lenir.
+    """
+
+    def __init__(self, embeddings, cache=None, model_name=None, query_cache=None):
+        self.embeddings = embeddings
+        self.cache = None if cache is False else (cache or EmbeddingCache())
+        self.query_cache = query_cache
+        self.model_name = model_name or getattr(embeddings, "model_name", type(embeddings).__name__)
+
+    def embed_documents(self, texts):
+        if self.cache is None:
+            return self.embeddings.embed_documents(texts)
+        matrix = self.cache.encode(self.model_name, list(texts), self.embeddings.embed_documents)
+        return matrix.tolist()
+
+    def embed_query(self, text):
+        if self.query_cache is None:
+            return self.embeddings.embed_query(text)
+        return self.query_cache.get_or_compute(text, self.embeddings.embed_query)
+
+    def embed_queries(self, texts):
+        # Birden çok sorgu tek forward pass'te; HuggingFaceEmbeddings'te embed_query == embed_documents
+        if self.query_cache is None:
+            return self.embeddings.embed_documents(list(texts))
+        return self.query_cache.get_or_compute_many(texts, self.embeddings.embed_documents)
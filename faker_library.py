@@ -1,27 +1,104 @@
 from faker import Faker
-from connect_db import create_connection
-from random import choice, randint
+from random import Random
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from io import StringIO
+import argparse
 import logging
+import time
+
+LOG_FILE = "data_generation.log"
+DEFAULT_CHUNK_SIZE = 10000
+
+CATEGORIES = [
+    "Clothing","Jewelry","Flower Type", "Electronics", "Home Goods", "Personal Care"
+]
+# Products for each category
+PRODUCTS = {
+    "Clothing": [
+        "T-shirt", "V-neck T-shirt","Winter Coat", "Waterproof Coat", "Wool Coat", "Plus Size Coat", "Wool Sweater", "Buttoned Sweater",
+        "Women Blazer", "Men Blazer","Jeans", "Straight Jeans", "Mom Jeans","Shirt", "Short Sleeve Shirt", "Long Sleeve Shirt", "Patterned Shirt"],
+    "Jewelry": ["Necklace", "Bracelet", "Ring", "Earrings"],
+    "Flower Type": ["Succulent", "Cactus", "Ficus", "Begonia","Daisy", "Rose", "Tulip", "Orchid"],
+    "Electronics": ["Smartphone","Powerbank", "Laptop", "Bluetooth Headset", "Smartwatch", "keyword", "mouse"],
+    "Stationery": ["Notebook", "Pen", "Backpack", "Colorful Post-it"],
+    "Home Goods": ["Lamp", "Table Clock", "Curtain", "Carpet","Pot", "Knife Set", "Pitcher", "Food Processor"],
+    "Personal Care": ["Shampoo", "Body Lotion", "Perfume", "Toothbrush"]
+}
+# 10 colors
+COLORS = ["Red", "Blue", "Green", "Yellow", "Black", "White", "Pink", "Purple", "Orange", "Brown"]
 
-logging.basicConfig(level=logging.INFO, filename="data_generation.log", filemode="w", 
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
 class DataGenerator:
 
-    def __init__(self):
+    def __init__(self, bulk=False, chunk_size=DEFAULT_CHUNK_SIZE, seed=None, rate=None, base_date=None,
+                 connect=True):
         self.logger = logging.getLogger("DataGenerator")
         self.fake=Faker()
+        # Aynı seed + base_date aynı veriyi üretir
+        self.random = Random(seed)
+        if seed is not None:
+            self.fake.seed_instance(seed)
+        self.base_date = base_date or datetime.now()
+        # bulk=True: satır satır INSERT yerine chunk'lar halinde execute_values/COPY
+        self.bulk = bulk
+        self.chunk_size = chunk_size
+        # rate: saniyede en fazla bu kadar satır (None = sınırsız)
+        self.rate = rate
+        self.rate_started = None
+        self.rate_rows = 0
+        # connect=False: DB'ye yazmadan yalnızca bellekte veri üretir (generate_order_rows)
+        self.connection = None
+        if not connect:
+            return
+        # psycopg2 yalnızca DB'ye yazarken gerekir; connect=False (ör. benchmark) onsuz çalışır
+        from connect_db import get_pool
         try:
-            self.connection = create_connection()
+            self.pool = get_pool()
+            self.connection = self.pool.getconn()
             self.cursor = self.connection.cursor()
             self.logger.info("Database connection succesfully")
         except Exception as e:
             self.logger.error(f"Failed to connect to database: {e}")
             raise
         
+    def _chunks(self, total):
+        for start in range(0, total, self.chunk_size):
+            yield min(self.chunk_size, total - start)
+
+    def _throttle(self, rows):
+        if not self.rate:
+            return
+        if self.rate_started is None:
+            self.rate_started = time.monotonic()
+        self.rate_rows += rows
+        ahead = self.rate_rows / self.rate - (time.monotonic() - self.rate_started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+    def _bulk_insert(self, query, rows, template=None):
+        # Tek round-trip'te çok satır ekler, RETURNING id'lerini döndürür
+        from psycopg2.extras import execute_values
+        result = execute_values(self.cursor, query, rows, template=template, page_size=len(rows), fetch=True)
+        self.connection.commit()
+        self._throttle(len(rows))
+        return [row[0] for row in result]
+
+    def _copy_orders(self, rows):
+        buffer = StringIO()
+        for user_id, product_id, order_date in rows:
+            buffer.write(f"{user_id}\t{product_id}\t{order_date.isoformat()}\n")
+        buffer.seek(0)
+        self.cursor.copy_expert(
+            "COPY orders (user_id, product_id, order_date) FROM STDIN", buffer
+        )
+        self.connection.commit()
+        self._throttle(len(rows))
+
     def generate_users(self, num_users=100):
         self.logger.info(f"Starting user generation. Target: {num_users} users")
+        if self.bulk:
+            return self.generate_users_bulk(num_users)
         users = []   
         try:     
             for _ in range(num_users):
@@ -32,6 +109,7 @@ class DataGenerator:
                 )
                 user_id = self.cursor.fetchone()[0]
                 users.append(user_id)
+                self._throttle(1)
             
             self.connection.commit()
             self.logger.info(f"Successfully generated {len(users)} users")
@@ -41,32 +119,32 @@ class DataGenerator:
             self.logger.error(f"Error generating users: {e}")
             raise
 
+    def generate_users_bulk(self, num_users):
+        users = []
+        try:
+            for size in self._chunks(num_users):
+                rows = [(self.fake.name(),) for _ in range(size)]
+                users.extend(self._bulk_insert(
+                    "INSERT INTO users (user_name) VALUES %s RETURNING user_id", rows
+                ))
+                self.logger.info(f"Inserted {len(users)}/{num_users} users")
+            return users
+
+        except Exception as e:
+            self.connection.rollback()
+            self.logger.error(f"Error generating users in bulk: {e}")
+            raise
+
     def generate_products(self, num_products=500):
         self.logger.info(f"starting product generation. Target {num_products} products")
-        categories = [
-            "Clothing","Jewelry","Flower Type", "Electronics", "Home Goods", "Personal Care"
-        ]
-        # Products for each category
-        products = {
-            "Clothing": [
-                "T-shirt", "V-neck T-shirt","Winter Coat", "Waterproof Coat", "Wool Coat", "Plus Size Coat", "Wool Sweater", "Buttoned Sweater",
-                "Women Blazer", "Men Blazer","Jeans", "Straight Jeans", "Mom Jeans","Shirt", "Short Sleeve Shirt", "Long Sleeve Shirt", "Patterned Shirt"],
-            "Jewelry": ["Necklace", "Bracelet", "Ring", "Earrings"],
-            "Flower Type": ["Succulent", "Cactus", "Ficus", "Begonia","Daisy", "Rose", "Tulip", "Orchid"],
-            "Electronics": ["Smartphone","Powerbank", "Laptop", "Bluetooth Headset", "Smartwatch", "keyword", "mouse"],
-            "Stationery": ["Notebook", "Pen", "Backpack", "Colorful Post-it"],
-            "Home Goods": ["Lamp", "Table Clock", "Curtain", "Carpet","Pot", "Knife Set", "Pitcher", "Food Processor"],
-            "Personal Care": ["Shampoo", "Body Lotion", "Perfume", "Toothbrush"]
-        }
-
-        # 10 colors
-        colors = ["Red", "Blue", "Green", "Yellow", "Black", "White", "Pink", "Purple", "Orange", "Brown"]
+        if self.bulk:
+            return self.generate_products_bulk(num_products)
         try:
             products_list = []
             for _ in range(num_products):
-                category = choice(categories)  
-                product_name = choice(products[category])  
-                color = choice(colors)  
+                category = self.random.choice(CATEGORIES)  
+                product_name = self.random.choice(PRODUCTS[category])  
+                color = self.random.choice(COLORS)  
                 # Create the full product name with category and color
                 product_full_name = f"{product_name} ({color})"
                 self.cursor.execute(
@@ -74,6 +152,7 @@ class DataGenerator:
                     (product_full_name, category)
                 )
                 products_list.append(self.cursor.fetchone()[0])
+                self._throttle(1)
 
             self.connection.commit()
             self.logger.info(f"{len(products_list)} products successfully added to the database!")
@@ -83,28 +162,50 @@ class DataGenerator:
             self.logger.error(f"error generating products: {e}")
             raise
     
-    def generate_orders(self, users, products, order_count=1000):
+    def generate_products_bulk(self, num_products):
+        products_list = []
+        try:
+            for size in self._chunks(num_products):
+                rows = []
+                for _ in range(size):
+                    category = self.random.choice(CATEGORIES)
+                    rows.append((f"{self.random.choice(PRODUCTS[category])} ({self.random.choice(COLORS)})", category))
+                products_list.extend(self._bulk_insert(
+                    "INSERT INTO products (product_name, category) VALUES %s RETURNING product_id", rows
+                ))
+                self.logger.info(f"Inserted {len(products_list)}/{num_products} products")
+            return products_list
+
+        except Exception as e:
+            self.connection.rollback()
+            self.logger.error(f"error generating products in bulk: {e}")
+            raise
+
+    def generate_orders(self, users, products, order_count=1000, return_ids=True):
         self.logger.info(f"starting order generation. Target {order_count} products")
+        if self.bulk:
+            return self.generate_orders_bulk(users, products, order_count, return_ids)
 
         try:
-            start_date = datetime.now() - timedelta(days=1)
+            start_date = self.base_date - timedelta(days=1)
             for _ in range(order_count):
                 # Select random user
-                user_id = choice(users)
+                user_id = self.random.choice(users)
                 # Select random number of products (1-5)
-                product_count = randint(1, 5)
+                product_count = self.random.randint(1, 5)
                 order_date = self.fake.date_time_between(
                     start_date=start_date,
-                    end_date='now'
+                    end_date=self.base_date
                 )
                 # Select random products - Fixed this line
-                selected_products = [choice(products) for _ in range(product_count)]
+                selected_products = [self.random.choice(products) for _ in range(product_count)]
                 
                 for product_id in selected_products:
                     self.cursor.execute(
                         "INSERT INTO orders (user_id, product_id, order_date) VALUES (%s, %s, %s)",
                         (user_id, product_id, order_date)
                     )
+                    self._throttle(1)
             self.connection.commit()
             self.logger.info(f"{order_count} orders generated succesfully")
 
@@ -112,14 +213,64 @@ class DataGenerator:
             self.logger.error(f"error generating orders: {e}")
             raise
 
-    def generate_all_data(self):
+    def generate_orders_bulk(self, users, products, order_count, return_ids=True):
+        # return_ids=False ise id gerekmediği için en hızlı yol olan COPY kullanılır
+        order_ids = []
+        start_date = self.base_date - timedelta(days=1)
+        generated = 0
+        try:
+            for size in self._chunks(order_count):
+                rows = []
+                for _ in range(size):
+                    user_id = self.random.choice(users)
+                    order_date = self.fake.date_time_between(start_date=start_date, end_date=self.base_date)
+                    for _ in range(self.random.randint(1, 5)):
+                        rows.append((user_id, self.random.choice(products), order_date))
+
+                if return_ids:
+                    order_ids.extend(self._bulk_insert(
+                        "INSERT INTO orders (user_id, product_id, order_date) VALUES %s RETURNING order_id", rows
+                    ))
+                else:
+                    self._copy_orders(rows)
+                generated += size
+                self.logger.info(f"Inserted {generated}/{order_count} orders ({len(rows)} order rows in chunk)")
+            return order_ids
+
+        except Exception as e:
+            self.connection.rollback()
+            self.logger.error(f"error generating orders in bulk: {e}")
+            raise
+
+    def generate_order_rows(self, num_users=100, num_products=500, num_orders=1000):
+        # DB'siz üretim: ORDERS_QUERY ile aynı düzende, (user_id, order_date) sıralı satırlar;
+        # benchmark'lar bu satırları doğrudan group_orders'a verebilir
+        users = [(user_id, self.fake.name()) for user_id in range(1, num_users + 1)]
+        products = []
+        for product_id in range(1, num_products + 1):
+            category = self.random.choice(CATEGORIES)
+            products.append((product_id, f"{self.random.choice(PRODUCTS[category])} ({self.random.choice(COLORS)})", category))
+
+        start_date = self.base_date - timedelta(days=1)
+        rows = []
+        for _ in range(num_orders):
+            user_id, user_name = self.random.choice(users)
+            order_date = self.fake.date_time_between(start_date=start_date, end_date=self.base_date)
+            for _ in range(self.random.randint(1, 5)):
+                product_id, product_name, category = self.random.choice(products)
+                rows.append((user_id, user_name, len(rows) + 1, product_id, order_date, product_name, category))
+        rows.sort(key=lambda row: (row[0], row[4]))
+        self.logger.info(f"Generated {len(rows)} order rows in memory")
+        return rows
+
+    def generate_all_data(self, num_users=100, num_products=500, num_orders=1000):
         print("genereting users")
         self.logger.info("starting full data generation process")
         try:
 
-            users= self.generate_users(100)
-            products = self.generate_products(500)
-            self.generate_orders(users, products, 1000)
+            users= self.generate_users(num_users)
+            products = self.generate_products(num_products)
+            self.generate_orders(users, products, num_orders, return_ids=False)
             self.logger.info("Data generation completed successfully")
 
         except Exception as e:
@@ -128,16 +279,101 @@ class DataGenerator:
             self.close_connection()
     
     def close_connection(self):
+        if self.connection is None:
+            return
         try:
             self.cursor.close()
-            self.connection.close()
-            self.logger.info("database connection closed successfully")
+            self.pool.putconn(self.connection)
+            self.logger.info("database connection returned to pool successfully")
         except Exception as e:
             self.logger.error(f"Error closing database connection: {e}")
 
+def split_count(total, parts):
+    # total'ı parts adet neredeyse eşit parçaya böler
+    base, extra = divmod(total, parts)
+    return [base + (1 if i < extra else 0) for i in range(parts)]
+
+
+def _run_worker(task):
+    # Her process kendi Faker seed'i ve kendi DB bağlantısı ile sipariş üretir
+    count, seed, options, users, products = task
+    configure_logging(filemode="a")
+    generator = DataGenerator(bulk=True, seed=seed, **options)
+    try:
+        generator.generate_orders(users, products, count, return_ids=False)
+    finally:
+        generator.close_connection()
+
+
+def parallel_generate(num_users, num_products, num_orders, workers, seed=0,
+                      rate=None, chunk_size=DEFAULT_CHUNK_SIZE, base_date=None):
+    # Kullanıcı ve ürünler parent'ta tek seed'li üreticiyle sırayla eklenir: id -> isim
+    # eşlemesi commit sırasına bağlı kalmaz, aynı seed aynı veriyi verir. Yalnızca
+    # id'leri kimsenin referans almadığı siparişler worker'lara dağıtılır
+    logger = logging.getLogger("DataGenerator")
+    base_date = base_date or datetime.now()
+    generator = DataGenerator(bulk=True, seed=seed, chunk_size=chunk_size, rate=rate, base_date=base_date)
+    try:
+        started = time.perf_counter()
+        users = generator.generate_users(num_users)
+        products = generator.generate_products(num_products)
+        logger.info(f"Generated {num_users} users and {num_products} products in {time.perf_counter() - started:.1f}s")
+    finally:
+        generator.close_connection()
+
+    options = {
+        "chunk_size": chunk_size,
+        "rate": rate / workers if rate else None,
+        "base_date": base_date,
+    }
+    counts = split_count(num_orders, workers)
+    tasks = [
+        (count, seed * 1000 + worker, options, users, products)
+        for worker, count in enumerate(counts) if count
+    ]
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(_run_worker, tasks))
+    elapsed = time.perf_counter() - started
+    logger.info(f"Generated {num_orders} orders with {workers} workers in {elapsed:.1f}s "
+                f"({num_orders / elapsed if elapsed else 0:.0f}/sec)")
+
+
+def configure_logging(filemode="w"):
+    # Modül seviyesinde kurulmaz: import eden (ör. benchmark) log dosyasını sıfırlamasın.
+    # Worker'lar ana process'in açtığı dosyaya ekler
+    logging.basicConfig(level=logging.INFO, filename=LOG_FILE, filemode=filemode,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic e-commerce data generator")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=1, help="process sayısı (>1 ise bulk mod kullanılır)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--rate", type=float, default=None, help="toplam satır/sn üst sınırı")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--bulk", action="store_true")
+    parser.add_argument("--base-date", type=datetime.fromisoformat, default=None,
+                        help="sipariş tarihleri bu tarihten önceki 1 güne dağıtılır (ISO format)")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        parallel_generate(args.users, args.products, args.orders, args.workers,
+                          seed=args.seed or 0, rate=args.rate, chunk_size=args.chunk_size,
+                          base_date=args.base_date)
+        return
+
+    generator = DataGenerator(bulk=args.bulk, chunk_size=args.chunk_size, seed=args.seed,
+                              rate=args.rate, base_date=args.base_date)
+    generator.generate_all_data(args.users, args.products, args.orders)
+
+
 if __name__ == "__main__":
+    configure_logging()
     try:
-        generator = DataGenerator()
-        generator.generate_all_data()
+        main()
     except Exception as e:
         logging.error(f"Application failed: {e}")
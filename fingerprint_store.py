@@ -0,0 +1,119 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+
+DEFAULT_FINGERPRINT_PATH = "fingerprints.sqlite"
+# Yazma kilidi için en fazla bu kadar saniye beklenir (SQLITE_BUSY_TIMEOUT)
+DEFAULT_BUSY_TIMEOUT = 30
+
+
+def fingerprint(text, metadata):
+    payload = json.dumps(metadata, sort_keys=True, default=str)
+    return hashlib.sha256(f"{text}\0{payload}".encode("utf-8")).hexdigest()
+
+
+class FingerprintStore:
+    """Index'e en son yazılan her doküman id'sinin içerik parmak izini tutar.
+
+    Bir tam reindex `begin_run` ile başlar; `diff` yalnızca yeni/değişmiş id'leri
+    döndürür ve hepsini bu run'da görüldü olarak işaretler. `finish_run` upload
+    başarılı olduktan sonra çağrılır, bekleyen parmak izlerini kalıcı hale getirir
+    ve bu run'da hiç görülmeyen (silinmiş) id'leri döndürür; bunlar index'ten
+    silindikten sonra `forget` ile store'dan da çıkarılır.
+    """
+
+    def __init__(self, path=None, namespace="e-commerce"):
+        self.logger = logging.getLogger("FingerprintStore")
+        self.path = path or os.getenv("FINGERPRINT_PATH", DEFAULT_FINGERPRINT_PATH)
+        self.namespace = namespace
+        self.run_id = None
+        self.force = False
+
+        self.connection = sqlite3.connect(self.path, timeout=float(os.getenv("SQLITE_BUSY_TIMEOUT", DEFAULT_BUSY_TIMEOUT)))
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                namespace TEXT NOT NULL,
+                id TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                last_seen_run INTEGER NOT NULL,
+                PRIMARY KEY (namespace, id)
+            )
+        """)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS pending_fingerprints (
+                namespace TEXT NOT NULL,
+                id TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                PRIMARY KEY (namespace, id)
+            )
+        """)
+        self.connection.commit()
+
+    def begin_run(self, force=False):
+        # Yarım kalmış bir önceki run'ın bekleyen kayıtları geçersizdir;
+        # force=True tüm dokümanları değişmiş sayar ama silinenleri yine tespit eder
+        self.run_id = int(time.time() * 1000)
+        self.force = force
+        self.connection.execute("DELETE FROM pending_fingerprints WHERE namespace = ?", (self.namespace,))
+        self.connection.commit()
+        self.logger.info(f"Started fingerprint run {self.run_id}")
+        return self.run_id
+
+    def diff(self, ids, fingerprints):
+        # Parmak izi değişen ya da yeni olan id'lerin indekslerini döndürür
+        if self.run_id is None:
+            raise RuntimeError("begin_run must be called before diff")
+
+        stored = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            stored.update(self.connection.execute(
+                f"SELECT id, fingerprint FROM fingerprints WHERE namespace = ? AND id IN ({placeholders})",
+                [self.namespace, *chunk]
+            ).fetchall())
+
+        changed = [
+            i for i, (doc_id, fp) in enumerate(zip(ids, fingerprints))
+            if self.force or stored.get(doc_id) != fp
+        ]
+        self.connection.executemany(
+            "UPDATE fingerprints SET last_seen_run = ? WHERE namespace = ? AND id = ?",
+            [(self.run_id, self.namespace, doc_id) for doc_id in ids if doc_id in stored]
+        )
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO pending_fingerprints (namespace, id, fingerprint) VALUES (?, ?, ?)",
+            [(self.namespace, ids[i], fingerprints[i]) for i in changed]
+        )
+        self.connection.commit()
+        return changed
+
+    def finish_run(self):
+        # Upload başarılı oldu: bekleyenleri yaz, bu run'da görülmeyen id'leri döndür
+        self.connection.execute("""
+            INSERT OR REPLACE INTO fingerprints (namespace, id, fingerprint, last_seen_run)
+            SELECT namespace, id, fingerprint, ? FROM pending_fingerprints WHERE namespace = ?
+        """, (self.run_id, self.namespace))
+        vanished = [row[0] for row in self.connection.execute(
+            "SELECT id FROM fingerprints WHERE namespace = ? AND last_seen_run < ?",
+            (self.namespace, self.run_id)
+        )]
+        self.connection.execute("DELETE FROM pending_fingerprints WHERE namespace = ?", (self.namespace,))
+        self.connection.commit()
+        self.logger.info(f"Finished fingerprint run {self.run_id}, {len(vanished)} ids vanished")
+        self.run_id = None
+        return vanished
+
+    def forget(self, ids):
+        self.connection.executemany(
+            "DELETE FROM fingerprints WHERE namespace = ? AND id = ?",
+            [(self.namespace, doc_id) for doc_id in ids]
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -1,4 +1,4 @@
-from without_langchain import queryyy 
+from without_langchain import queryy
 
 # https://medium.com/artificial-corner/re-ranking-is-all-you-need-7a6b1e586d48
 def start():
@@ -29,8 +29,11 @@ def ask():
             start()
         else:
 
-            response = queryyy(user_input)
-            print(response)
+            # Cevap token token yazdırılır; ilk token'a kadar geçen süre en sonda gösterilir
+            response = queryy(user_input, stream=True)
+            for token in response:
+                print(token, end="", flush=True)
+            print(f"\n\n(first token: {response.ttft_ms or 0:.0f} ms, total: {response.total_ms:.0f} ms)")
             print( "\n-------------------------------------------------")
 
 
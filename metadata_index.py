@@ -0,0 +1,280 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+
+DEFAULT_METADATA_INDEX_PATH = "metadata_index.sqlite"
+# Aynı SQLite dosyasını paylaşan süreçler (SYNC_EXECUTOR=process) yazma kilidini bu kadar
+# saniye bekler; varsayılan 5 sn yoğun sync'te "database is locked" hatası verir
+DEFAULT_BUSY_TIMEOUT = 30
+DEFAULT_MAX_FILTERED_RESULTS = 1000
+# Pinecone'da aday kümesi bundan büyükse id listesi yerine sunucu tarafı metadata filtresi kullanılır
+DEFAULT_FILTER_ID_LIMIT = 1000
+# Değişiklik akışında (answer cache invalidation) tutulan son kayıt sayısı
+CHANGE_FEED_SIZE = 100000
+VOCABULARY_FIELDS = ("product", "product_name", "color", "category")
+# Kısıt alanı -> Pinecone metadata alanı (ürün adı ve renk "products" listesindeki değerlerden gelir).
+# order_date kısıtı gün bazındadır; metadata'daki order_day alanı normalize değerin aynısıdır
+PINECONE_FIELDS = {
+    "product": "products", "product_name": "products", "color": "products",
+    "category": "categories", "user_name": "user_name", "order_date": "order_day",
+}
+DIRECT_PINECONE_FIELDS = {"order_date"}
+PRODUCT_PATTERN = re.compile(r"^(.*?)\s*\((.*?)\)$")
+DATE_PATTERN = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+# Büyük harfle başlayan ardışık kelimeler; kullanıcı adı adayları bunların alt dizileridir
+NAME_PATTERN = re.compile(r"\b[A-Z][\w'.-]+(?:\s+[A-Z][\w'.-]+)+")
+MIN_NAME_WORDS, MAX_NAME_WORDS = 2, 4
+
+
+def normalize_value(value):
+    return " ".join(str(value).split()).lower()
+
+
+def split_product(product):
+    # "Shampoo (Yellow)" -> ("shampoo", "yellow"); renk yoksa color None
+    match = PRODUCT_PATTERN.match(product.strip())
+    if not match:
+        return normalize_value(product), None
+    return normalize_value(match.group(1)), normalize_value(match.group(2))
+
+
+def postings(metadata):
+    # create_embeddings metadata'sından (field, value, raw) üçlüleri; raw, değerin
+    # vector store metadata'sındaki orijinal yazımıdır (Pinecone filtresi için)
+    fields = set()
+    for product in metadata.get("products", []):
+        name, color = split_product(product)
+        fields.add(("product", normalize_value(product), product))
+        fields.add(("product_name", name, product))
+        if color:
+            fields.add(("color", color, product))
+    for category in metadata.get("categories", []):
+        fields.add(("category", normalize_value(category), category))
+    if metadata.get("user_name"):
+        fields.add(("user_name", normalize_value(metadata["user_name"]), metadata["user_name"]))
+    if metadata.get("order_date"):
+        fields.add(("order_date", str(metadata["order_date"])[:10], str(metadata["order_date"])[:10]))
+    return fields
+
+
+def _find_terms(text, terms):
+    # Uzun terimler önce eşleşir ("mom jeans" > "jeans"); eşleşen kısım metinden çıkarılır
+    found = set()
+    for term in sorted(terms, key=len, reverse=True):
+        pattern = r"(?<!\w)" + re.escape(term) + r"(?!\w)"
+        if re.search(pattern, text):
+            found.add(term)
+            text = re.sub(pattern, " ", text)
+    return found, text
+
+
+def _find_names(question, has_user):
+    # Her büyük harfli dizinin 2-4 kelimelik alt dizileri uzundan kısaya has_user ile denenir
+    # ("Did Dana Smith" -> "dana smith"); kabul edilen bir adın kelimeleri tekrar kullanılmaz
+    names = set()
+    for run in NAME_PATTERN.findall(question):
+        words = [re.sub(r"('s|[.'])$", "", word) for word in run.split()]
+        used = [False] * len(words)
+        for size in range(min(MAX_NAME_WORDS, len(words)), MIN_NAME_WORDS - 1, -1):
+            for start in range(len(words) - size + 1):
+                if any(used[start:start + size]):
+                    continue
+                name = normalize_value(" ".join(words[start:start + size]))
+                if has_user(name):
+                    names.add(name)
+                    used[start:start + size] = [True] * size
+    return names
+
+
+def parse_query(question, vocabulary, has_user=None):
+    """Sorudan ürün/renk/kategori/tarih/kullanıcı kısıtlarını çıkarır.
+
+    vocabulary: field -> bilinen değerler (MetadataIndex.vocabulary). Aynı alandaki
+    değerler OR, farklı alanlar AND ile birleşir. Kullanıcı adları önce çözülüp
+    metinden çıkarılır, böylece "John Brown" renk olarak eşleşmez. Ürün adı ve
+    renk birlikte geçiyorsa ("yellow shampoo") tek bir ürün kısıtına çevrilir.
+    """
+    constraints = {}
+    text = normalize_value(question)
+
+    dates = set(DATE_PATTERN.findall(text))
+    if dates:
+        constraints["order_date"] = dates
+        text = DATE_PATTERN.sub(" ", text)
+
+    if has_user is not None:
+        users, text = _find_terms(text, _find_names(question, has_user))
+        if users:
+            constraints["user_name"] = users
+
+    for field in VOCABULARY_FIELDS:
+        found, text = _find_terms(text, vocabulary.get(field, ()))
+        if found:
+            constraints[field] = found
+
+    names, colors = constraints.get("product_name"), constraints.get("color")
+    if names and colors:
+        combined = {f"{name} ({color})" for name in names for color in colors} & set(vocabulary.get("product", ()))
+        if combined:
+            constraints.setdefault("product", set()).update(combined)
+            del constraints["product_name"], constraints["color"]
+    return constraints
+
+
+class MetadataIndex:
+    """Doküman metadata'sı üzerinde (field, value) -> doküman id'leri inverted index'i.
+
+    Ingestion sırasında create_embeddings'in metadata'sıyla güncellenir; sorgu
+    tarafında `parse_query` kısıtlarını tam eşleşen id kümesine çevirir, böylece
+    vektör araması yalnızca bu adaylar üzerinde yapılır.
+    """
+
+    def __init__(self, path=None):
+        self.logger = logging.getLogger("MetadataIndex")
+        self.path = path or os.getenv("METADATA_INDEX_PATH", DEFAULT_METADATA_INDEX_PATH)
+        self.lock = threading.Lock()
+        self.vocabulary_cache = None
+
+        self.connection = sqlite3.connect(
+            self.path,
+            timeout=float(os.getenv("SQLITE_BUSY_TIMEOUT", DEFAULT_BUSY_TIMEOUT)),
+            check_same_thread=False,
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS postings (
+                field TEXT NOT NULL,
+                value TEXT NOT NULL,
+                doc_id TEXT NOT NULL,
+                PRIMARY KEY (field, value, doc_id)
+            ) WITHOUT ROWID
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id)")
+        # Normalize değer -> orijinal yazımlar; eşleme değerin kendisinden türediği için silmelerde temizlenmez
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS raw_values (
+                field TEXT NOT NULL,
+                value TEXT NOT NULL,
+                raw TEXT NOT NULL,
+                PRIMARY KEY (field, value, raw)
+            ) WITHOUT ROWID
+        """)
+        # Değişen doküman id'leri akışı: sorgu process'leri answer cache'lerini buradan invalidate eder
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS changed_docs (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                doc_id TEXT NOT NULL
+            )
+        """)
+        self.connection.commit()
+
+    def _delete(self, ids):
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            self.connection.execute(f"DELETE FROM postings WHERE doc_id IN ({placeholders})", chunk)
+        self.connection.executemany("INSERT INTO changed_docs (doc_id) VALUES (?)", [(doc_id,) for doc_id in ids])
+        self.connection.execute(
+            "DELETE FROM changed_docs WHERE seq <= (SELECT MAX(seq) FROM changed_docs) - ?", (CHANGE_FEED_SIZE,)
+        )
+
+    def add(self, ids, metadata_list):
+        # Var olan dokümanların eski değerleri silinip yenileri yazılır
+        with self.lock:
+            self._delete(list(ids))
+            entries = [(doc_id, postings(metadata)) for doc_id, metadata in zip(ids, metadata_list)]
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO postings (field, value, doc_id) VALUES (?, ?, ?)",
+                [(field, value, doc_id) for doc_id, fields in entries for field, value, _ in fields]
+            )
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO raw_values (field, value, raw) VALUES (?, ?, ?)",
+                {entry for _, fields in entries for entry in fields}
+            )
+            self.connection.commit()
+            self.vocabulary_cache = None
+
+    def remove(self, ids):
+        with self.lock:
+            self._delete(list(ids))
+            self.connection.commit()
+            self.vocabulary_cache = None
+
+    def vocabulary(self):
+        # Ürün/renk/kategori değerleri az sayıdadır, bellekte tutulur
+        with self.lock:
+            if self.vocabulary_cache is None:
+                self.vocabulary_cache = {field: set() for field in VOCABULARY_FIELDS}
+                placeholders = ",".join("?" * len(VOCABULARY_FIELDS))
+                for field, value in self.connection.execute(
+                    f"SELECT DISTINCT field, value FROM postings WHERE field IN ({placeholders})",
+                    VOCABULARY_FIELDS
+                ):
+                    self.vocabulary_cache[field].add(value)
+            return self.vocabulary_cache
+
+    def has_value(self, field, value):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT 1 FROM postings WHERE field = ? AND value = ? LIMIT 1", (field, value)
+            ).fetchone() is not None
+
+    def parse(self, question):
+        return parse_query(question, self.vocabulary(), lambda name: self.has_value("user_name", name))
+
+    def lookup(self, constraints, limit=None):
+        # Alan içi OR, alanlar arası AND; eşleşen doküman id'lerini döndürür
+        if not constraints:
+            return None
+        parts, params = [], []
+        for field, values in constraints.items():
+            values = sorted(values)
+            placeholders = ",".join("?" * len(values))
+            parts.append(f"SELECT doc_id FROM postings WHERE field = ? AND value IN ({placeholders})")
+            params.extend([field, *values])
+        query = " INTERSECT ".join(parts)
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        with self.lock:
+            return [row[0] for row in self.connection.execute(query, params)]
+
+    def changes_since(self, seq):
+        # (son seq, o seq'ten sonra değişen id'ler); seq None ise yalnızca güncel konum döner.
+        # İstenen konum akıştan budanmışsa id'ler yerine None döner (hepsi değişmiş sayılmalı)
+        with self.lock:
+            first, last = self.connection.execute("SELECT MIN(seq), MAX(seq) FROM changed_docs").fetchone()
+            if seq is None or last is None or last <= seq:
+                return (last if last is not None else seq or 0), []
+            if first > seq + 1:
+                return last, None
+            ids = {row[0] for row in self.connection.execute(
+                "SELECT DISTINCT doc_id FROM changed_docs WHERE seq > ?", (seq,)
+            )}
+            return last, ids
+
+    def pinecone_filter(self, constraints):
+        # lookup ile aynı anlam (alan içi $in, alanlar arası $and); orijinal yazımı
+        # bilinmeyen bir değer varsa (eski index) None döner
+        conditions = []
+        with self.lock:
+            for field, values in sorted(constraints.items()):
+                values = sorted(values)
+                if field in DIRECT_PINECONE_FIELDS:
+                    # Zaman damgaları tek tek sayılmaz; tarih alanı doğrudan filtrelenir
+                    conditions.append({PINECONE_FIELDS[field]: {"$in": values}})
+                    continue
+                placeholders = ",".join("?" * len(values))
+                raws = sorted(row[0] for row in self.connection.execute(
+                    f"SELECT DISTINCT raw FROM raw_values WHERE field = ? AND value IN ({placeholders})",
+                    [field, *values]
+                ))
+                if not raws:
+                    return None
+                conditions.append({PINECONE_FIELDS[field]: {"$in": raws}})
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,131 @@
+DEFAULT_ITERSIZE = 2000
+DEFAULT_CHUNK_SIZE = 5000
+
+# Satırlar (user_id, order_date) sırasıyla gelir, böylece aynı siparişe ait
+# ürünler art arda okunur ve group_orders grupları sabit bellekle üretebilir
+ORDERS_QUERY = """
+    SELECT
+        u.user_id,
+        u.user_name AS user_name,
+        o.order_id,
+        o.product_id,
+        o.order_date,
+        p.product_name AS product_name,
+        p.category AS product_category
+    FROM
+        orders o
+    JOIN
+        users u ON o.user_id = u.user_id
+    JOIN
+        products p ON o.product_id = p.product_id
+    ORDER BY
+        o.user_id, o.order_date;
+"""
+
+
+def stream_rows(connection, query, itersize=DEFAULT_ITERSIZE, cursor_name="orders_stream"):
+    # Named cursor sonucu sunucuda tutar, istemciye itersize'lık parçalar halinde çeker
+    cursor = connection.cursor(name=cursor_name)
+    cursor.itersize = itersize
+    try:
+        cursor.execute(query)
+        for row in cursor:
+            yield row
+    finally:
+        cursor.close()
+
+
+def order_key(row):
+    user_id, _, _, _, order_date, _, _ = row
+    return user_id, order_date
+
+
+def iter_row_chunks(rows, chunk_size=DEFAULT_CHUNK_SIZE, key=order_key):
+    # Satırları chunk_size civarı listeler halinde verir; bir sipariş grubu asla
+    # iki chunk'a bölünmez (rows key'e göre sıralı olmalı)
+    chunk = []
+    last_key = None
+    for row in rows:
+        row_key = key(row)
+        if len(chunk) >= chunk_size and row_key != last_key:
+            yield chunk
+            chunk = []
+        chunk.append(row)
+        last_key = row_key
+    if chunk:
+        yield chunk
+
+
+def record_to_row(record):
+    # fetch_changed_records'un dict satırlarını loader'ların tuple düzenine çevirir
+    return (
+        record['user_id'],
+        record['user_name'],
+        record['order_id'],
+        record['product_id'],
+        record['order_date'],
+        record['product_name'],
+        record['product_category'],
+    )
+
+
+def group_orders(rows, key=order_key):
+    # Key'e göre sıralı satırlardan streaming group-by: key değiştiği anda biten
+    # sipariş grubunu verir, bellekte yalnızca o anki grup tutulur
+    group = None
+    for row in rows:
+        user_id, user_name, order_id, _, order_date, product_name, product_category = row
+        row_key = key(row)
+        if group is None or row_key != group['key']:
+            if group is not None:
+                yield group
+            group = {
+                'key': row_key,
+                'user_id': user_id,
+                'user_name': user_name,
+                'order_date': order_date,
+                'order_id': order_id,
+                'products': []
+            }
+        group['products'].append({
+            'product_name': product_name,
+            'category': product_category
+        })
+    if group is not None:
+        yield group
+
+
+def document_id(group):
+    return f"{group['user_id']}_{group['order_date']}"
+
+
+def metadata_document_id(metadata):
+    # order_metadata çıktısından document_id ile aynı id (LangChain dokümanları için)
+    return f"{metadata['user_id']}_{metadata['order_date']}"
+
+
+def metadata_order_text(metadata):
+    # order_metadata çıktısından order_text ile aynı metni yeniden kurar
+    products_text = " and ".join(
+        f"{product} ({category})" for product, category in zip(metadata['products'], metadata['categories'])
+    )
+    return f"User {metadata['user_name']} ordered {products_text} on {metadata['order_date']}"
+
+
+def order_text(group):
+    products_text = " and ".join(
+        f"{p['product_name']} ({p['category']})" for p in group['products']
+    )
+    return f"User {group['user_name']} ordered {products_text} on {group['order_date']}"
+
+
+def order_metadata(group):
+    return {
+        "user_id": group['user_id'],
+        "user_name": group['user_name'],
+        "order_date": str(group['order_date']),
+        # Yalnızca tarih (YYYY-MM-DD): Pinecone filtresi gün bazında $in ile eşleşir
+        "order_day": str(group['order_date'])[:10],
+        "products": [p['product_name'] for p in group['products']],
+        "categories": [p['category'] for p in group['products']]
+    }
@@ -0,0 +1,124 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+DEFAULT_MAX_IN_FLIGHT = 4
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+
+
+class ConcurrentUpserter:
+    """Index upsert'lerini sınırlı sayıda eşzamanlı istekle gönderir.
+
+    `index` Pinecone Index ile aynı `upsert(vectors=..., namespace=...)` arayüzüne
+    sahip herhangi bir nesne olabilir, testlerde sahte bir index verilebilir.
+    """
+
+    def __init__(self, index, namespace, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF, logger=None):
+        self.index = index
+        self.namespace = namespace
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.logger = logger or logging.getLogger("ConcurrentUpserter")
+
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="upsert")
+        # submit, pencere doluysa bir batch bitene kadar bekler
+        self.window = threading.BoundedSemaphore(max_in_flight)
+        self.lock = threading.Lock()
+        self.futures = []
+        self.latencies = []
+        self.vector_count = 0
+        self.batch_count = 0
+        self.started = time.perf_counter()
+
+    def submit(self, vectors):
+        self.window.acquire()
+        # Biten batch'ler listeden düşülür; hata veren varsa hemen yükseltilir
+        pending = []
+        for future in self.futures:
+            if not future.done():
+                pending.append(future)
+            elif future.exception() is not None:
+                self.window.release()
+                raise future.exception()
+        self.futures = pending
+
+        with self.lock:
+            self.batch_count += 1
+            batch_number = self.batch_count
+        try:
+            future = self.executor.submit(self._upsert_with_retry, batch_number, vectors)
+        except Exception:
+            self.window.release()
+            raise
+        future.add_done_callback(lambda _: self.window.release())
+        self.futures.append(future)
+        return future
+
+    def _upsert_with_retry(self, batch_number, vectors):
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                self.index.upsert(vectors=vectors, namespace=self.namespace)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.logger.error(f"Batch {batch_number} failed after {attempt + 1} attempts: {e}")
+                    raise
+                delay = self.backoff * (2 ** attempt) * (1 + random.random())
+                self.logger.warning(f"Batch {batch_number} failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+
+            latency = time.perf_counter() - started
+            with self.lock:
+                self.latencies.append(latency)
+                self.vector_count += len(vectors)
+            self.logger.info(
+                f"Uploaded batch {batch_number} ({len(vectors)} vectors) in {latency * 1000:.1f} ms"
+            )
+            return latency
+
+    def stats(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            vector_count = self.vector_count
+        elapsed = time.perf_counter() - self.started
+        if not latencies:
+            return {"batches": 0, "vectors": 0, "seconds": elapsed, "vectors_per_sec": 0.0}
+        return {
+            "batches": len(latencies),
+            "vectors": vector_count,
+            "seconds": elapsed,
+            "vectors_per_sec": vector_count / elapsed if elapsed else 0.0,
+            "latency_p50_ms": latencies[len(latencies) // 2] * 1000,
+            "latency_p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+            "latency_max_ms": latencies[-1] * 1000,
+        }
+
+    def close(self):
+        # Tüm batch'lerin bitmesini bekler, başarısız olan varsa ilk hatayı yükseltir
+        try:
+            for future in self.futures:
+                future.result()
+        finally:
+            self.executor.shutdown(wait=True)
+        stats = self.stats()
+        self.logger.info(
+            f"Upsert finished: {stats['vectors']} vectors in {stats['batches']} batches, "
+            f"{stats['vectors_per_sec']:.1f} vectors/sec"
+        )
+        return stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+        return False
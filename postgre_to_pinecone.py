@@ -2,25 +2,52 @@ import psycopg2
 from pinecone import Pinecone, ServerlessSpec
 from dotenv import load_dotenv
 import os 
-from connect_db import create_connection
+from connect_db import get_pool
+from order_documents import (
+    ORDERS_QUERY, DEFAULT_ITERSIZE, DEFAULT_CHUNK_SIZE, stream_rows, iter_row_chunks,
+    group_orders, document_id, order_text, order_metadata, metadata_order_text
+)
+from embedding_cache import EmbeddingCache, encode_texts, DEFAULT_ENCODE_BATCH_SIZE
+from fingerprint_store import FingerprintStore, fingerprint
+from metadata_index import MetadataIndex
+from bm25_index import BM25Index
+from vector_store import (
+    PineconeBackend, local_vector_store, uses_pinecone, vector_backend,
+    INDEX_NAME, NAMESPACE, EMBEDDING_MODEL, EMBEDDING_DIMENSION
+)
+from pinecone_upsert import ConcurrentUpserter, DEFAULT_MAX_IN_FLIGHT
 from sentence_transformers import SentenceTransformer
-from collections import defaultdict
+import argparse
 import logging
 
-logging.basicConfig(level=logging.INFO, filename="extract_data.log", filemode="w", 
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-
+LOG_FILE = "extract_data.log"
+UPSERT_BATCH_SIZE = 100
+DELETE_BATCH_SIZE = 1000
+# Sorgu tarafı (without_langchain, RAGSystem) ve sync ile aynı model/namespace
+MODEL_NAME = EMBEDDING_MODEL
 
 
 class PineconeDataLoader:
 
-    def __init__(self):
+    def __init__(self, encode_batch_size=None, max_in_flight=None, use_cache=True):
         self.logger = logging.getLogger("PineconeDataLoader")
         load_dotenv()   
+        self.encode_batch_size = encode_batch_size or int(
+            os.getenv("ENCODE_BATCH_SIZE", DEFAULT_ENCODE_BATCH_SIZE)
+        )
+        self.max_in_flight = max_in_flight or int(
+            os.getenv("UPSERT_MAX_IN_FLIGHT", DEFAULT_MAX_IN_FLIGHT)
+        )
         try: 
-            self.model = SentenceTransformer('all-MiniLM-L12-v2')
-            self.connection = create_connection()
+            self.model = SentenceTransformer(MODEL_NAME)
+            self.cache = EmbeddingCache() if use_cache else None
+            # Parmak izleri backend başına tutulur; backend değişirse her şey yeniden yazılır
+            self.fingerprints = FingerprintStore(namespace=f"{vector_backend()}:{NAMESPACE}")
+            self.metadata_index = MetadataIndex()
+            self.keyword_index = BM25Index()
+            self.index = None
+            self.pool = get_pool()
+            self.connection = self.pool.getconn()
             self.cursor = self.connection.cursor()
             self.logger.info("Database connection succesfully")
         except Exception as e:
@@ -35,27 +62,8 @@ class PineconeDataLoader:
 
         self.logger.info("starting data fetch from PostgreSQL")
         
-        query = """
-            -- her sipariş kullanıcı ve ürün bilgileir ile birleşir
-    SELECT
-        u.user_id,
-        u.user_name AS user_name,
-        o.order_id,
-        o.product_id,
-        o.order_date,
-        p.product_name AS product_name,
-        p.category AS product_category
-    FROM
-        orders o
-    JOIN
-        users u ON o.user_id = u.user_id
-    JOIN
-        products p ON o.product_id = p.product_id
-    ORDER BY 
-        o.order_date DESC;
-            """
         try:
-            self.cursor.execute(query)
+            self.cursor.execute(ORDERS_QUERY)
             data = self.cursor.fetchall()
             self.logger.info(f"Successfully retrieved {len(data)} records from database")
             return data
@@ -63,102 +71,122 @@ class PineconeDataLoader:
             self.logger.error(f"Error retrieving data from database: {e}")
             raise
         finally:
-            self.connection.close()
+            self.release_connection()
+
+    def release_connection(self):
+        # Bağlantı havuza bir kez geri verilir, tekrar çağrılması zararsızdır
+        if self.connection is not None:
+            self.cursor.close()
+            self.pool.putconn(self.connection)
+            self.connection = None
+
+    def stream_data_from_postgres(self, itersize=DEFAULT_ITERSIZE):
+        # fetchall yerine satırları server-side cursor ile parça parça üretir
+        self.logger.info(f"starting streaming data fetch from PostgreSQL (itersize={itersize})")
+        row_count = 0
+        try:
+            for row in stream_rows(self.connection, ORDERS_QUERY, itersize):
+                row_count += 1
+                yield row
+            self.logger.info(f"Successfully streamed {row_count} records from database")
+        except Exception as e:
+            self.logger.error(f"Error streaming data from database: {e}")
+            raise
+        finally:
+            self.release_connection()
 
     def create_embeddings(self, data):
-        embedding_list = []
+        ids = []
+        texts = []
+        metadata_list = []
 
-        grouped_orders = defaultdict(list)
         try:
-            for row in data:
-                user_id, user_name, _, _, order_date, product_name, product_category = row
-                key = (user_id, order_date)
-
-                if key not in grouped_orders:
-                    grouped_orders[key] = {
-                        'user_name': user_name,  # Kullanıcı adı ekleniyor
-                        'products': []          # Ürünler için boş liste
-                    }
-
-            # Ürün bilgisi ekleniyor
-                grouped_orders[key]['products'].append({
-                    'product_name': product_name,
-                    'category': product_category
-                })
-            self.logger.info(f"Grouped {len(grouped_orders)} unique user-date combinations")
-
-            for (user_id, order_date), details in grouped_orders.items():
-                products = details["products"]
-                user_name = details['user_name']
-                
-                
-                # Ürün bilgilerini birleştir, sadece dict olanları al
-                products_text = " and ".join([
-                    f"{p['product_name']} ({p['category']})"
-                    for p in products if isinstance(p, dict)
-                ])
-
-                text = f"User {user_name} ordered {products_text} on {order_date}"
-
-                #print(text)
-
-                embedding = self.model.encode(text)
-                
-                # Metadata hazırla
-                metadata = {
-                    "user_id": user_id,
-                    "user_name": user_name,
-                    "order_date": str(order_date),
-                    "products": [p['product_name'] for p in products if isinstance(p, dict)],
-                    "categories": [p['category'] for p in products if isinstance(p, dict)]
-                }
-                # print(metadata)
-
-                unique_id = f"{user_id}_{order_date}"
-                embedding_list.append((unique_id, embedding.tolist(), metadata))
-            
-            self.logger.info(f"Successfully created {len(embedding_list)} embeddings")
-            return embedding_list
+            # Metin ve metadata tek geçişte hazırlanır, encode işlemi sonra toplu yapılır
+            for group in group_orders(data):
+                ids.append(document_id(group))
+                texts.append(order_text(group))
+                metadata_list.append(order_metadata(group))
+            self.logger.info(f"Grouped {len(ids)} unique user-date combinations")
+
+            if self.fingerprints.run_id is not None:
+                # Son run'dan beri içeriği değişmeyen dokümanlar encode/upsert edilmez
+                fingerprints = [fingerprint(text, metadata) for text, metadata in zip(texts, metadata_list)]
+                changed = self.fingerprints.diff(ids, fingerprints)
+                self.logger.info(f"{len(changed)} of {len(ids)} documents are new or changed")
+                ids = [ids[i] for i in changed]
+                texts = [texts[i] for i in changed]
+                metadata_list = [metadata_list[i] for i in changed]
+
+            embeddings = encode_texts(self.model, texts, self.encode_batch_size, self.cache)
+
+            self.logger.info(
+                f"Successfully created {len(ids)} embeddings "
+                f"(batch size {self.encode_batch_size})"
+            )
+            return ids, embeddings, metadata_list
         
         except Exception as e:
             self.logger.error(f"Error creating embeddings: {e}")
             raise
                 
 
-    def upload_to_pinecone(self, embeddings):
-        self.logger.info("Starting Pinecone upload process")
-        try:
-
-            pinecone_api_key = os.getenv("PINECONE_API_KEY")
-            if not pinecone_api_key:
-                raise ValueError("PINECONE_API_KEY not found in environment variables")
-            
-            pc = Pinecone(api_key=pinecone_api_key)
-            index_name= "ecommerce-2"
-
-            if index_name not in pc.list_indexes().names():
-                pc.create_index(
-                    name=index_name,
-                    dimension=384,  # Burada embedding boyutuna uygun 384 kullanılıyor
-                    spec=ServerlessSpec(
-                        cloud="aws",
-                        region="us-east-1"
-                    )
-                )
-            self.logger.info(f"Successfully created index '{index_name}'")
+    def get_index(self):
+        if self.index is not None:
+            return self.index
 
-            index= pc.Index(index_name)
+        if not uses_pinecone():
+            # Pinecone yerine process içi, diske kalıcı index (local: exact, ann: IVF-PQ)
+            self.index = local_vector_store(INDEX_NAME, self.model.get_sentence_embedding_dimension())
+            self.logger.info(f"Using local vector index at '{self.index.root}'")
+            return self.index
 
-            batch_size=100
-            total_batches = (len(embeddings) + batch_size - 1) // batch_size
+        pinecone_api_key = os.getenv("PINECONE_API_KEY")
+        if not pinecone_api_key:
+            raise ValueError("PINECONE_API_KEY not found in environment variables")
+        
+        pc = Pinecone(api_key=pinecone_api_key)
+        index_name= INDEX_NAME
+
+        if index_name not in pc.list_indexes().names():
+            pc.create_index(
+                name=index_name,
+                dimension=EMBEDDING_DIMENSION,
+                spec=ServerlessSpec(
+                    cloud="aws",
+                    region="us-east-1"
+                )
+            )
+        self.logger.info(f"Successfully created index '{index_name}'")
+
+        self.index = PineconeBackend(pc.Index(index_name))
+        return self.index
+
+    def create_upserter(self):
+        return ConcurrentUpserter(
+            self.get_index(),
+            namespace=NAMESPACE,
+            max_in_flight=self.max_in_flight,
+            logger=self.logger
+        )
+
+    def upload_to_pinecone(self, ids, embeddings, metadata_list, upserter=None):
+        # upserter verilirse batch'ler kuyruğa atılıp hemen dönülür, böylece çağıran
+        # taraf bir sonraki chunk'ı encode ederken upload arka planda sürer
+        self.logger.info("Starting Pinecone upload process")
+        owns_upserter = upserter is None
+        try:
+            if owns_upserter:
+                upserter = self.create_upserter()
 
-            for i in range(0,len(embeddings), batch_size):
-                batch = embeddings[i:i + batch_size]
-                index.upsert(vectors=batch, namespace="e-commerce")
-                current_batch = (i // batch_size) + 1
-                self.logger.info(f"Uploaded batch {current_batch}/{total_batches}")
+            for i in range(0,len(ids), UPSERT_BATCH_SIZE):
+                # float32 matris her batch için tek seferde listeye çevrilir
+                values = embeddings[i:i + UPSERT_BATCH_SIZE].tolist()
+                batch = list(zip(ids[i:i + UPSERT_BATCH_SIZE], values, metadata_list[i:i + UPSERT_BATCH_SIZE]))
+                upserter.submit(batch)
 
-            self.logger.info("Successfully completed Pinecone upload")
+            if owns_upserter:
+                stats = upserter.close()
+                self.logger.info(f"Successfully completed Pinecone upload: {stats}")
 
         except Exception as e:
             self.logger.error(f"Error uploading to Pinecone: {e}")
@@ -166,17 +194,72 @@ class PineconeDataLoader:
 
 
 
-def main():
+    def delete_from_pinecone(self, ids):
+        index = self.get_index()
+        for i in range(0, len(ids), DELETE_BATCH_SIZE):
+            index.delete(ids=ids[i:i + DELETE_BATCH_SIZE], namespace=NAMESPACE)
+        self.logger.info(f"Deleted {len(ids)} vanished vectors from Pinecone")
+
+
+
+def run_pipeline(loader, rows, chunk_size=DEFAULT_CHUNK_SIZE, incremental=True):
+    # grouping -> embedding -> upsert aşamaları chunk chunk ilerler; chunk N'in
+    # upload'u arka planda sürerken chunk N+1 encode edilir
+    total = 0
+    loader.fingerprints.begin_run(force=not incremental)
+
+    upserter = loader.create_upserter()
+    with upserter:
+        for chunk in iter_row_chunks(rows, chunk_size):
+            ids, embeddings, metadata_list = loader.create_embeddings(chunk)
+            loader.upload_to_pinecone(ids, embeddings, metadata_list, upserter)
+            loader.metadata_index.add(ids, metadata_list)
+            loader.keyword_index.add(ids, [metadata_order_text(m) for m in metadata_list])
+            total += len(ids)
+            loader.logger.info(f"Queued {total} documents for Pinecone so far")
+    loader.logger.info(f"Pipeline finished: {upserter.stats()}")
+    loader.get_index().flush()
+
+    # Parmak izleri yalnızca tüm upsert'ler başarılı olduktan sonra kalıcı olur
+    vanished = loader.fingerprints.finish_run()
+    if vanished:
+        loader.delete_from_pinecone(vanished)
+        loader.get_index().flush()
+        loader.metadata_index.remove(vanished)
+        loader.keyword_index.remove(vanished)
+        loader.fingerprints.forget(vanished)
+    return total
+
+
+def main(stream=False, itersize=DEFAULT_ITERSIZE, chunk_size=DEFAULT_CHUNK_SIZE, use_cache=True, incremental=True):
     try:
-        loader = PineconeDataLoader()
-        
-        data = loader.fetch_data_from_postgres()
-        embeddings = loader.create_embeddings(data)
-        loader.upload_to_pinecone(embeddings)
+        loader = PineconeDataLoader(use_cache=use_cache)
+
+        if stream:
+            rows = loader.stream_data_from_postgres(itersize)
+        else:
+            rows = loader.fetch_data_from_postgres()
+        run_pipeline(loader, rows, chunk_size, incremental)
         
     except Exception as e:
         logging.error(f"Pipeline failed: {e}")
         raise
 
+def configure_logging():
+    # Yalnızca script olarak çalışınca kurulur; import eden modüller log dosyasını sıfırlamaz
+    logging.basicConfig(level=logging.INFO, filename=LOG_FILE, filemode="w",
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    configure_logging()
+    parser = argparse.ArgumentParser(description="PostgreSQL -> Pinecone ingestion")
+    parser.add_argument("--stream", action="store_true", help="server-side cursor ile akış modunda çalış")
+    parser.add_argument("--itersize", type=int, default=DEFAULT_ITERSIZE)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--no-cache", action="store_true", help="embedding cache'ini kullanma")
+    parser.add_argument("--full", action="store_true", help="parmak izlerini yok say, tüm vektörleri yeniden yaz")
+    args = parser.parse_args()
+
+    main(stream=args.stream, itersize=args.itersize, chunk_size=args.chunk_size,
+         use_cache=not args.no_cache, incremental=not args.full)
\ No newline at end of file
@@ -0,0 +1,96 @@
+from collections import OrderedDict
+import logging
+import os
+import threading
+import time
+
+
+DEFAULT_MAX_SIZE = 1024
+DEFAULT_TTL = 3600
+
+
+class LRUCache:
+    """Boyut sınırlı, TTL'li, thread-safe LRU cache; hit/miss sayaçlarını tutar."""
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if self.ttl is None or expires_at > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+def normalize_query(query):
+    return " ".join(query.split())
+
+
+class QueryEmbeddingCache:
+    """Sorgu embedding'leri için LRU cache; aynı soru tekrar encode edilmez."""
+
+    def __init__(self, max_size=None, ttl=None):
+        self.logger = logging.getLogger("QueryEmbeddingCache")
+        self.cache = LRUCache(
+            max_size=max_size or int(os.getenv("QUERY_CACHE_SIZE", DEFAULT_MAX_SIZE)),
+            ttl=ttl or float(os.getenv("QUERY_CACHE_TTL", DEFAULT_TTL)),
+        )
+
+    def get_or_compute(self, query, encode_fn):
+        key = normalize_query(query)
+        vector = self.cache.get(key)
+        if vector is not None:
+            self.logger.info("Query embedding cache hit")
+            return vector
+        vector = encode_fn(key)
+        self.cache.put(key, vector)
+        return vector
+
+    def get_or_compute_many(self, queries, encode_many_fn):
+        # Cache'te olmayan sorgular tek bir batch'te encode edilir (async engine micro-batch'leri)
+        keys = [normalize_query(query) for query in queries]
+        vectors = [self.cache.get(key) for key in keys]
+        missing = list(dict.fromkeys(key for key, vector in zip(keys, vectors) if vector is None))
+        if missing:
+            computed = dict(zip(missing, encode_many_fn(missing)))
+            for key, vector in computed.items():
+                self.cache.put(key, vector)
+            vectors = [vector if vector is not None else computed[key] for key, vector in zip(keys, vectors)]
+        return vectors
+
+    def stats(self):
+        return self.cache.stats()
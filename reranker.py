@@ -0,0 +1,95 @@
+import logging
+import os
+import threading
+import time
+
+from sentence_transformers import CrossEncoder
+
+
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+DEFAULT_TOP_N = 10
+DEFAULT_BATCH_SIZE = 16
+DEFAULT_BUDGET_MS = 300
+
+
+class Reranker:
+    """Vektör aramasından gelen adayları CPU'da küçük bir cross-encoder ile yeniden sıralar.
+
+    Adaylar batch'ler halinde skorlanır ve en iyi `top_n` tanesi döner. Toplam süre
+    `budget_ms`'yi aşacaksa (bir sonraki batch'in tahmini süresi dahil) skorlama
+    bırakılır ve vektör sırasındaki ilk `top_n` aday kullanılır.
+    """
+
+    def __init__(self, model_name=None, top_n=None, batch_size=None, budget_ms=None):
+        self.logger = logging.getLogger("Reranker")
+        self.model_name = model_name or os.getenv("RERANK_MODEL", DEFAULT_RERANK_MODEL)
+        self.top_n = top_n or int(os.getenv("RERANK_TOP_N", DEFAULT_TOP_N))
+        self.batch_size = batch_size or int(os.getenv("RERANK_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+        self.budget_ms = budget_ms or float(os.getenv("RERANK_BUDGET_MS", DEFAULT_BUDGET_MS))
+        self.model = CrossEncoder(self.model_name, device="cpu")
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.fallbacks = 0
+        self.total_ms = 0.0
+
+    def rerank(self, query, candidates, text=lambda candidate: candidate, top_n=None):
+        # candidates vektör skoruna göre sıralı olmalı; text adaydan metni çıkarır
+        top_n = top_n or self.top_n
+        if len(candidates) <= top_n:
+            return list(candidates)
+
+        started = time.perf_counter()
+        scores = []
+        for start in range(0, len(candidates), self.batch_size):
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            batches_done = start // self.batch_size
+            if batches_done and elapsed_ms + elapsed_ms / batches_done > self.budget_ms:
+                return self._fallback(candidates, top_n, elapsed_ms)
+            batch = candidates[start:start + self.batch_size]
+            scores.extend(self.model.predict(
+                [(query, text(candidate)) for candidate in batch],
+                batch_size=self.batch_size,
+                show_progress_bar=False
+            ))
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms > self.budget_ms:
+            # Son batch bütçeyi aştı; skorlar hazır olduğu için yine de kullanılır
+            self.logger.warning(f"Re-rank took {elapsed_ms:.0f}ms (budget {self.budget_ms:.0f}ms)")
+        self._record(elapsed_ms, fallback=False)
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+        return [candidates[i] for i in order[:top_n]]
+
+    def _fallback(self, candidates, top_n, elapsed_ms):
+        self.logger.warning(
+            f"Re-rank budget of {self.budget_ms:.0f}ms exceeded after {elapsed_ms:.0f}ms, using vector order"
+        )
+        self._record(elapsed_ms, fallback=True)
+        return list(candidates[:top_n])
+
+    def _record(self, elapsed_ms, fallback):
+        with self.lock:
+            self.calls += 1
+            self.fallbacks += fallback
+            self.total_ms += elapsed_ms
+
+    def stats(self):
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "fallbacks": self.fallbacks,
+                "avg_ms": self.total_ms / self.calls if self.calls else 0.0,
+            }
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    # Model yalnızca re-rank ilk kez istendiğinde yüklenir
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = Reranker()
+        return _reranker
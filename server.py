@@ -0,0 +1,172 @@
+import argparse
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+from async_engine import StageTimeout
+from metadata_index import DEFAULT_MAX_FILTERED_RESULTS
+
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+DEFAULT_MAX_PENDING = 256
+DEFAULT_EXECUTOR_THREADS = 16
+QPS_WINDOW = 60
+
+logger = logging.getLogger("server")
+
+
+class QueryRequest(BaseModel):
+    question: str
+    top_k: int = Field(100, ge=1, le=int(os.getenv("FILTER_MAX_RESULTS", DEFAULT_MAX_FILTERED_RESULTS)))
+    hybrid: bool = False
+    rerank: bool = False
+
+    def search_options(self):
+        return {"top_k": self.top_k, "hybrid": self.hybrid, "rerank": self.rerank}
+
+
+class ServerState:
+    """Uzun ömürlü servis durumu: engine, eşzamanlılık sınırı ve QPS sayaçları."""
+
+    def __init__(self, rag, max_pending=None):
+        self.rag = rag
+        self.max_pending = max_pending or int(os.getenv("SERVER_MAX_PENDING", DEFAULT_MAX_PENDING))
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("SERVER_EXECUTOR_THREADS", DEFAULT_EXECUTOR_THREADS))
+        )
+        # Tüm istekler tek engine'i (ve tek embedding batch kuyruğunu) paylaşır; top_k/hybrid/rerank
+        # istek başına arama aşamasına verilir. stream=True: /query cevabı birleştirir,
+        # /query/stream token olaylarını iletir
+        self.engine = rag.create_engine(stream=True, executor=self.executor)
+        self.started_at = time.monotonic()
+        self.in_flight = 0
+        self.requests = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.completions = deque()
+
+    def admit(self):
+        # Kuyruk doluysa bekletmek yerine 503 ile reddedilir; load balancer başka instance'a yönlendirir
+        self.requests += 1
+        if self.in_flight >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Server busy", headers={"Retry-After": "1"})
+        self.in_flight += 1
+
+    def release(self, ok):
+        self.in_flight -= 1
+        if ok:
+            self.completed += 1
+            now = time.monotonic()
+            self.completions.append(now)
+            while self.completions and self.completions[0] < now - QPS_WINDOW:
+                self.completions.popleft()
+        else:
+            self.failed += 1
+
+    def health(self):
+        uptime = time.monotonic() - self.started_at
+        now = time.monotonic()
+        recent = sum(1 for t in self.completions if t >= now - QPS_WINDOW)
+        return {
+            "status": "ok",
+            "uptime_s": round(uptime, 1),
+            "in_flight": self.in_flight,
+            "max_pending": self.max_pending,
+            "requests": self.requests,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "qps_1m": round(recent / min(uptime, QPS_WINDOW), 2) if uptime else 0.0,
+            "engine": self.engine.stats(),
+        }
+
+    async def close(self):
+        await self.engine.close()
+        self.executor.shutdown(wait=False)
+
+
+def serialize_documents(documents):
+    return [{"id": doc["id"], "score": doc["score"], "metadata": doc["metadata"]} for doc in documents]
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Model, index ve cache'ler process başına bir kez, ilk istekten önce yüklenir
+    import without_langchain as rag
+    rag.embed_queries(["warm up"])
+    app.state.server = ServerState(rag)
+    logger.info("Model loaded, server ready")
+    yield
+    await app.state.server.close()
+
+
+app = FastAPI(title="RAG e-commerce", lifespan=lifespan)
+
+
+@app.get("/health")
+async def health():
+    return app.state.server.health()
+
+
+@app.post("/query")
+async def query(request: QueryRequest):
+    state = app.state.server
+    state.admit()
+    ok = False
+    try:
+        result = await state.engine.query(request.question, **request.search_options())
+        ok = True
+        return {
+            "answer": result["answer"],
+            "documents": serialize_documents(result["documents"]),
+            "timings_ms": result["timings_ms"],
+        }
+    except StageTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    finally:
+        state.release(ok)
+
+
+@app.post("/query/stream")
+async def query_stream(request: QueryRequest):
+    # NDJSON: önce getirilen dokümanlar, sonra LLM token'ları, en son tam cevap; her olay ayrı bir satır
+    state = app.state.server
+    state.admit()
+
+    async def events():
+        ok = False
+        try:
+            async for event in state.engine.stream(request.question, **request.search_options()):
+                if event["event"] == "documents":
+                    event = {**event, "documents": serialize_documents(event["documents"])}
+                yield json.dumps(event, default=str) + "\n"
+            ok = True
+        except Exception as e:
+            logger.error(f"Streaming query failed: {e}")
+            yield json.dumps({"event": "error", "error": str(e)}) + "\n"
+        finally:
+            state.release(ok)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RAG e-commerce HTTP service")
+    parser.add_argument("--host", default=os.getenv("SERVER_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SERVER_PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=1, help="process sayısı (her biri modeli bir kez yükler)")
+    args = parser.parse_args()
+
+    uvicorn.run("server:app", host=args.host, port=args.port, workers=args.workers)
@@ -0,0 +1,95 @@
+import logging
+import time
+
+
+logger = logging.getLogger("TokenStream")
+
+
+def openai_deltas(chunks):
+    # ChatCompletion.create(stream=True) parçalarından içerik token'larını çıkarır
+    for chunk in chunks:
+        content = chunk['choices'][0]['delta'].get('content')
+        if content:
+            yield content
+
+
+async def aopenai_deltas(chunks):
+    async for chunk in chunks:
+        content = chunk['choices'][0]['delta'].get('content')
+        if content:
+            yield content
+
+
+class TokenStream:
+    """LLM token akışını sarar: token'ları geldikçe verir, time-to-first-token ve
+    toplam süreyi ölçer; akış bitince tam metin `on_complete` ile bildirilir
+    (ör. answer cache'e yazmak için).
+
+    Süre ölçümü nesne oluşturulduğu anda başlar, bu yüzden LLM isteğinden hemen
+    önce oluşturulmalıdır.
+    """
+
+    def __init__(self, tokens, on_complete=None):
+        self.tokens = tokens
+        self.on_complete = on_complete
+        self.started = time.perf_counter()
+        self.ttft_ms = None
+        self.total_ms = None
+        self.parts = []
+
+    @classmethod
+    def of(cls, text):
+        # Cache'ten gelen ya da sabit cevaplar da aynı arayüzle akıtılır
+        return cls(iter([text]))
+
+    def _record(self, token):
+        if self.ttft_ms is None:
+            self.ttft_ms = (time.perf_counter() - self.started) * 1000
+        self.parts.append(token)
+
+    def _finish(self):
+        self.total_ms = (time.perf_counter() - self.started) * 1000
+        logger.info(f"Streamed {len(self.parts)} chunks, ttft={self.ttft_ms or 0:.0f}ms total={self.total_ms:.0f}ms")
+        if self.on_complete is not None:
+            self.on_complete(self.text)
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+    def __iter__(self):
+        for token in self.tokens:
+            if token:
+                self._record(token)
+                yield token
+        self._finish()
+
+    def read(self):
+        for _ in self:
+            pass
+        return self.text
+
+    def stats(self):
+        return {"ttft_ms": self.ttft_ms, "total_ms": self.total_ms, "chunks": len(self.parts)}
+
+
+class AsyncTokenStream(TokenStream):
+    """TokenStream'in async iterator (ör. ChatCompletion.acreate(stream=True)) karşılığı."""
+
+    @classmethod
+    def of(cls, text):
+        async def single():
+            yield text
+        return cls(single())
+
+    async def __aiter__(self):
+        async for token in self.tokens:
+            if token:
+                self._record(token)
+                yield token
+        self._finish()
+
+    async def aread(self):
+        async for _ in self:
+            pass
+        return self.text
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modüller repo kökünde; testler hangi dizinden çalıştırılırsa çalıştırılsın import edilebilsin
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,115 @@
+import pytest
+
+import answer_cache
+from answer_cache import SemanticAnswerCache, documents_key
+from metadata_index import MetadataIndex
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(answer_cache.time, "monotonic", clock)
+    return clock
+
+
+def test_hit_requires_similarity_and_same_documents(clock):
+    cache = SemanticAnswerCache(threshold=0.9, max_size=10, ttl=60)
+    cache.store([1.0, 0.0], "docs-a", "answer")
+    assert cache.lookup([0.99, 0.05], "docs-a") == "answer"
+    assert cache.lookup([0.0, 1.0], "docs-a") is None
+    assert cache.lookup([1.0, 0.0], "docs-b") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_explicit_zero_threshold_is_kept(monkeypatch):
+    monkeypatch.setenv("ANSWER_CACHE_THRESHOLD", "0.5")
+    assert SemanticAnswerCache(threshold=0).threshold == 0
+
+
+def test_expired_entries_are_pruned_and_size_decremented(clock):
+    cache = SemanticAnswerCache(threshold=0.9, max_size=10, ttl=60)
+    cache.store([1.0, 0.0], "docs-a", "old")
+    clock.now += 30
+    cache.store([0.0, 1.0], "docs-a", "fresh")
+    cache.store([1.0, 0.0], "docs-b", "other")
+    clock.now += 40
+    assert cache.lookup([1.0, 0.0], "docs-a") is None
+    assert cache.size == 2
+    assert cache.lookup([0.0, 1.0], "docs-a") == "fresh"
+    clock.now += 60
+    assert cache.lookup([1.0, 0.0], "docs-b") is None
+    assert "docs-b" not in cache.entries
+    assert cache.size == 1
+
+
+def test_eviction_drops_oldest_entry(clock):
+    cache = SemanticAnswerCache(threshold=0.9, max_size=2, ttl=60)
+    for i, key in enumerate(["first", "second", "third"]):
+        cache.store([1.0, 0.0], key, key)
+        clock.now += 1
+    assert cache.size == 2
+    assert sum(len(entries) for entries in cache.entries.values()) == 2
+    assert cache.lookup([1.0, 0.0], "first") is None
+    assert cache.lookup([1.0, 0.0], "third") == "third"
+
+
+def test_eviction_after_expiry_keeps_live_entries(clock):
+    # Süresi dolan girdiler size'dan düşülmezse eviction gereksiz yere canlı girdileri siler
+    cache = SemanticAnswerCache(threshold=0.9, max_size=2, ttl=10)
+    cache.store([1.0, 0.0], "a", "a")
+    cache.store([1.0, 0.0], "b", "b")
+    clock.now += 20
+    cache.lookup([1.0, 0.0], "a")
+    cache.lookup([1.0, 0.0], "b")
+    assert cache.size == 0
+    cache.store([1.0, 0.0], "c", "c")
+    cache.store([1.0, 0.0], "d", "d")
+    assert cache.lookup([1.0, 0.0], "c") == "c"
+    assert cache.lookup([1.0, 0.0], "d") == "d"
+
+
+def test_invalidate_by_document_ids(clock):
+    cache = SemanticAnswerCache(threshold=0.9, max_size=10, ttl=60)
+    cache.store([1.0, 0.0], "a", "uses 1", ids=["doc-1", "doc-2"])
+    cache.store([0.0, 1.0], "a", "uses 3", ids=["doc-3"])
+    cache.invalidate(["doc-2"])
+    assert cache.size == 1
+    assert cache.lookup([1.0, 0.0], "a") is None
+    assert cache.lookup([0.0, 1.0], "a") == "uses 3"
+    cache.invalidate()
+    assert cache.size == 0
+    assert cache.entries == {}
+
+
+def test_follow_invalidates_changed_documents(clock, tmp_path, monkeypatch):
+    feed = MetadataIndex(str(tmp_path / "metadata.sqlite"))
+    feed.add(["doc-1", "doc-2"], [{"user_name": "Ann"}, {"user_name": "Bob"}])
+    cache = SemanticAnswerCache(threshold=0.9, max_size=10, ttl=60)
+    cache.follow(feed)
+    cache.store([1.0, 0.0], "a", "one", ids=["doc-1"])
+    cache.store([0.0, 1.0], "a", "two", ids=["doc-2"])
+    feed.add(["doc-1"], [{"user_name": "Ann Lee"}])
+    cache.follow(feed)
+    assert cache.lookup([1.0, 0.0], "a") is None
+    assert cache.lookup([0.0, 1.0], "a") == "two"
+    # Akış budanmışsa hangi dokümanların değiştiği bilinmez, tüm cache silinir
+    monkeypatch.setattr("metadata_index.CHANGE_FEED_SIZE", 1)
+    feed.remove(["doc-1"])
+    feed.remove(["doc-3"])
+    cache.follow(feed)
+    assert cache.size == 0
+    feed.close()
+
+
+def test_documents_key_depends_on_metadata():
+    assert documents_key([("a", {"x": 1}), ("b", {})]) == documents_key([("b", {}), ("a", {"x": 1})])
+    assert documents_key([("a", {"x": 1})]) != documents_key([("a", {"x": 2})])
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from async_engine import AsyncQueryEngine, StageTimeout
+
+
+class FakeEncoder:
+    """encode_many yerine geçer: her çağrının batch boyutunu kaydeder."""
+
+    def __init__(self, fail=False, delay=0.0):
+        self.fail = fail
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.batches = []
+
+    def __call__(self, texts):
+        with self.lock:
+            self.batches.append(list(texts))
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("encoder down")
+        return [[float(len(text))] for text in texts]
+
+
+def search(question, vector, top_k=2):
+    return [f"{question}:{vector[0]:.0f}"] * top_k
+
+
+async def answer(question, documents):
+    return f"{question} -> {len(documents)}"
+
+
+def engine(encoder, **options):
+    options.setdefault("max_batch_size", 4)
+    options.setdefault("max_wait_ms", 50)
+    return AsyncQueryEngine(encoder, search, answer, **options)
+
+
+def test_concurrent_queries_are_micro_batched():
+    encoder = FakeEncoder()
+
+    async def run():
+        async with engine(encoder) as query_engine:
+            results = await query_engine.query_many([f"q{i}" for i in range(10)])
+            return results, query_engine.stats()["embedding"]
+
+    results, stats = asyncio.run(run())
+    assert [result["answer"] for result in results] == [f"q{i} -> 2" for i in range(10)]
+    assert sorted(len(batch) for batch in encoder.batches) == [2, 4, 4]
+    assert sorted(text for batch in encoder.batches for text in batch) == sorted(f"q{i}" for i in range(10))
+    assert stats["requests"] == 10
+    assert stats["batches"] == 3
+
+
+def test_partial_batch_is_flushed_after_max_wait():
+    encoder = FakeEncoder()
+
+    async def run():
+        async with engine(encoder, max_batch_size=32, max_wait_ms=20) as query_engine:
+            started = time.perf_counter()
+            result = await query_engine.query("lonely")
+            return result, time.perf_counter() - started
+
+    result, elapsed = asyncio.run(run())
+    assert encoder.batches == [["lonely"]]
+    assert result["documents"] == ["lonely:6", "lonely:6"]
+    assert elapsed < 1
+
+
+def test_encoder_failure_fails_every_request_in_batch():
+    encoder = FakeEncoder(fail=True)
+
+    async def run():
+        async with engine(encoder) as query_engine:
+            return await query_engine.query_many(["a", "b", "c"])
+
+    results = asyncio.run(run())
+    assert len(encoder.batches) == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_per_request_search_options():
+    async def run():
+        async with engine(FakeEncoder()) as query_engine:
+            return await query_engine.query("q", top_k=5)
+
+    assert len(asyncio.run(run())["documents"]) == 5
+
+
+def test_embed_timeout_raises_stage_timeout():
+    encoder = FakeEncoder(delay=0.3)
+
+    async def run():
+        async with engine(encoder, embed_timeout=0.05) as query_engine:
+            return await query_engine.query("slow")
+
+    with pytest.raises(StageTimeout) as raised:
+        asyncio.run(run())
+    assert raised.value.stage == "embed"
+
+
+def test_search_timeout_raises_stage_timeout():
+    async def slow_search(question, vector):
+        await asyncio.sleep(1)
+
+    async def run():
+        query_engine = AsyncQueryEngine(FakeEncoder(), slow_search, answer, search_timeout=0.05, max_wait_ms=1)
+        async with query_engine:
+            return await query_engine.query("q")
+
+    with pytest.raises(StageTimeout) as raised:
+        asyncio.run(run())
+    assert raised.value.stage == "search"
@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+from pinecone_upsert import ConcurrentUpserter
+
+
+class FakeIndex:
+    """Pinecone Index yerine geçer: eşzamanlı upsert sayısını ölçer, istenirse bekletir ya da hata verir."""
+
+    def __init__(self, fail_times=0, gate=None):
+        self.fail_times = fail_times
+        self.gate = gate
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.calls = 0
+        self.upserted = []
+
+    def upsert(self, vectors, namespace):
+        with self.lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            fail = self.calls <= self.fail_times
+        try:
+            if self.gate is not None:
+                self.gate.wait(5)
+            else:
+                time.sleep(0.01)
+            if fail:
+                raise RuntimeError("upsert failed")
+            with self.lock:
+                self.upserted.extend(vectors)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def batches(count, size=3):
+    return [[(f"{b}-{i}", [0.0], {}) for i in range(size)] for b in range(count)]
+
+
+def test_uploads_all_batches_within_window():
+    index = FakeIndex()
+    with ConcurrentUpserter(index, "ns", max_in_flight=2) as upserter:
+        for batch in batches(8):
+            upserter.submit(batch)
+    assert len(index.upserted) == 24
+    assert index.max_active <= 2
+    assert upserter.stats()["batches"] == 8
+
+
+def test_submit_blocks_while_window_is_full():
+    gate = threading.Event()
+    index = FakeIndex(gate=gate)
+    upserter = ConcurrentUpserter(index, "ns", max_in_flight=2)
+    submitted = []
+
+    def producer():
+        for batch in batches(3):
+            upserter.submit(batch)
+            submitted.append(batch)
+
+    thread = threading.Thread(target=producer)
+    thread.start()
+    time.sleep(0.2)
+    # İki batch uçuşta, üçüncü submit pencere açılana kadar bekler
+    assert len(submitted) == 2
+    gate.set()
+    thread.join(5)
+    assert len(submitted) == 3
+    upserter.close()
+    assert index.max_active <= 2
+
+
+def test_retries_transient_failures():
+    index = FakeIndex(fail_times=2)
+    with ConcurrentUpserter(index, "ns", max_in_flight=1, max_retries=3, backoff=0) as upserter:
+        upserter.submit(batches(1)[0])
+    assert index.calls == 3
+    assert len(index.upserted) == 3
+
+
+def test_failed_batch_is_raised_on_next_submit():
+    index = FakeIndex(fail_times=100)
+    upserter = ConcurrentUpserter(index, "ns", max_in_flight=2, max_retries=1, backoff=0)
+    future = upserter.submit(batches(1)[0])
+    with pytest.raises(RuntimeError):
+        future.result(5)
+    with pytest.raises(RuntimeError):
+        upserter.submit(batches(1)[0])
+    # Hata yükseltilirken alınan pencere hakkı geri verilmiş olmalı
+    assert upserter.window.acquire(timeout=1)
+    upserter.window.release()
+    with pytest.raises(RuntimeError):
+        upserter.close()
+
+
+def test_close_raises_first_failure():
+    index = FakeIndex(fail_times=1)
+    upserter = ConcurrentUpserter(index, "ns", max_in_flight=2, max_retries=0, backoff=0)
+    for batch in batches(2):
+        upserter.submit(batch)
+    with pytest.raises(RuntimeError, match="upsert failed"):
+        upserter.close()
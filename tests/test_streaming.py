@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from async_engine import AsyncQueryEngine, StageTimeout
+from streaming import AsyncTokenStream, TokenStream, openai_deltas
+
+
+def chunk(content):
+    return {"choices": [{"delta": {"content": content} if content is not None else {}}]}
+
+
+def test_token_stream_reports_complete_text():
+    completed = []
+    stream = TokenStream(openai_deltas([chunk("Hel"), chunk(None), chunk("lo")]), on_complete=completed.append)
+    assert list(stream) == ["Hel", "lo"]
+    assert completed == ["Hello"]
+    stats = stream.stats()
+    assert stats["chunks"] == 2
+    assert stats["ttft_ms"] is not None and stats["total_ms"] >= stats["ttft_ms"]
+
+
+def test_abandoned_token_stream_is_not_completed():
+    # İstemci akışı yarıda bırakırsa yarım cevap on_complete'e (answer cache'e) gitmez
+    completed = []
+    stream = TokenStream(iter(["a", "b", "c"]), on_complete=completed.append)
+    iterator = iter(stream)
+    assert next(iterator) == "a"
+    iterator.close()
+    assert completed == []
+    assert stream.total_ms is None
+    assert stream.text == "a"
+
+
+def test_cancelled_async_token_stream_is_not_completed():
+    completed = []
+    closed = []
+
+    async def tokens():
+        try:
+            yield "first"
+            await asyncio.sleep(10)
+            yield "never"
+        finally:
+            closed.append(True)
+
+    async def run():
+        stream = AsyncTokenStream(tokens(), on_complete=completed.append)
+        task = asyncio.ensure_future(stream.aread())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return stream
+
+    stream = asyncio.run(run())
+    assert stream.text == "first"
+    assert completed == []
+    assert closed == [True]
+
+
+def test_async_token_stream_of_text():
+    assert asyncio.run(AsyncTokenStream.of("cached").aread()) == "cached"
+
+
+def streaming_engine(tokens, llm_timeout):
+    async def answer(question, documents):
+        return tokens()
+
+    return AsyncQueryEngine(
+        lambda texts: [[1.0] for _ in texts], lambda question, vector: ["doc"], answer,
+        llm_timeout=llm_timeout, max_wait_ms=1,
+    )
+
+
+def test_engine_stream_yields_tokens_then_answer():
+    async def tokens():
+        for token in ["Hi", " there"]:
+            yield token
+
+    async def run():
+        async with streaming_engine(tokens, llm_timeout=1) as engine:
+            return [event async for event in engine.stream("q")]
+
+    events = asyncio.run(run())
+    assert [event["event"] for event in events] == ["documents", "token", "token", "answer"]
+    assert events[-1]["answer"] == "Hi there"
+    assert "ttft" in events[-1]["timings_ms"]
+
+
+def test_engine_stream_times_out_on_stalled_tokens():
+    # LLM timeout'u akışın tamamına uygulanır; token'lar durursa StageTimeout yükselir
+    async def tokens():
+        yield "partial"
+        await asyncio.sleep(10)
+        yield "late"
+
+    async def run():
+        events = []
+        async with streaming_engine(tokens, llm_timeout=0.1) as engine:
+            with pytest.raises(StageTimeout) as raised:
+                async for event in engine.stream("q"):
+                    events.append(event)
+        return events, raised.value
+
+    events, error = asyncio.run(run())
+    assert error.stage == "llm"
+    assert [event["event"] for event in events] == ["documents", "token"]
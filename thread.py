@@ -2,7 +2,7 @@ import threading
 import time
 import queue
 from faker import Faker
-from connect_db import create_connection
+from connect_db import get_pool
 from random import choice, randint
 from datetime import datetime, timedelta
 import logging
@@ -16,10 +16,10 @@ class UpdateData:
         self.logger = logging.getLogger("UpdateData")
         self.fake = Faker()
         try:
-            self.connection = create_connection()
-            self.cursor = self.connection.cursor()
+            # Her thread havuzdan kendi bağlantısını alır, cursor paylaşılmaz
+            self.pool = get_pool()
             self.order_queue = queue.Queue()
-            self.logger.info("Database connection and queue initialized successfully")
+            self.logger.info("Database connection pool and queue initialized successfully")
         except Exception as e:
             self.logger.error(f"Initialization error: {e}")
             raise
@@ -29,24 +29,26 @@ class UpdateData:
         thread_logger = logging.getLogger('UserGenerator')
         thread_logger.info("User generation thread started")
         try:
-            while True:
-                name = self.fake.name()
-                self.cursor.execute(
-                        "INSERT INTO users (user_name) VALUES (%s) RETURNING user_id",
-                        (name, )
-                    )
-                result = self.cursor.fetchone()
-                print(result)
-                if result is None:
-                    thread_logger.error("Failed to insert user - no ID returned")
-                    continue
-
-                user_id = result[0]
-                self.connection.commit()
-                
-                thread_logger.info(f"New user created: {name} (ID: {user_id})")
-                time.sleep(randint(1,5))
-                #self.order_queue.put(user_id)
+            with self.pool.connection() as connection:
+                cursor = connection.cursor()
+                while True:
+                    name = self.fake.name()
+                    cursor.execute(
+                            "INSERT INTO users (user_name) VALUES (%s) RETURNING user_id",
+                            (name, )
+                        )
+                    result = cursor.fetchone()
+                    print(result)
+                    if result is None:
+                        thread_logger.error("Failed to insert user - no ID returned")
+                        continue
+
+                    user_id = result[0]
+                    connection.commit()
+                    
+                    thread_logger.info(f"New user created: {name} (ID: {user_id})")
+                    time.sleep(randint(1,5))
+                    #self.order_queue.put(user_id)
         except Exception as e:
             print(f"Error in generate_user: {e}")
             thread_logger.error(f"Error in generate_user: {e}")
@@ -55,63 +57,68 @@ class UpdateData:
         thread_logger = logging.getLogger('OrderGenerator')
         thread_logger.info("order generation thread started")
 
-        while True:
-            try:
-                # Rastgele bir kullanıcı seç
-                self.cursor.execute(
-                    "SELECT user_id FROM users ORDER BY RANDOM() LIMIT 1"
-                )
-                user_result = self.cursor.fetchone()
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            while True:
+                try:
+                    # Rastgele bir kullanıcı seç
+                    cursor.execute(
+                        "SELECT user_id FROM users ORDER BY RANDOM() LIMIT 1"
+                    )
+                    user_result = cursor.fetchone()
                 
-                if user_result:
-                    user_id = user_result[0]
-                    product_count = randint(1, 5)
-                    # Rastgele bir ürün seç
-                    self.cursor.execute(
-                        "SELECT product_id FROM products ORDER BY RANDOM() LIMIT %s",
-                    (product_count,)
-                )
-                    product_results = self.cursor.fetchall()
+                    if user_result:
+                        user_id = user_result[0]
+                        product_count = randint(1, 5)
+                        # Rastgele bir ürün seç
+                        cursor.execute(
+                            "SELECT product_id FROM products ORDER BY RANDOM() LIMIT %s",
+                        (product_count,)
+                    )
+                        product_results = cursor.fetchall()
                     
-                    if product_results:
-                        selected_product_ids = [product[0] for product in product_results]
+                        if product_results:
+                            selected_product_ids = [product[0] for product in product_results]
                         
-                        order_ids = []
-                        # Siparişi ekle
-                        for product_id in selected_product_ids:
-                            self.cursor.execute(
-                                "INSERT INTO orders (user_id, product_id, order_date) VALUES (%s, %s, %s) RETURNING order_id",
-                                (user_id, product_id, datetime.now())
-                            )
-                            order_ids.append(self.cursor.fetchone()[0])
-                        self.connection.commit()
-                        thread_logger.info(
-                            f"New order created: User ID {user_id}, "
-                            f"Product count: {product_count}, "
-                            f"Order IDs: {order_ids}")
+                            order_ids = []
+                            # Siparişi ekle
+                            for product_id in selected_product_ids:
+                                cursor.execute(
+                                    "INSERT INTO orders (user_id, product_id, order_date) VALUES (%s, %s, %s) RETURNING order_id",
+                                    (user_id, product_id, datetime.now())
+                                )
+                                order_ids.append(cursor.fetchone()[0])
+                            connection.commit()
+                            thread_logger.info(
+                                f"New order created: User ID {user_id}, "
+                                f"Product count: {product_count}, "
+                                f"Order IDs: {order_ids}")
+                        else:
+                            thread_logger.warning("no products found in databse")
                     else:
-                        thread_logger.warning("no products found in databse")
-                else:
-                    thread_logger.warning("no user found in databse")
+                        thread_logger.warning("no user found in databse")
                     
-                time.sleep(randint(3, 5))  # Sipariş ekleme süresi
-            except Exception as e:
-                thread_logger.error(f"Error inserting order: {e}")
+                    time.sleep(randint(3, 5))  # Sipariş ekleme süresi
+                except Exception as e:
+                    connection.rollback()
+                    thread_logger.error(f"Error inserting order: {e}")
 
     def delete_outed_records(self):
         thread_logger = logging.getLogger('Cleaner')
         thread_logger.info("record cleaning thread started")
         try:
-            while True:
-                self.cursor.execute(
-                    "DELETE FROM orders WHERE order_date < NOW() - INTERVAL '1 month' RETURNING order_id",
-                )
-                deleted_count = self.cursor.rowcount
-                self.connection.commit()
-                if deleted_count > 0:
-                    thread_logger.info(f"Deleted {deleted_count} old orders")
-                thread_logger.debug("Performed cleanup check")
-                time.sleep(10)
+            with self.pool.connection() as connection:
+                cursor = connection.cursor()
+                while True:
+                    cursor.execute(
+                        "DELETE FROM orders WHERE order_date < NOW() - INTERVAL '1 month' RETURNING order_id",
+                    )
+                    deleted_count = cursor.rowcount
+                    connection.commit()
+                    if deleted_count > 0:
+                        thread_logger.info(f"Deleted {deleted_count} old orders")
+                    thread_logger.debug("Performed cleanup check")
+                    time.sleep(10)
         except Exception as e:
             thread_logger.error(f"error deleting old orders: {e}")
 
@@ -135,8 +142,8 @@ class UpdateData:
         except Exception as e:
             self.logger.error(f"Error in thread management: {e}")
         finally:
-            self.logger.info("Closing database connection")
-            self.connection.close()
+            self.logger.info("Closing database connection pool")
+            self.pool.closeall()
             self.logger.info("Program terminated")
 
 if __name__ == "__main__":
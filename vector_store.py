@@ -0,0 +1,578 @@
+import json
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore as LangChainVectorStore
+
+
+DEFAULT_BACKEND = "pinecone"
+# Ingestion, sync ve sorgu tarafı aynı index/namespace'e aynı modelle yazar ve okur
+INDEX_NAME = "ecommerce-2"
+NAMESPACE = "ecommerce-22"
+EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"
+EMBEDDING_DIMENSION = 768
+FETCH_BATCH_SIZE = 1000
+DEFAULT_LOCAL_DIR = "local_index"
+INITIAL_CAPACITY = 1024
+# Journal bu kadar kaydı (ve canlı vektör sayısını) aşınca meta.json snapshot'ı yenilenir
+JOURNAL_CHECKPOINT_MIN = 10000
+# Ölü satır oranı bunu aşınca snapshot sırasında vektör dosyası sıkıştırılır
+COMPACT_RATIO = 0.2
+
+
+def vector_backend():
+    # pinecone | local (exact, NumPy) | ann (IVF-PQ, ann_index.py)
+    return os.getenv("VECTOR_BACKEND", DEFAULT_BACKEND).lower()
+
+
+def uses_pinecone():
+    return vector_backend() == "pinecone"
+
+
+class AttrDict(dict):
+    # Pinecone cevapları gibi hem `result.matches` hem `result['matches']` ile okunur
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class VectorStore(ABC):
+    """Ingestion ve sorgu tarafının kullandığı ortak index arayüzü.
+
+    Metot imzaları Pinecone `Index` ile aynıdır, böylece mevcut kod (ve
+    ConcurrentUpserter) backend'den bağımsız çalışır.
+    """
+
+    @abstractmethod
+    def upsert(self, vectors, namespace=""):
+        ...
+
+    @abstractmethod
+    def delete(self, ids, namespace=""):
+        ...
+
+    @abstractmethod
+    def query(self, vector, top_k, include_metadata=True, namespace="", filter=None, ids=None):
+        # ids verilirse yalnızca bu dokümanlar skorlanır (metadata ön filtresi)
+        ...
+
+    @abstractmethod
+    def describe_index_stats(self):
+        ...
+
+    def flush(self):
+        # Yerel backend'ler değişiklikleri burada kalıcı yapar; Pinecone için gerekmez.
+        # Dönünce yazılanlar diskte olmalıdır: çağıranlar ardından işlenmiş olarak commit eder
+        pass
+
+    def maybe_flush(self):
+        # Dayanıklılık gerekmeyen yerler için; pahalı kaydı seyrekleştiren backend'ler override eder
+        self.flush()
+
+
+class PineconeBackend(VectorStore):
+
+    def __init__(self, index):
+        self.index = index
+
+    def upsert(self, vectors, namespace=""):
+        return self.index.upsert(vectors=vectors, namespace=namespace)
+
+    def delete(self, ids, namespace=""):
+        return self.index.delete(ids=ids, namespace=namespace)
+
+    def query(self, vector, top_k, include_metadata=True, namespace="", filter=None, ids=None):
+        if ids is not None:
+            return self._query_ids(vector, top_k, include_metadata, namespace, ids)
+        kwargs = {"filter": filter} if filter else {}
+        return self.index.query(
+            vector=vector, top_k=top_k, include_metadata=include_metadata, namespace=namespace, **kwargs
+        )
+
+    def _query_ids(self, vector, top_k, include_metadata, namespace, ids):
+        # Aday kümesi belli: vektörler fetch edilip istemcide skorlanır, ANN araması yapılmaz
+        fetched_ids, values, metadata = [], [], []
+        for start in range(0, len(ids), FETCH_BATCH_SIZE):
+            response = self.index.fetch(ids=list(ids[start:start + FETCH_BATCH_SIZE]), namespace=namespace)
+            for doc_id, item in response.vectors.items():
+                fetched_ids.append(doc_id)
+                values.append(item.values)
+                metadata.append(item.metadata)
+        if not fetched_ids:
+            return AttrDict(matches=[], namespace=namespace)
+
+        matrix = np.asarray(values, dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        query = np.asarray(vector, dtype=np.float32)
+        scores = matrix @ (query / max(np.linalg.norm(query), 1e-12))
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return AttrDict(namespace=namespace, matches=[
+            {"id": fetched_ids[i], "score": float(scores[i]), "metadata": metadata[i] if include_metadata else None}
+            for i in top
+        ])
+
+    def describe_index_stats(self):
+        return self.index.describe_index_stats()
+
+
+def _write_json(path, data):
+    # Önce geçici dosyaya yazılıp fsync edilir, sonra os.replace ile atomik olarak değiştirilir
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class LocalNamespace:
+    """Tek bir namespace: normalize edilmiş vektörler memory-mapped bir .npy dosyasında,
+    id -> satır eşlemesi ve metadata bir JSON snapshot (meta.json) ile append-only
+    bir journal'da tutulur.
+
+    Diskte kalıcı olan satırlar yerinde değiştirilmez: upsert her zaman yeni bir
+    satıra yazar, delete satırı ölü işaretler. `flush` önce matrisi diske yazar,
+    sonra değişiklikleri journal'a ekler; snapshot yalnızca journal büyüyünce (ya da
+    sıkıştırma gerekince) yenilenir. Flush'lar arasında çökülürse diskte son flush'taki
+    tutarlı durum kalır ve açılışta snapshot + journal'dan geri kurulur. Başka bir
+    process'in (ingestion/sync) flush'ları `refresh` ile okunur.
+    """
+
+    def __init__(self, path, dimension):
+        self.logger = logging.getLogger("LocalNamespace")
+        self.path = path
+        self.dimension = dimension
+        self.meta_path = os.path.join(path, "meta.json")
+        self.pending = []
+        os.makedirs(path, exist_ok=True)
+        if self._load():
+            # Yarım yazılmış son journal satırı: temiz bir snapshot ile journal sıfırlanır
+            self._checkpoint()
+
+    def _load(self):
+        # Snapshot + journal'dan durumu kurar; kesik bir son journal satırı varsa True döner
+        self.journal_entries = 0
+        self.journal_offset = 0
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            self.ids = meta["ids"]
+            self.metadata = meta["metadata"]
+            self.dimension = meta["dimension"]
+            self.generation = meta.get("generation", 0)
+            self._open_matrix(os.path.join(self.path, meta.get("vectors", "vectors.npy")))
+        else:
+            self.ids = []
+            self.metadata = []
+            self.generation = 0
+            self.vectors_path = os.path.join(self.path, "vectors-0.npy")
+            np.lib.format.open_memmap(
+                self.vectors_path, mode="w+", dtype=np.float32, shape=(INITIAL_CAPACITY, self.dimension)
+            ).flush()
+            self._open_matrix(self.vectors_path)
+        self.positions = {doc_id: i for i, doc_id in enumerate(self.ids) if doc_id is not None}
+        self.live = np.zeros(self.matrix.shape[0], dtype=bool)
+        self.live[list(self.positions.values())] = True
+        torn = self._replay()
+        self.meta_state = self._meta_state()
+        return torn
+
+    def _open_matrix(self, path):
+        self.vectors_path = path
+        self.matrix = np.load(path, mmap_mode="r+")
+        self.matrix_inode = os.stat(path).st_ino
+        if hasattr(self, "live") and self.live.shape[0] < self.matrix.shape[0]:
+            live = np.zeros(self.matrix.shape[0], dtype=bool)
+            live[:self.live.shape[0]] = self.live
+            self.live = live
+
+    def _meta_state(self):
+        try:
+            stat = os.stat(self.meta_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def refresh(self):
+        # Başka bir process'in flush'larını uygular: yeni snapshot varsa baştan yüklenir,
+        # yoksa journal'ın yalnızca son okunandan sonraki satırları replay edilir.
+        # Bekleyen yazısı olan (writer) process'te diskteki durum zaten kendi durumudur
+        if self.pending:
+            return
+        if self._meta_state() != self.meta_state:
+            self._load()
+            return
+        try:
+            size = os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            return
+        if size > self.journal_offset:
+            # Writer matrisi büyüttüyse dosya değişmiştir; journal satırları yeni satırlara işaret eder
+            if os.stat(self.vectors_path).st_ino != self.matrix_inode:
+                self._open_matrix(self.vectors_path)
+            self._replay()
+
+    @property
+    def journal_path(self):
+        return os.path.join(self.path, f"journal-{self.generation}.jsonl")
+
+    @property
+    def rows(self):
+        # Kullanılmış satır sayısı (ölüler dahil)
+        return len(self.ids)
+
+    @property
+    def count(self):
+        return len(self.positions)
+
+    def _replay(self):
+        # Snapshot'tan sonraki flush'ları journal_offset'ten itibaren uygular; kesik (ya da
+        # henüz yazılmakta olan) bir son satır varsa orada durur ve True döner
+        if not os.path.exists(self.journal_path):
+            return False
+        with open(self.journal_path, "rb") as f:
+            f.seek(self.journal_offset)
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete line")
+                    entry = json.loads(line)
+                except ValueError:
+                    self.logger.warning(f"Ignoring torn journal entry in {self.journal_path}")
+                    return True
+                self.journal_offset += len(line)
+                if entry["op"] == "put":
+                    row = entry["row"]
+                    while self.rows <= row:
+                        self.ids.append(None)
+                        self.metadata.append(None)
+                    self._kill(self.positions.get(entry["id"]))
+                    self.ids[row] = entry["id"]
+                    self.metadata[row] = entry["metadata"]
+                    self.positions[entry["id"]] = row
+                    self.live[row] = True
+                else:
+                    self._kill(self.positions.pop(entry["id"], None))
+                self.journal_entries += 1
+        return False
+
+    def _kill(self, row):
+        if row is None:
+            return
+        self.ids[row] = None
+        self.metadata[row] = None
+        self.live[row] = False
+
+    def _grow(self, needed):
+        capacity = self.matrix.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        # Kalıcı satırlar aynı pozisyonlarda kopyalanır, dosya atomik olarak değiştirilir
+        old = self.matrix
+        tmp_path = self.vectors_path + ".tmp"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(capacity, self.dimension))
+        grown[:self.rows] = old[:self.rows]
+        grown.flush()
+        del old, grown
+        os.replace(tmp_path, self.vectors_path)
+        self._open_matrix(self.vectors_path)
+
+    def upsert(self, vectors):
+        # Aynı id batch'te birden çok kez geçerse son değer geçerlidir
+        items = {}
+        for item in vectors:
+            if isinstance(item, dict):
+                doc_id, vector, meta = item["id"], item["values"], item.get("metadata", {})
+            else:
+                doc_id, vector, meta = item
+            items[doc_id] = (vector, meta)
+        if not items:
+            return 0
+
+        matrix = np.asarray([vector for vector, _ in items.values()], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1, norms)
+
+        start = self.rows
+        self._grow(start + len(items))
+        self.matrix[start:start + len(items)] = matrix
+        for offset, (doc_id, (_, meta)) in enumerate(items.items()):
+            row = start + offset
+            self._kill(self.positions.get(doc_id))
+            self.ids.append(doc_id)
+            self.metadata.append(meta)
+            self.positions[doc_id] = row
+            self.live[row] = True
+            self.pending.append({"op": "put", "id": doc_id, "row": row, "metadata": meta})
+        return len(items)
+
+    def delete(self, ids):
+        for doc_id in ids:
+            row = self.positions.pop(doc_id, None)
+            if row is None:
+                continue
+            self._kill(row)
+            self.pending.append({"op": "delete", "id": doc_id})
+
+    def query(self, vector, top_k, include_metadata=True, candidates=None):
+        if self.count == 0:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        if candidates is None:
+            positions = np.flatnonzero(self.live[:self.rows])
+            scores = self.matrix[:self.rows] @ query
+            if positions.size != self.rows:
+                scores = scores[positions]
+        else:
+            positions = np.asarray(candidates, dtype=np.int64)
+            if positions.size == 0:
+                return []
+            scores = self.matrix[positions] @ query
+
+        k = min(top_k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {
+                "id": self.ids[positions[i]],
+                "score": float(scores[i]),
+                "metadata": self.metadata[positions[i]] if include_metadata else None,
+            }
+            for i in top
+        ]
+
+    def _compact(self):
+        # Canlı satırlar yeni nesil bir dosyaya taşınır; eski dosya snapshot değişene
+        # kadar diskte kalır, böylece çökmede eski snapshot hâlâ geçerlidir
+        keep = np.flatnonzero(self.live[:self.rows])
+        capacity = INITIAL_CAPACITY
+        while capacity < len(keep):
+            capacity *= 2
+        path = os.path.join(self.path, f"vectors-{self.generation + 1}.npy")
+        compacted = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(capacity, self.dimension))
+        compacted[:len(keep)] = self.matrix[keep]
+        compacted.flush()
+        del compacted
+
+        old_path = self.vectors_path
+        self.ids = [self.ids[i] for i in keep]
+        self.metadata = [self.metadata[i] for i in keep]
+        self.positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self.live = np.zeros(capacity, dtype=bool)
+        self.live[:len(keep)] = True
+        self._open_matrix(path)
+        return old_path
+
+    def _checkpoint(self):
+        old_vectors = None
+        if self.rows - self.count > COMPACT_RATIO * max(self.rows, 1):
+            old_vectors = self._compact()
+        self.matrix.flush()
+        old_journal = self.journal_path
+        self.generation += 1
+        _write_json(self.meta_path, {
+            "dimension": self.dimension,
+            "generation": self.generation,
+            "vectors": os.path.basename(self.vectors_path),
+            "ids": self.ids,
+            "metadata": self.metadata,
+        })
+        # Yeni snapshot yerinde; eski journal ve (sıkıştırıldıysa) eski vektör dosyası artık gereksiz
+        for path in (old_journal, old_vectors):
+            if path and os.path.exists(path):
+                os.remove(path)
+        self.journal_entries = 0
+        self.journal_offset = 0
+        self.meta_state = self._meta_state()
+
+    def flush(self):
+        if not self.pending and os.path.exists(self.meta_path):
+            return
+        # Journal'daki satırlar diske yazılmış vektörlere işaret etmeli: önce matris
+        self.matrix.flush()
+        if (not os.path.exists(self.meta_path)
+                or self.journal_entries + len(self.pending) > max(JOURNAL_CHECKPOINT_MIN, self.count)):
+            self._checkpoint()
+        else:
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                for entry in self.pending:
+                    f.write(json.dumps(entry, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+                self.journal_offset = f.tell()
+            self.journal_entries += len(self.pending)
+        self.pending = []
+
+
+class LocalVectorStore(VectorStore):
+    """Pinecone yerine kullanılabilen process içi index; küçük ve orta boy kataloglar
+    için ağ gecikmesi olmadan matris çarpımı ile tam (exact) top-k arama yapar."""
+
+    def __init__(self, index_name, dimension, root=None):
+        self.logger = logging.getLogger("LocalVectorStore")
+        self.root = os.path.join(root or os.getenv("LOCAL_INDEX_DIR", DEFAULT_LOCAL_DIR), index_name)
+        self.dimension = dimension
+        self.namespaces = {}
+        self.lock = threading.RLock()
+        if os.path.isdir(self.root):
+            for name in os.listdir(self.root):
+                if os.path.exists(os.path.join(self.root, name, "meta.json")):
+                    self._namespace(name)
+
+    def _namespace(self, namespace, create=True):
+        # create=False (okuma): diskte olmayan namespace için dosya oluşturulmaz, None döner
+        name = namespace or "__default__"
+        if name not in self.namespaces:
+            path = os.path.join(self.root, name)
+            if not create and not os.path.exists(os.path.join(path, "meta.json")):
+                return None
+            self.namespaces[name] = LocalNamespace(path, self.dimension)
+        return self.namespaces[name]
+
+    def upsert(self, vectors, namespace=""):
+        with self.lock:
+            count = self._namespace(namespace).upsert(vectors)
+        return {"upserted_count": count}
+
+    def delete(self, ids, namespace=""):
+        with self.lock:
+            self._namespace(namespace).delete(ids)
+        return {}
+
+    def query(self, vector, top_k, include_metadata=True, namespace="", filter=None, ids=None):
+        if filter:
+            self.logger.warning("Metadata filters are not supported by the local backend, use ids instead")
+        with self.lock:
+            store = self._namespace(namespace, create=False)
+            if store is None:
+                return AttrDict(matches=[], namespace=namespace)
+            store.refresh()
+            candidates = None
+            if ids is not None:
+                candidates = [store.positions[doc_id] for doc_id in ids if doc_id in store.positions]
+            matches = store.query(vector, top_k, include_metadata, candidates)
+        return AttrDict(matches=matches, namespace=namespace)
+
+    def describe_index_stats(self):
+        with self.lock:
+            namespaces = {name: {"vector_count": ns.count} for name, ns in self.namespaces.items()}
+        return AttrDict(
+            dimension=self.dimension,
+            namespaces=namespaces,
+            total_vector_count=sum(ns["vector_count"] for ns in namespaces.values()),
+        )
+
+    def flush(self):
+        with self.lock:
+            for namespace in self.namespaces.values():
+                namespace.flush()
+        self.logger.debug(f"Flushed local index to {self.root}")
+
+
+class LocalLangChainStore(LangChainVectorStore):
+    """LocalVectorStore'u LangChain VectorStore olarak sunar (PineconeVectorStore yerine).
+
+    PineconeVectorStore gibi doküman metnini metadata'da `text` anahtarıyla saklar.
+    `add_texts` diske yazmaz; çağıran taraf batch sonunda ya da kapanışta `flush` eder.
+    """
+
+    def __init__(self, store, embedding, namespace=""):
+        self.store = store
+        self.embedding = embedding
+        self.namespace = namespace
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [f"{m.get('user_id')}_{m.get('order_date')}" for m in metadatas]
+        vectors = self.embedding.embed_documents(texts)
+        self.store.upsert(
+            [(doc_id, vector, {**metadata, "text": text})
+             for doc_id, vector, metadata, text in zip(ids, vectors, metadatas, texts)],
+            namespace=self.namespace
+        )
+        return ids
+
+    def flush(self):
+        self.store.flush()
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, **kwargs)]
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4, **kwargs):
+        result = self.store.query(
+            vector=embedding, top_k=k, include_metadata=True, namespace=self.namespace
+        )
+        documents = []
+        for match in result.matches:
+            metadata = dict(match["metadata"] or {})
+            text = metadata.pop("text", "")
+            documents.append((Document(page_content=text, metadata=metadata), match["score"]))
+        return documents
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, index_name="ecommerce-2", namespace="",
+                   dimension=None, **kwargs):
+        dimension = dimension or len(embedding.embed_query("dimension probe"))
+        store = cls(local_vector_store(index_name, dimension), embedding, namespace)
+        store.add_texts(texts, metadatas, **kwargs)
+        store.flush()
+        return store
+
+
+def local_vector_store(index_name, dimension):
+    if vector_backend() == "ann":
+        from ann_index import ANNVectorStore
+        return ANNVectorStore(index_name, dimension)
+    return LocalVectorStore(index_name, dimension)
+
+
+def get_vector_store(index_name, dimension, pinecone_client=None):
+    # VECTOR_BACKEND=local/ann ise process içi index, değilse Pinecone index'i
+    if not uses_pinecone():
+        return local_vector_store(index_name, dimension)
+
+    if pinecone_client is None:
+        from pinecone import Pinecone
+        pinecone_client = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    return PineconeBackend(pinecone_client.Index(index_name))
+
+
+def get_langchain_vector_store(index_name, embedding, namespace, dimension=None, store=None):
+    # VECTOR_BACKEND=local/ann ise process içi index, değilse PineconeVectorStore;
+    # store verilirse (get_vector_store sonucu) yerel index yeniden açılmaz
+    if not uses_pinecone():
+        if not isinstance(store, VectorStore) or isinstance(store, PineconeBackend):
+            dimension = dimension or len(embedding.embed_query("dimension probe"))
+            store = local_vector_store(index_name, dimension)
+        return LocalLangChainStore(store, embedding, namespace)
+
+    from langchain_pinecone import PineconeVectorStore
+    return PineconeVectorStore(index_name=index_name, embedding=embedding, namespace=namespace)
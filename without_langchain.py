@@ -1,30 +1,111 @@
 from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone
 import os
 from dotenv import load_dotenv
 import openai
+from query_cache import QueryEmbeddingCache
+from answer_cache import SemanticAnswerCache, documents_key
+from vector_store import get_vector_store, uses_pinecone, AttrDict, INDEX_NAME, NAMESPACE, EMBEDDING_MODEL
+from metadata_index import MetadataIndex, DEFAULT_MAX_FILTERED_RESULTS, DEFAULT_FILTER_ID_LIMIT
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from reranker import get_reranker
+from order_documents import metadata_order_text
+from context_builder import ContextBuilder
+from async_engine import AsyncQueryEngine
+from streaming import TokenStream, AsyncTokenStream, openai_deltas, aopenai_deltas
 
 # Ortam değişkenlerini yükle
 load_dotenv()
 
-# Model ve Pinecone kurulumu
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pc.Index("ecommerce-2")
+# Model ve vector index kurulumu (VECTOR_BACKEND=local ise Pinecone yerine yerel index)
 openai.api_key = os.getenv("OPENAI_API_KEY")
-model = SentenceTransformer("sentence-transformers/all-mpnet-base-v2")
+model = SentenceTransformer(EMBEDDING_MODEL)
+index = get_vector_store(INDEX_NAME, model.get_sentence_embedding_dimension())
+query_cache = QueryEmbeddingCache()
+answer_cache = SemanticAnswerCache()
+metadata_index = MetadataIndex()
+keyword_index = BM25Index()
+context_builder = ContextBuilder()
+max_filtered_results = int(os.getenv("FILTER_MAX_RESULTS", DEFAULT_MAX_FILTERED_RESULTS))
+filter_id_limit = int(os.getenv("FILTER_ID_LIMIT", DEFAULT_FILTER_ID_LIMIT))
 
 
-def search(top_k, query ):
+def embed_query(query):
+    # Tekrarlanan sorular için model forward pass'i atlanır
+    return query_cache.get_or_compute(query, lambda q: model.encode(q).tolist())
+
+
+def embed_queries(queries):
+    # Async engine'in micro-batch'leri tek model.encode çağrısıyla encode edilir
+    return query_cache.get_or_compute_many(
+        queries, lambda texts: model.encode(texts, batch_size=len(texts)).tolist()
+    )
+
+
+def filter_candidates(query):
+    # Sorudaki ürün/renk/kategori/tarih/kullanıcı kısıtlarını (ids, filter) çiftine çevirir;
+    # kısıt yoksa (None, None) (filtresiz vektör araması). Pinecone'da id'ler fetch edilip
+    # istemcide skorlandığı için FILTER_ID_LIMIT'i aşan kümeler sunucu tarafı filtreyle aranır
+    constraints = metadata_index.parse(query)
+    if not constraints:
+        return None, None
+    limit = filter_id_limit + 1 if uses_pinecone() else None
+    ids = metadata_index.lookup(constraints, limit=limit)
+    if limit and len(ids) > filter_id_limit:
+        server_filter = metadata_index.pinecone_filter(constraints)
+        if server_filter is not None:
+            print(f"Metadata filter {constraints} matched over {filter_id_limit} documents, filtering server-side")
+            return None, server_filter
+        ids = metadata_index.lookup(constraints)
+    print(f"Metadata filter {constraints} matched {len(ids)} documents")
+    return ids, None
+
+
+def hybrid_query(top_k, query, query_vector, candidates=None):
+    # Dense ve BM25 sıralamaları reciprocal rank fusion ile birleştirilir;
+    # yalnızca BM25'in bulduğu dokümanların metadata'sı ids ile vector store'dan alınır
+    candidates = candidates or max(top_k, 100)
+    dense = index.query(
+        vector=query_vector, top_k=candidates, include_metadata=True, namespace=NAMESPACE
+    ).matches
+    sparse = [doc_id for doc_id, _ in keyword_index.search(query, candidates)]
+    matches = {doc['id']: doc for doc in dense}
+    missing = [doc_id for doc_id in sparse if doc_id not in matches]
+    if missing:
+        for doc in index.query(
+            vector=query_vector, top_k=len(missing), include_metadata=True, namespace=NAMESPACE, ids=missing
+        ).matches:
+            matches[doc['id']] = doc
+
+    fused = reciprocal_rank_fusion([[doc['id'] for doc in dense], sparse])
+    return AttrDict(matches=[
+        {'id': doc_id, 'metadata': matches[doc_id]['metadata'], 'score': score}
+        for doc_id, score in fused if doc_id in matches
+    ][:top_k])
+
+
+def search(top_k, query, use_filters=True, hybrid=False, query_vector=None):
     
-    query_vector = model.encode(query).tolist()
+    query_vector = query_vector if query_vector is not None else embed_query(query)
     try:
-        docs = index.query(
-            vector=query_vector,
-            top_k=top_k, 
-            include_metadata=True,
-            namespace="e-commerce2",
-            # filter= {"user_name":{"$eq":"Dana Smith"}}
-        )
+        candidate_ids, metadata_filter = filter_candidates(query) if use_filters else (None, None)
+        if candidate_ids is not None:
+            if not candidate_ids:
+                return []
+            # Tam eşleşen kümenin hepsi döner (üst sınır FILTER_MAX_RESULTS), sadece adaylar skorlanır
+            top_k = min(len(candidate_ids), max_filtered_results)
+        elif metadata_filter is not None:
+            top_k = max_filtered_results
+        if hybrid and candidate_ids is None and metadata_filter is None:
+            docs = hybrid_query(top_k, query, query_vector)
+        else:
+            docs = index.query(
+                vector=query_vector,
+                top_k=top_k, 
+                include_metadata=True,
+                namespace=NAMESPACE,
+                filter=metadata_filter,
+                ids=candidate_ids,
+            )
         matched_count = len(docs.matches)
         print(matched_count)
         retrieved_docs = []
@@ -32,6 +113,7 @@ def search(top_k, query ):
                 metadata = doc['metadata']
                 score = doc['score']  
                 retrieved_docs.append({
+                    'id': doc['id'],
                     'metadata': metadata,
                     'score': score
                 })
@@ -46,6 +128,11 @@ def search(top_k, query ):
         debug_index()
         return []
 
+def query_cache_stats():
+    stats = query_cache.stats()
+    print("Query Cache:", stats)
+    return stats
+
 def debug_index():
     """Index durumunu kontrol eder"""
     stats = index.describe_index_stats()
@@ -53,15 +140,9 @@ def debug_index():
     return stats
 
 def prompt_context_builder(query, docs):
-    delim = '\n\n---\n\n'
-    context = delim.join([
-        f"User ID: {doc['metadata'].get('user_id')}, "
-        f"User Name: {doc['metadata'].get('user_name')}, "
-        f"Order Date: {doc['metadata'].get('order_date')}, "
-        f"Products: {', '.join(doc['metadata'].get('products', []))}, "
-        f"Categories: {', '.join(doc['metadata'].get('categories', []))}"
-        for doc in docs
-    ])
+    # Tekrarlar atılır, siparişler kullanıcı başına tablo halinde ve CONTEXT_MAX_TOKENS bütçesiyle yazılır
+    context, stats = context_builder.build(doc['metadata'] for doc in docs)
+    print(f"Context: {stats}")
     prompt_start = f"Context:\n{context}\n\n"
     prompt_end = f"Question: {query}\nAnswer: Please analyze the e-commerce data and provide a clear answer."
     return prompt_start + prompt_end
@@ -83,29 +164,164 @@ def question_answering(prompt, chat_model):
     return answer
 
 
-def analyze_logs(query, top_k=100):
+async def aquestion_answering(prompt, chat_model):
+    sys_prompt = "You are a helpful assistant that always answers questions."
+
+    # Event loop'u bloklamayan async API çağrısı
+    res = await openai.ChatCompletion.acreate(
+        model=chat_model,
+        messages=[
+            {"role": "system", "content": sys_prompt},
+            {"role": "user", "content": prompt}
+        ]
+    )
+    return res['choices'][0]['message']['content'].strip()
+
+
+def stream_question_answering(prompt, chat_model, client=None, on_complete=None):
+    # Token'lar geldikçe verilir; client testlerde sahte bir ChatCompletion olabilir
+    client = client or openai.ChatCompletion
+    sys_prompt = "You are a helpful assistant that always answers questions."
+    stream = TokenStream(None, on_complete=on_complete)
+    stream.tokens = openai_deltas(client.create(
+        model=chat_model,
+        messages=[
+            {"role": "system", "content": sys_prompt},
+            {"role": "user", "content": prompt}
+        ],
+        stream=True
+    ))
+    return stream
+
+
+async def astream_question_answering(prompt, chat_model, client=None, on_complete=None):
+    client = client or openai.ChatCompletion
+    sys_prompt = "You are a helpful assistant that always answers questions."
+    stream = AsyncTokenStream(None, on_complete=on_complete)
+    stream.tokens = aopenai_deltas(await client.acreate(
+        model=chat_model,
+        messages=[
+            {"role": "system", "content": sys_prompt},
+            {"role": "user", "content": prompt}
+        ],
+        stream=True
+    ))
+    return stream
+
+
+def rerank_documents(query, documents):
+    # Metadata filtresiyle gelen tam eşleşme kümesi kırpılmaz; diğer sonuçlar
+    # cross-encoder ile yeniden sıralanıp ilk RERANK_TOP_N tanesi tutulur
+    if metadata_index.parse(query):
+        return documents
+    return get_reranker().rerank(query, documents, text=lambda doc: metadata_order_text(doc['metadata']))
+
+
+def analyze_logs(query, top_k=100, llm=question_answering, use_cache=True, hybrid=False, rerank=False,
+                 stream=False, stream_llm=stream_question_answering):
+    # llm: (prompt, chat_model) -> cevap; testlerde sahte bir fonksiyon verilebilir.
+    # stream=True ise TokenStream döner (stream_llm: (prompt, chat_model, on_complete) -> TokenStream)
     documents = search(
         query=query,
         top_k=top_k,
+        hybrid=hybrid,
     )
     
     if not documents:
-        return "No relevant data found for the query."
+        answer = "No relevant data found for the query."
+        return TokenStream.of(answer) if stream else answer
+
+    if rerank:
+        documents = rerank_documents(query, documents)
+
+    if use_cache:
+        # Aynı dokümanlarla cevaplanmış yakın bir soru varsa LLM çağrılmaz
+        cached_answer, query_vector, doc_key = lookup_answer(query, documents)
+        if cached_answer is not None:
+            return TokenStream.of(cached_answer) if stream else cached_answer
 
     prompt_with_context = prompt_context_builder(query, documents)
+
+    if stream:
+        # Cevap cache'e ancak akış tamamlanınca yazılır
+        on_complete = None
+        if use_cache:
+            on_complete = lambda answer: answer_cache.store(
+                query_vector, doc_key, answer, ids=[doc['id'] for doc in documents]
+            )
+        return stream_llm(prompt=prompt_with_context, chat_model='gpt-4-turbo', on_complete=on_complete)
     
-    answer = question_answering(
+    answer = llm(
         prompt=prompt_with_context,
         chat_model='gpt-4-turbo'
     )
+
+    if use_cache:
+        answer_cache.store(query_vector, doc_key, answer, ids=[doc['id'] for doc in documents])
     
     return answer
 
-def queryy(input):
+def lookup_answer(query, documents):
+    # Ingestion/sync'in değiştirdiği dokümanlara dayanan cevaplar önce silinir
+    answer_cache.follow(metadata_index)
+    query_vector = embed_query(query)
+    doc_key = documents_key((doc['id'], doc['metadata']) for doc in documents)
+    return answer_cache.lookup(query_vector, doc_key), query_vector, doc_key
+
+
+def create_engine(top_k=100, llm=aquestion_answering, use_cache=True, hybrid=False, rerank=False,
+                  stream=False, stream_llm=astream_question_answering, **options):
+    # analyze_logs'un async karşılığı: embed (micro-batch) -> search (thread pool) -> LLM (async).
+    # stream=True ise cevap aşaması AsyncTokenStream döner; engine.stream() token olayları üretir.
+    # top_k/hybrid/rerank varsayılandır; engine.query(soru, top_k=...) ile istek başına değiştirilebilir
+    def search_stage(query, query_vector, top_k=top_k, hybrid=hybrid, rerank=rerank):
+        documents = search(top_k, query, hybrid=hybrid, query_vector=query_vector)
+        if documents and rerank:
+            documents = rerank_documents(query, documents)
+        return documents
+
+    async def answer_stage(query, documents):
+        if not documents:
+            answer = "No relevant data found for the query."
+            return AsyncTokenStream.of(answer) if stream else answer
+        if use_cache:
+            cached_answer, query_vector, doc_key = lookup_answer(query, documents)
+            if cached_answer is not None:
+                return AsyncTokenStream.of(cached_answer) if stream else cached_answer
+        if stream:
+            on_complete = None
+            if use_cache:
+                on_complete = lambda answer: answer_cache.store(
+                    query_vector, doc_key, answer, ids=[doc['id'] for doc in documents]
+                )
+            return await stream_llm(
+                prompt=prompt_context_builder(query, documents), chat_model='gpt-4-turbo', on_complete=on_complete
+            )
+        answer = await llm(prompt=prompt_context_builder(query, documents), chat_model='gpt-4-turbo')
+        if use_cache:
+            answer_cache.store(query_vector, doc_key, answer, ids=[doc['id'] for doc in documents])
+        return answer
+
+    return AsyncQueryEngine(embed_queries, search_stage, answer_stage, **options)
+
+
+engine = None
+
+
+async def aqueryy(input):
+    # Aynı event loop'ta çok sayıda eşzamanlı soru için: await asyncio.gather(*(aqueryy(q) for q in ...))
+    global engine
+    if engine is None:
+        engine = create_engine()
+    result = await engine.query(input)
+    return result["answer"]
+
+
+def queryy(input, stream=False):
     debug_index()
     query = "can you give me tha name of user who buy a Shampoo (Yellow)"
 
-    result = analyze_logs(input)
+    result = analyze_logs(input, stream=stream)
     return result
      
 if __name__ == "__main__":